@@ -1 +1,66 @@
 from .version import *
+
+# Submodules (and their heavier dependencies, like matplotlib,
+# ipywidgets, or the Gaia archive) are only imported when they
+# are first used, so headless tools like `ScriptWriter` start
+# quickly. `kosmoscraftroom.finder` or `kosmoscraftroom.Finder`
+# both work, and each loads just what it needs.
+_submodules = [
+    "astrometry",
+    "catalogs",
+    "comparisons",
+    "cosmics",
+    "finder",
+    "gaia",
+    "iplot",
+    "loupe",
+    "observability",
+    "psf",
+    "reader",
+    "scheduler",
+    "scripts",
+    "server",
+    "sky",
+    "spatial",
+    "stats",
+    "storage",
+    "timing",
+]
+
+# the most useful tools, and the submodules in which they live
+_lazy_names = dict(
+    ScriptWriter="scripts",
+    ScriptTimer="timing",
+    TUICatalog="catalogs",
+    Finder="finder",
+    FinderChart="finder",
+    make_finder_charts="finder",
+    GaiaStore="gaia",
+    find_comparison_stars="comparisons",
+    PlateSolution="astrometry",
+    fit_profiles="psf",
+    fit_cutouts="psf",
+    FITSReader="reader",
+    clean_cosmics="cosmics",
+    clean_stack="cosmics",
+    fit_sky="sky",
+    subtract_sky="sky",
+    measure_frame="stats",
+    NightTrends="stats",
+    Observability="observability",
+    Scheduler="scheduler",
+)
+
+
+def __getattr__(name):
+    from importlib import import_module
+
+    if name in _submodules:
+        return import_module(f".{name}", __name__)
+    if name in _lazy_names:
+        return getattr(import_module(f".{_lazy_names[name]}", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + _submodules + list(_lazy_names))
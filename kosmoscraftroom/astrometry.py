@@ -0,0 +1,469 @@
+"""
+Tools for plate solving acquisition images against Gaia, offline.
+
+Sources are detected in an image by thresholding and labeling
+connected pixels, and then centroided, all in a few vectorized
+calls. To match them to Gaia stars without knowing the pointing,
+rotation, scale, or parity of the image, we use geometric hashing:
+every triangle of bright stars is described by the ratios of its
+sorted side lengths, which don't change under any of those. Image
+triangles are matched to catalog triangles by a KD-tree search in
+that ratio space, each match votes for which image star is which
+catalog star, and the winning pairs are fit with an affine
+transformation onto the tangent plane. That becomes a TAN WCS.
+"""
+import itertools
+import numpy as np
+import astropy.units as u
+from astropy.table import Table
+from astropy.wcs import WCS
+from scipy import ndimage
+from scipy.spatial import cKDTree
+
+from .spatial import unit_vectors, tangent_plane
+
+
+def detect_sources(image, threshold=5.0, min_pixels=3, max_sources=None):
+    """
+    Find and centroid the sources in an image.
+
+    Parameters
+    ----------
+    image : array
+        The 2D image, indexed as [y, x].
+    threshold : float
+        How many times the noise above the background a
+        pixel must be to count as part of a source.
+    min_pixels : int
+        The fewest connected pixels that count as a source.
+    max_sources : int
+        Keep only this many of the brightest sources.
+
+    Returns
+    -------
+    sources : Table
+        The `x` and `y` centroids (in pixels), `flux` (above
+        the background), and number of `pixels` of each
+        source, brightest first.
+    """
+    image = np.asarray(image, dtype=np.float32)
+
+    # estimate the background and the noise robustly
+    background = np.median(image)
+    noise = 1.4826 * np.median(np.abs(image - background))
+    above = image - background
+    labels, N = ndimage.label(above > threshold * noise)
+    index = np.arange(1, N + 1)
+
+    # measure all sources at once
+    pixels = ndimage.sum_labels(np.ones_like(above), labels, index)
+    flux = ndimage.sum_labels(above, labels, index)
+    centroids = np.reshape(ndimage.center_of_mass(above, labels, index), (-1, 2))
+
+    ok = pixels >= min_pixels
+    order = np.argsort(-flux[ok], kind="stable")[:max_sources]
+    return Table(
+        dict(
+            x=centroids[ok, 1][order],
+            y=centroids[ok, 0][order],
+            flux=flux[ok][order],
+            pixels=pixels[ok][order].astype(int),
+        )
+    )
+
+
+def gnomonic_projection(ra, dec, center):
+    """
+    Project sky positions onto the plane tangent at some center.
+
+    Parameters
+    ----------
+    ra, dec : array
+        The positions, in degrees.
+    center : SkyCoord
+        The point of tangency.
+
+    Returns
+    -------
+    xi, eta : array
+        The gnomonic (standard) coordinates, in degrees,
+        with xi increasing to the east and eta to the north.
+    """
+    xyz = unit_vectors(ra, dec)
+    middle = unit_vectors(center.icrs.ra.deg, center.icrs.dec.deg)
+    east, north = tangent_plane(middle)
+    depth = xyz @ middle
+    return np.degrees(xyz @ east / depth), np.degrees(xyz @ north / depth)
+
+
+def triangle_invariants(x, y):
+    """
+    Describe every triangle of points by its shape alone.
+
+    Parameters
+    ----------
+    x, y : array
+        The positions of the points.
+
+    Returns
+    -------
+    invariants : array
+        For each triangle, the (shortest/longest, middle/longest)
+        ratios of its side lengths, with shape (triangles, 2).
+    vertices : array
+        For each triangle, the indices of its three points,
+        ordered by the length of the side opposite each one
+        (shortest first), with shape (triangles, 3).
+    size : array
+        The length of the longest side of each triangle.
+    """
+    triangles = np.array(list(itertools.combinations(range(len(x)), 3)), dtype=int)
+    if len(triangles) == 0:
+        return np.zeros((0, 2)), np.zeros((0, 3), dtype=int), np.zeros(0)
+    points = np.transpose([x, y])[triangles]
+
+    # the length of the side opposite each vertex
+    opposite = np.linalg.norm(points[:, [1, 2, 0]] - points[:, [2, 0, 1]], axis=2)
+    order = np.argsort(opposite, axis=1)
+    sides = np.take_along_axis(opposite, order, axis=1)
+    vertices = np.take_along_axis(triangles, order, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        invariants = sides[:, :2] / sides[:, 2:]
+    return invariants, vertices, sides[:, 2]
+
+
+def fit_affine(x, y, xi, eta):
+    """
+    Fit an affine transformation from (x, y) to (xi, eta) by least squares.
+
+    Returns
+    -------
+    matrix : array
+        The (2, 2) linear part.
+    offset : array
+        The (2,) offset, so (xi, eta) = matrix @ (x, y) + offset.
+    """
+    design = np.transpose([x, y, np.ones_like(x)])
+    coefficients, *_ = np.linalg.lstsq(design, np.transpose([xi, eta]), rcond=None)
+    return coefficients[:2].T, coefficients[2]
+
+
+class PlateSolution:
+    """
+    The astrometric solution for an image.
+    """
+
+    def __init__(self, matrix, offset, center, matches, shape=None):
+        """
+        Store the solution.
+
+        Parameters
+        ----------
+        matrix : array
+            The (2, 2) linear part of the pixel-to-tangent-plane
+            transformation, in degrees per pixel.
+        offset : array
+            The (2,) offset of that transformation, in degrees.
+        center : SkyCoord
+            The point of tangency.
+        matches : Table
+            The matched image sources and catalog stars.
+        shape : tuple
+            The shape of the image, for the WCS.
+        """
+        self.matrix = matrix
+        self.offset = offset
+        self.center = center
+        self.matches = matches
+        self.shape = shape
+
+        # the pixel (0-indexed) that lands on the point of tangency
+        reference = np.linalg.solve(matrix, -offset)
+        self.wcs = WCS(naxis=2)
+        self.wcs.wcs.ctype = ["RA---TAN", "DEC--TAN"]
+        self.wcs.wcs.crval = [center.icrs.ra.deg, center.icrs.dec.deg]
+        self.wcs.wcs.crpix = reference + 1
+        self.wcs.wcs.cd = matrix
+        if shape is not None:
+            self.wcs.pixel_shape = shape[::-1]
+
+    def __repr__(self):
+        return (
+            f"<PlateSolution with {len(self.matches)} matches, "
+            f"{self.pixel_scale:.3f}/pixel, rms={self.rms:.2f}>"
+        )
+
+    @property
+    def pixel_scale(self):
+        """
+        The average size of a pixel on the sky.
+        """
+        return (np.sqrt(np.abs(np.linalg.det(self.matrix))) * u.deg).to(u.arcsec)
+
+    @property
+    def rotation(self):
+        """
+        The angle of the image's +y axis east of north.
+        """
+        return np.degrees(np.arctan2(self.matrix[0, 1], self.matrix[1, 1])) * u.deg
+
+    @property
+    def flipped(self):
+        """
+        Is the image mirrored (east counterclockwise from north, on the sky)?
+        """
+        return bool(np.linalg.det(self.matrix) > 0)
+
+    @property
+    def rms(self):
+        """
+        The RMS residual of the matched stars.
+        """
+        return np.sqrt(np.mean(self.matches["residual"] ** 2)) * u.arcsec
+
+    def pixel_to_sky(self, x, y):
+        """
+        Convert pixel positions into sky coordinates.
+        """
+        return self.wcs.pixel_to_world(x, y)
+
+    def sky_to_pixel(self, coordinates):
+        """
+        Convert sky coordinates into pixel positions.
+        """
+        return self.wcs.world_to_pixel(coordinates)
+
+    def offset_to_slit(self, target, slit):
+        """
+        Calculate how to move the telescope to put a target on the slit.
+
+        Parameters
+        ----------
+        target : SkyCoord
+            The position of the target.
+        slit : tuple
+            The (x, y) pixel position of the slit center.
+
+        Returns
+        -------
+        offset : dict
+            The target's current `pixel` position, the pixel offset
+            `dx` and `dy` from the target to the slit, and the
+            offsets `dra` (times cos(dec)) and `ddec` on the sky
+            by which the telescope pointing should move.
+        """
+        x, y = self.sky_to_pixel(target)
+        here = self.pixel_to_sky(*slit)
+        dra, ddec = here.spherical_offsets_to(target)
+        return dict(
+            pixel=(float(x), float(y)),
+            dx=float(slit[0] - x),
+            dy=float(slit[1] - y),
+            dra=dra.to(u.arcsec),
+            ddec=ddec.to(u.arcsec),
+        )
+
+
+def solve(
+    sources,
+    stars,
+    image_shape=None,
+    pixel_scale=None,
+    scale_tolerance=0.05,
+    search_radius=None,
+    max_sources=25,
+    max_stars=40,
+    tolerance=0.005,
+    min_votes=2,
+    match_radius=3.0,
+    min_matches=6,
+    max_attempts=3,
+):
+    """
+    Match detected sources to Gaia stars, and find the WCS of the image.
+
+    Parameters
+    ----------
+    sources : Table, array
+        Detected sources (from `detect_sources`), or an
+        image in which to detect them.
+    stars : QTable
+        Gaia stars covering the image, such as `Finder.stars`,
+        with the approximate pointing as `.meta["center"]`.
+    image_shape : tuple
+        The shape of the image, if `sources` isn't one.
+    pixel_scale : Quantity
+        The approximate size of a pixel on the sky, if known.
+        Without it, the scale is found from the triangles.
+    scale_tolerance : float
+        The fractional uncertainty on the pixel scale.
+    search_radius : Quantity
+        Only stars within this distance of the center are used
+        for triangles. Default is all of them, unless both
+        `pixel_scale` and the image shape are known, in which
+        case it's the distance to the corners of the image.
+    max_sources : int
+        How many of the brightest sources to use for triangles.
+    max_stars : int
+        How many of the brightest stars to use for triangles.
+    tolerance : float
+        How close triangle shapes must be to match.
+    min_votes : int
+        The fewest triangle matches needed to pair a source
+        with a star.
+    match_radius : float
+        After the first fit, any source within this many pixels
+        of a star is matched to it for the final fit.
+    min_matches : int
+        The fewest matched stars for a solution to count.
+    max_attempts : int
+        Without a `pixel_scale`, how many of the most likely
+        scales (from the matched triangles) should be tried?
+
+    Returns
+    -------
+    solution : PlateSolution
+        The fitted solution (or None if no solution was found).
+    """
+    if not isinstance(sources, Table):
+        image_shape = np.shape(sources)
+        sources = detect_sources(sources)
+
+    center = stars.meta["center"]
+    ra = np.asarray(stars["ra"].to_value(u.deg))
+    dec = np.asarray(stars["dec"].to_value(u.deg))
+    xi, eta = gnomonic_projection(ra, dec, center)
+
+    # pick the brightest stars near enough the center
+    G = np.ma.filled(np.ma.asarray(stars["G_gaia_mag"].to_value("mag")), np.inf)
+    if (search_radius is None) and (pixel_scale is not None) and image_shape:
+        search_radius = 0.5 * np.hypot(*image_shape) * pixel_scale
+    if search_radius is not None:
+        G = np.where(
+            np.hypot(xi, eta) <= u.Quantity(search_radius).to_value(u.deg), G, np.inf
+        )
+    bright = np.argsort(G, kind="stable")[:max_stars]
+    bright = bright[np.isfinite(G[bright])]
+
+    # hash the triangles, and match image triangles to catalog ones
+    x, y = np.asarray(sources["x"]), np.asarray(sources["y"])
+    n = min(max_sources, len(x))
+    image_shapes, image_vertices, image_sizes = triangle_invariants(x[:n], y[:n])
+    star_shapes, star_vertices, star_sizes = triangle_invariants(
+        xi[bright], eta[bright]
+    )
+    ok = np.all(np.isfinite(star_shapes), axis=1)
+    star_shapes, star_vertices, star_sizes = (
+        star_shapes[ok],
+        star_vertices[ok],
+        star_sizes[ok],
+    )
+    if len(image_shapes) == 0 or len(star_shapes) == 0:
+        return None
+    found = cKDTree(star_shapes).query_ball_point(
+        np.nan_to_num(image_shapes, nan=np.inf), r=tolerance
+    )
+    lengths = np.array([len(f) for f in found])
+    if np.sum(lengths) == 0:
+        return None
+    matched = np.repeat(np.arange(len(found)), lengths)
+    which = np.concatenate([f for f in found if len(f) > 0]).astype(int)
+
+    # try the pixel scale we were told, or the most popular few
+    log_scale = np.log10(star_sizes[which] / image_sizes[matched])
+    width = np.log10(1 + scale_tolerance)
+    if pixel_scale is not None:
+        scales = [np.log10(u.Quantity(pixel_scale).to_value(u.deg))]
+    else:
+        bins = np.arange(np.min(log_scale), np.max(log_scale) + 2 * width, width)
+        counts, edges = np.histogram(log_scale, bins=bins)
+        counts = counts + np.roll(counts, 1) + np.roll(counts, -1)
+        peaks = np.argsort(-counts, kind="stable")[:max_attempts]
+        scales = edges[peaks] + 0.5 * width
+
+    # keep whichever attempt matches the most stars
+    best = None
+    for expected in scales:
+        consistent = np.abs(log_scale - expected) <= width
+        attempt = _fit_votes(
+            x,
+            y,
+            xi,
+            eta,
+            image_vertices[matched[consistent]],
+            bright[star_vertices[which[consistent]]],
+            n,
+            min_votes=min_votes,
+            match_radius=match_radius,
+        )
+        if (attempt is not None) and (best is None or len(attempt[0]) > len(best[0])):
+            best = attempt
+    if best is None or len(best[0]) < min_matches:
+        return None
+
+    i_source, i_star = best
+    matrix, offset = fit_affine(x[i_source], y[i_source], xi[i_star], eta[i_star])
+    predicted = np.transpose([x[i_source], y[i_source]]) @ matrix.T + offset
+    residual = np.hypot(*(predicted - np.transpose([xi[i_star], eta[i_star]])).T)
+    matches = Table(
+        dict(
+            source=i_source,
+            star=i_star,
+            x=x[i_source],
+            y=y[i_source],
+            ra=ra[i_star],
+            dec=dec[i_star],
+            residual=(residual * u.deg).to_value(u.arcsec),
+        )
+    )
+    return PlateSolution(matrix, offset, center, matches, shape=image_shape)
+
+
+def _fit_votes(
+    x, y, xi, eta, image_vertices, star_vertices, n, min_votes, match_radius
+):
+    """
+    Turn matched triangles into pairs of matched stars.
+
+    Every matched triangle votes for its three pairs of vertices,
+    the most popular pairs get fit with an affine transformation,
+    and then every source landing near a star gets paired with it.
+
+    Returns
+    -------
+    pairs : tuple
+        Indices of the matched (sources, stars), or None.
+    """
+    # let every matched triangle vote for its three pairs of vertices
+    votes = np.zeros((n, len(xi)), dtype=int)
+    np.add.at(votes, (image_vertices.ravel(), star_vertices.ravel()), 1)
+    best = np.argmax(votes, axis=1)
+    good = votes[np.arange(n), best] >= min_votes
+    if np.sum(good) < 3:
+        return None
+    i_source, i_star = np.nonzero(good)[0], best[good]
+
+    # fit, and iteratively reject pairs that don't agree
+    for _ in range(5):
+        matrix, offset = fit_affine(x[i_source], y[i_source], xi[i_star], eta[i_star])
+        predicted = np.transpose([x[i_source], y[i_source]]) @ matrix.T + offset
+        residual = np.hypot(*(predicted - np.transpose([xi[i_star], eta[i_star]])).T)
+        keep = residual <= max(3 * np.median(residual), 1e-9)
+        if np.all(keep) or np.sum(keep) < 3:
+            break
+        i_source, i_star = i_source[keep], i_star[keep]
+    if np.linalg.det(matrix) == 0:
+        return None
+
+    # pair up every source that lands near a star, and refit, twice
+    tree = cKDTree(np.transpose([xi, eta]))
+    for radius in [match_radius, match_radius / 2]:
+        scale = np.sqrt(np.abs(np.linalg.det(matrix)))
+        predicted = np.transpose([x, y]) @ matrix.T + offset
+        distance, nearest = tree.query(predicted, distance_upper_bound=radius * scale)
+        close = np.isfinite(distance)
+        if np.sum(close) < 3:
+            return None
+        i_source, i_star = np.nonzero(close)[0], nearest[close]
+        matrix, offset = fit_affine(x[i_source], y[i_source], xi[i_star], eta[i_star])
+    return i_source, i_star
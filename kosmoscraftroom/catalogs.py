@@ -1,9 +1,272 @@
-from astropy.table import Table, vstack, unique
-from astropy.coordinates import SkyCoord
+from astropy.table import Table, Column, MaskedColumn, vstack
+from astropy.coordinates import SkyCoord, Angle
 from astropy.io.ascii import read
 import astropy.units as u
 
 import numpy as np
+import os
+import time
+import hashlib
+
+from .storage import write_columns, read_columns, describe_columns, find_rows
+from .spatial import unit_vectors, friends_of_friends, SpatialIndex
+
+
+def find_survivors(names, ra, dec, G=None, tolerance=1 * u.arcsec, keep="first"):
+    """
+    Figure out which rows survive the removal of duplicates.
+
+    Parameters
+    ----------
+    names : array
+        The name of each target.
+    ra, dec : array
+        Coordinates of each target, in degrees.
+    G : array
+        Magnitude of each target (only needed for keep="brightest").
+    tolerance : Quantity
+        The angular separation within which two targets are
+        considered to be the same. None means only match by name.
+    keep : str
+        Which member of each group of duplicates to keep
+        ("first", "last", or "brightest").
+
+    Returns
+    -------
+    survivors : array
+        Sorted indices of the rows to keep.
+    """
+    N = len(names)
+
+    # link together any rows that share a name
+    _, first, inverse = np.unique(
+        np.asarray(names), return_index=True, return_inverse=True
+    )
+    labels = first[inverse]
+
+    # link together any rows that are close on the sky
+    if tolerance is not None:
+        duplicated = labels != np.arange(N)
+        same_name = np.transpose([np.nonzero(duplicated)[0], labels[duplicated]])
+        labels = friends_of_friends(
+            unit_vectors(ra, dec), tolerance, extra_pairs=same_name
+        )
+
+    # rank the members of each group, with the one to keep first
+    order = np.arange(N)
+    if keep == "first":
+        ranking = order
+    elif keep == "last":
+        ranking = -order
+    elif (keep == "brightest") and (G is not None):
+        ranking = np.ma.filled(np.ma.asarray(G, dtype=float), np.inf)
+    else:
+        raise ValueError('`keep` must be "first", "last", or "brightest" (with G).')
+    ranked = np.lexsort((order, ranking, labels))
+    _, first_in_group = np.unique(labels[ranked], return_index=True)
+    return np.sort(ranked[first_in_group])
+
+
+def _scatter_column(pieces, destinations, N):
+    """
+    Combine pieces of a column into one freshly allocated column.
+
+    Parameters
+    ----------
+    pieces : list
+        The column from each input table (or None, if missing).
+    destinations : list
+        For each piece, the output row of each of its rows
+        (or -1 for rows that should be dropped).
+    N : int
+        The number of rows in the output.
+
+    Returns
+    -------
+    column : Column or MaskedColumn
+        The combined column.
+    """
+    present = [p for p in pieces if p is not None]
+    unit = next((p.unit for p in present if getattr(p, "unit", None)), None)
+    dtype = np.result_type(*[np.asarray(p).dtype for p in present])
+    shape = np.shape(present[0])[1:]
+    masked = (len(present) < len(pieces)) or any(hasattr(p, "mask") for p in present)
+
+    values = np.zeros((N,) + shape, dtype=dtype)
+    mask = np.ones((N,) + shape, dtype=bool)
+    for p, d in zip(pieces, destinations):
+        if p is None:
+            continue
+        ok = d >= 0
+        if (unit is not None) and (getattr(p, "unit", None) not in (None, unit)):
+            p = np.ma.array(u.Quantity(p).to_value(unit), mask=np.ma.getmaskarray(p))
+        values[d[ok]] = np.ma.getdata(p)[ok]
+        mask[d[ok]] = np.ma.getmaskarray(p)[ok]
+
+    if masked:
+        return MaskedColumn(values, mask=mask, unit=unit, copy=False)
+    else:
+        return Column(values, unit=unit, copy=False)
+
+
+# where should slow-to-make catalogs be cached?
+cache_directory = os.path.join(os.path.expanduser("~"), ".kosmoscraftroom", "cache")
+
+
+def _exoatlas_key(pop, columns):
+    """
+    Make a label to identify an exoatlas population in the cache.
+
+    Populations are identified by a hash of the contents of the
+    columns that get converted, so different populations (like
+    two subsets with the same label and length) never collide.
+    Functions can't be identified without calling them, so they
+    return None (and shouldn't be cached without an explicit key).
+
+    Parameters
+    ----------
+    pop : Population, callable, str
+        See `TUICatalog.from_exoatlas`.
+    columns : list
+        The columns of `pop.standard` that get converted.
+    """
+    if isinstance(pop, str):
+        return f"file:{os.path.abspath(pop)}:{os.path.getmtime(pop)}"
+    if not hasattr(pop, "standard"):
+        return None
+    try:
+        from exoatlas import __version__ as version
+    except ImportError:
+        version = "?"
+    digest = hashlib.sha1()
+    for k in columns:
+        column = pop.standard[k]
+        digest.update(k.encode())
+        digest.update(np.ascontiguousarray(np.ma.getdata(column)).tobytes())
+        digest.update(np.ascontiguousarray(np.ma.getmaskarray(column)).tobytes())
+    return f"exoatlas-{version}:{type(pop).__name__}:{digest.hexdigest()}"
+
+
+class Criterion:
+    """
+    A lazily-evaluated condition on the columns of a catalog.
+
+    Criteria are usually made by comparing a column from `col`
+    to a value (like `col.G < 12`), and can be combined with
+    `&` (and), `|` (or), and `~` (not). Nothing is calculated
+    until `evaluate` is called with a way to get columns.
+    """
+
+    def __init__(self, function, description):
+        """
+        Parameters
+        ----------
+        function : callable
+            A function that takes a column-getter and returns a mask.
+        description : str
+            A human-readable description of this criterion.
+        """
+        self.function = function
+        self.description = description
+
+    def __repr__(self):
+        return f"<Criterion {self.description}>"
+
+    def evaluate(self, get_column):
+        """
+        Calculate the boolean mask for this criterion.
+
+        Parameters
+        ----------
+        get_column : callable
+            A function that takes a column name and returns that column.
+
+        Returns
+        -------
+        mask : array
+            True for rows that meet the criterion.
+        """
+        return self.function(get_column)
+
+    def __and__(self, other):
+        return Criterion(
+            lambda get: self.evaluate(get) & other.evaluate(get),
+            f"({self.description}) & ({other.description})",
+        )
+
+    def __or__(self, other):
+        return Criterion(
+            lambda get: self.evaluate(get) | other.evaluate(get),
+            f"({self.description}) | ({other.description})",
+        )
+
+    def __invert__(self):
+        return Criterion(lambda get: ~self.evaluate(get), f"~({self.description})")
+
+
+class ColumnReference:
+    """
+    A stand-in for a catalog column, for building Criteria.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"col.{self.name}"
+
+    def _compare(self, operator, symbol, value):
+        def function(get_column):
+            column = get_column(self.name)
+            unit = getattr(column, "unit", None)
+            if isinstance(value, u.Quantity) and (unit is not None):
+                threshold = value.to_value(unit)
+            else:
+                threshold = value
+            mask = operator(np.ma.getdata(column), threshold)
+            # masked (missing) values never meet a criterion
+            return np.asarray(mask) & ~np.ma.getmaskarray(column)
+
+        return Criterion(function, f"{self.name} {symbol} {value}")
+
+    def __lt__(self, value):
+        return self._compare(np.less, "<", value)
+
+    def __le__(self, value):
+        return self._compare(np.less_equal, "<=", value)
+
+    def __gt__(self, value):
+        return self._compare(np.greater, ">", value)
+
+    def __ge__(self, value):
+        return self._compare(np.greater_equal, ">=", value)
+
+    def __eq__(self, value):
+        return self._compare(np.equal, "==", value)
+
+    def __ne__(self, value):
+        return self._compare(np.not_equal, "!=", value)
+
+    def isin(self, values):
+        return self._compare(lambda a, b: np.isin(a, b), "in", list(values))
+
+
+class ColumnReferences:
+    """
+    Any attribute of this object is a reference to the column of that name.
+    """
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return ColumnReference(name)
+
+    def __getitem__(self, name):
+        return ColumnReference(name)
+
+
+# use like `catalog.where(col.G < 12, col.distance < 100)`
+col = ColumnReferences()
 
 
 class TUICatalog:
@@ -21,12 +284,240 @@ class TUICatalog:
         self.table = []
 
     def __repr__(self):
-        return f"<'{self.name}' TUICatalog ({len(self.table)} targets)>"
+        return f"<'{self.name}' TUICatalog ({len(self)} targets)>"
+
+    def __len__(self):
+        if self._rows is None:
+            return len(self._table)
+        return len(self._rows)
+
+    @property
+    def table(self):
+        """
+        The table of targets in this catalog.
+
+        Sub-catalogs made by `where`, `cone`, `box`, ... are views
+        that only store row indices into their parent's table;
+        the rows get copied into a table of their own only if
+        and when this attribute is needed.
+        """
+        if self._rows is not None:
+            self._table, self._rows = self._table[self._rows], None
+        return self._table
+
+    @table.setter
+    def table(self, value):
+        # any cached index or coordinates describe the old table, so forget them
+        self._table = value
+        self._rows = None
+        self._forget()
+
+    def _forget(self):
+        """
+        Forget anything cached about the current rows.
+        """
+        self._spatial_index = None
+        self._sky_coordinates = None
+
+    @property
+    def colnames(self):
+        return self._table.colnames
+
+    def _column(self, name):
+        """
+        Get one column for the current rows (without materializing a view).
+
+        Parameters
+        ----------
+        name : str
+            The name of the column.
+        """
+        if self._rows is None:
+            return self._table[name]
+        return self._table[name][self._rows]
+
+    def _iterrows(self):
+        """
+        Iterate over the current rows, as lightweight dictionaries.
+        """
+        names = self.colnames
+        columns = [list(self._column(k)) for k in names]
+        for values in zip(*columns):
+            yield dict(zip(names, values))
+
+    @property
+    def sky_coordinates(self):
+        """
+        The coordinates of all targets, as a SkyCoord.
+
+        Coordinates are stored in the table as plain float64
+        `ra` and `dec` columns (in degrees), so this SkyCoord
+        only gets created (and cached) when someone asks for it.
+        """
+        if self._sky_coordinates is None:
+            ra, dec = self._radec()
+            self._sky_coordinates = SkyCoord(ra=ra, dec=dec, unit="deg", frame="icrs")
+        return self._sky_coordinates
+
+    @property
+    def spatial_index(self):
+        """
+        A SpatialIndex of the targets, built on first use.
+
+        The index is cached until the table is replaced
+        (as happens in `from_table`, `sort`, `__add__`, ...).
+        """
+        if self._spatial_index is None:
+            self._spatial_index = SpatialIndex(*self._radec())
+        return self._spatial_index
+
+    def _subset(self, indices, name=None):
+        """
+        Make a new catalog out of a subset of rows.
+
+        Parameters
+        ----------
+        indices : array
+            The rows to include.
+        name : str
+            The name of the new catalog. Default is this one's.
+        """
+        new = TUICatalog(name or self.name)
+        new._table = self._table
+        new._rows = np.asarray(indices, dtype=int)
+        if self._rows is not None:
+            new._rows = self._rows[new._rows]
+        new._forget()
+        return new
+
+    def where(self, *criteria, name=None):
+        """
+        Select the targets that meet all of a set of criteria.
+
+        Criteria are built from the `col` object, like:
+        ```
+        nearby = catalog.where(col.G < 12, col.distance < 100, col.dec > -20)
+        either = catalog.where((col.G < 8) | (col.category == "standards"))
+        ```
+        All the criteria are combined into one boolean mask,
+        and the result is a view that shares this catalog's columns
+        (so nothing gets copied until it's needed). Views can be
+        chained with more `where` calls, `sort`, and exports.
+
+        Parameters
+        ----------
+        *criteria : Criterion
+            The criteria that targets must meet.
+        name : str
+            The name of the new catalog. Default is this one's.
+
+        Returns
+        -------
+        catalog : TUICatalog
+            A new catalog of only the targets that meet the criteria.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for c in criteria:
+            mask &= c.evaluate(self._column)
+        return self._subset(np.nonzero(mask)[0], name=name)
+
+    def cone(self, center, radius, name=None):
+        """
+        Find all targets within a radius of a sky position.
+
+        Parameters
+        ----------
+        center : SkyCoord
+            The center of the cone.
+        radius : Quantity
+            The radius of the cone (with units of angle).
+        name : str
+            The name of the new catalog. Default is this one's.
+
+        Returns
+        -------
+        catalog : TUICatalog
+            A new catalog containing only the targets in the cone.
+        """
+        center = center.icrs
+        indices = self.spatial_index.cone(center.ra.deg, center.dec.deg, radius)
+        return self._subset(indices, name=name)
+
+    def box(self, ra_range=(0, 360) * u.deg, dec_range=(-90, 90) * u.deg, name=None):
+        """
+        Find all targets within a window of RA and Dec.
+
+        Parameters
+        ----------
+        ra_range : Quantity
+            The (lower, upper) right ascension (with units of angle).
+            If lower > upper, the window wraps through 0h.
+        dec_range : Quantity
+            The (lower, upper) declination (with units of angle).
+        name : str
+            The name of the new catalog. Default is this one's.
+
+        Returns
+        -------
+        catalog : TUICatalog
+            A new catalog containing only the targets in the box.
+        """
+        indices = self.spatial_index.box(
+            ra_range=u.Quantity(ra_range).to_value(u.deg),
+            dec_range=u.Quantity(dec_range).to_value(u.deg),
+        )
+        return self._subset(indices, name=name)
+
+    def nearest(self, center, k=1, name=None):
+        """
+        Find the k targets nearest to a sky position.
+
+        Parameters
+        ----------
+        center : SkyCoord
+            The position to search around (for example,
+            the zenith at the current time).
+        k : int
+            The number of targets to return.
+        name : str
+            The name of the new catalog. Default is this one's.
+
+        Returns
+        -------
+        catalog : TUICatalog
+            A new catalog containing the nearest targets, closest first.
+        """
+        center = center.icrs
+        indices, _ = self.spatial_index.nearest(center.ra.deg, center.dec.deg, k=k)
+        return self._subset(indices, name=name)
 
     def from_table(self, table, remove_duplicates=True, sort=True):
         """
         Initialize from a table.
+
+        Parameters
+        ----------
+        table : Table
+            A table with a `names` column, and coordinates either
+            as a `sky_coordinates` SkyCoord column or as `ra`
+            and `dec` columns (in degrees).
+        remove_duplicates : bool
+            Should duplicate targets be removed?
+        sort : bool
+            Should the targets be sorted by RA?
         """
+        if "sky_coordinates" in table.colnames:
+            coordinates = table["sky_coordinates"].icrs
+            others = [
+                k for k in table.colnames if k not in ["names", "sky_coordinates"]
+            ]
+            table = Table(
+                [table["names"], coordinates.ra.deg, coordinates.dec.deg]
+                + [table[k] for k in others],
+                names=["names", "ra", "dec"] + others,
+                copy=False,
+            )
+            table["ra"].unit = table["dec"].unit = "deg"
         self.table = table
         if remove_duplicates:
             self.remove_duplicates()
@@ -38,43 +529,178 @@ class TUICatalog:
         table = Table(
             dict(
                 names=t["name"],
-                sky_coordinates=SkyCoord(
-                    ra=t["ra"],
-                    dec=t["dec"],
-                    unit=(u.hourangle, u.deg),  # TO-DO make sure this is more general!!
-                ),
+                # TO-DO make sure this is more general!!
+                ra=Angle(t["ra"], unit=u.hourangle).deg * u.deg,
+                dec=Angle(t["dec"], unit=u.deg).deg * u.deg,
                 category=[self.name for i in range(len(t))],
             )
         )
         self.from_table(table)
 
-    def from_exoatlas(self, pop):
+    def from_exoatlas(
+        self,
+        pop,
+        extra_columns=[],
+        cache=True,
+        max_age=7 * u.day,
+        key=None,
+    ):
         """
         Initialize from an exoplanet-atlas population.
+
+        Converted catalogs are cached on disk (see `cache_directory`),
+        so the next time the same population is requested, it can be
+        loaded in a fraction of a second without needing to build
+        the population (or download anything) at all.
+
+        Parameters
+        ----------
+        pop : Population, callable, str
+            An `exoatlas` population; a function that takes no
+            arguments and returns one (only called if the cache
+            can't be used, with an explicit `key`); or the filename of a local table with
+            the same columns as `pop.standard`, as an offline
+            stand-in for a real population.
+        extra_columns : list
+            Extra columns of `pop.standard` to include.
+        cache : bool
+            Should the converted catalog be read from and saved to
+            the cache?
+        max_age : Quantity
+            How old can a cached conversion be before it's rebuilt?
+        key : str
+            A label to identify this population in the cache.
+            Default is to make one from a hash of the contents of
+            the population's columns (or the filename and its
+            modification time), the version of `exoatlas`, and
+            the columns requested. Functions are only cached if
+            they're given a key, since they could return anything.
         """
-        self._exoatlas_pop = pop
+        columns = ["hostname", "ra", "dec", "gaiamag", "distance"] + list(extra_columns)
+        key = key or _exoatlas_key(pop, columns)
+        if key is None:
+            # (a function could return anything, so there's nothing safe to cache)
+            cache = False
+        key = f"{key}|{','.join(extra_columns)}"
+        path = os.path.join(
+            cache_directory, hashlib.sha1(key.encode()).hexdigest() + ".catalog"
+        )
+
+        # use the cached conversion, if it's fresh enough
+        if cache and os.path.exists(path):
+            meta = describe_columns(path)["meta"]
+            age = (time.time() - meta["created"]) * u.s
+            if (meta.get("key") == key) and (age < max_age):
+                table = read_columns(path)
+                table["category"] = self.name
+                self.table = table
+                return
+
+        # otherwise, convert the population from scratch
+        if isinstance(pop, str):
+            standard = Table.read(pop)
+        else:
+            if callable(pop):
+                pop = pop()
+            self._exoatlas_pop = pop
+            standard = pop.standard
         table = Table(
             dict(
-                names=pop.standard["hostname"],
-                sky_coordinates=SkyCoord(pop.standard["ra"], pop.standard["dec"]),
-                G=pop.standard["gaiamag"],
-                distance=pop.standard["distance"],
-                category=[self.name for i in range(len(pop.standard))],
+                names=standard["hostname"],
+                ra=u.Quantity(standard["ra"], u.deg),
+                dec=u.Quantity(standard["dec"], u.deg),
+                G=standard["gaiamag"],
+                distance=standard["distance"],
             )
         )
+        for k in extra_columns:
+            table[k] = standard[k]
+        table["category"] = self.name
         self.from_table(table)
 
-    def remove_duplicates(self):
-        self.table = unique(self.table, keys=["names"])
+        if cache:
+            to_cache = self.table.copy(copy_data=False)
+            to_cache.remove_column("category")
+            write_columns(path, to_cache, meta=dict(key=key, created=time.time()))
+
+    def remove_duplicates(self, tolerance=1 * u.arcsec, keep="first"):
+        """
+        Remove duplicate targets, by name and by position.
+
+        Rows with identical names are always treated as duplicates.
+        Rows closer together than `tolerance` on the sky are too,
+        so the same star listed as "WASP-39" and "WASP 39" (or
+        coming from two different input catalogs) only survives once.
+        Pairs are found with a KD-tree on 3D unit vectors, so this
+        scales to catalogs with millions of rows.
+
+        Parameters
+        ----------
+        tolerance : Quantity
+            The angular separation within which two targets are
+            considered to be the same. Set to None to only
+            remove duplicates by name.
+        keep : str
+            Which member of each group of duplicates to keep.
+            Options are "first" (the earliest row in the table),
+            "last" (the latest row in the table), or "brightest"
+            (the row with the smallest `G`). Default is "first".
+        """
+        if len(self.table) == 0:
+            return
+        ra, dec = self._radec()
+        G = self.table["G"] if "G" in self.table.colnames else None
+        survivors = find_survivors(
+            self.table["names"], ra, dec, G=G, tolerance=tolerance, keep=keep
+        )
+        self.table = self.table[survivors]
+
+    def _radec(self):
+        """
+        Get the right ascension and declination of every target.
+
+        Returns
+        -------
+        ra, dec : array
+            Coordinates, as plain float64 arrays in degrees.
+        """
+        return np.asarray(self._column("ra")), np.asarray(self._column("dec"))
 
     def sort(self):
-        self.table = self.table[np.argsort(self.table["sky_coordinates"].ra)]
+        """
+        Sort the targets by right ascension.
+
+        Returns
+        -------
+        catalog : TUICatalog
+            This catalog, so sorting can be chained.
+        """
+        order = np.argsort(self._radec()[0], kind="stable")
+        if self._rows is None:
+            self.table = self.table[order]
+        else:
+            self._rows = self._rows[order]
+            self._forget()
+        return self
 
-    def make_three_columns(self, row):
-        return f"""{row['names'].replace(' ', ''):<20} {row['sky_coordinates'].to_string('hmsdms', sep=':', precision=1)}"""
+    def _coordinate_strings(self):
+        """
+        Format all coordinates as sexagesimal strings, in one go.
+        """
+        return self.sky_coordinates.to_string("hmsdms", sep=":", precision=1)
+
+    def make_three_columns(self, row, coordinates=None):
+        if coordinates is None:
+            coordinates = SkyCoord(ra=row["ra"], dec=row["dec"], unit="deg").to_string(
+                "hmsdms", sep=":", precision=1
+            )
+        return f"""{row['names'].replace(' ', ''):<20} {coordinates}"""
 
     def make_tui_columns(self, row):
         keywords = []
+        # point the slit along a particular angle on the sky, if requested
+        if ("rotator_angle" in row) and np.isfinite(row["rotator_angle"]):
+            keywords += ["RotType=Object", f"RotAng={row['rotator_angle']:.2f}"]
         return "; ".join(keywords)
 
     def make_human_columns(self, row):
@@ -109,8 +735,8 @@ class TUICatalog:
             preamble = "CSys=ICRS; RotType=Object; RotAng=0"
 
         lines = [
-            f"""{self.make_three_columns(row)}   {self.make_tui_columns(row)}\n"""
-            for row in self.table
+            f"""{self.make_three_columns(row, c)}   {self.make_tui_columns(row)}\n"""
+            for row, c in zip(self._iterrows(), self._coordinate_strings())
         ]
 
         with open(filename, "w") as f:
@@ -134,8 +760,8 @@ class TUICatalog:
         """
         filename = f"{self.name}.txt"
         lines = [
-            f"""{self.make_three_columns(row)}   {self.make_human_columns(row)}\n"""
-            for row in self.table
+            f"""{self.make_three_columns(row, c)}   {self.make_human_columns(row)}\n"""
+            for row, c in zip(self._iterrows(), self._coordinate_strings())
         ]
 
         with open(filename, "w") as f:
@@ -146,16 +772,210 @@ class TUICatalog:
                 print(f.read())
 
         print(
-            f"Human-friendly catalog ({len(self.table)} targets) has been saved to {filename}"
+            f"Human-friendly catalog ({len(self)} targets) has been saved to {filename}"
         )
 
+    def save(self, path=None):
+        """
+        Save this catalog to a folder of binary columns.
+
+        Unlike the `to_TUI` text format, this keeps every column
+        (`G`, `distance`, `category`, ...) and stores coordinates
+        as float64 degrees, so nothing needs to be re-parsed
+        when it gets loaded again with `TUICatalog.load`.
+
+        Parameters
+        ----------
+        path : str
+            The folder to save into. Default is "{name}.catalog".
+        """
+        path = path or f"{self.name}.catalog"
+        is_sorted = bool(np.all(np.diff(self._radec()[0]) >= 0))
+        write_columns(
+            path, self.table, meta=dict(name=self.name, sorted_by_ra=is_sorted)
+        )
+        print(f"{self} has been saved to {path}")
+
+    @classmethod
+    def load(cls, path, columns=None, ra_range=None, mmap=True):
+        """
+        Load a catalog that was saved with `TUICatalog.save`.
+
+        Columns are memory-mapped, so loading is nearly instant,
+        and only the parts of the file that are used get read.
+
+        Parameters
+        ----------
+        path : str
+            The folder containing the saved catalog.
+        columns : list
+            Which extra columns to load, beyond the names
+            and coordinates that are always loaded.
+            Default is all of them.
+        ra_range : Quantity
+            The (lower, upper) right ascension of targets to load.
+            If lower > upper, the range wraps through 0h.
+            Default is to load all targets.
+        mmap : bool
+            Should columns be memory-mapped (True) or
+            read completely into memory (False)?
+
+        Returns
+        -------
+        catalog : TUICatalog
+            The loaded catalog.
+        """
+        description = describe_columns(path)
+        if columns is not None:
+            columns = ["names", "ra", "dec"] + [
+                k for k in columns if k not in ["names", "ra", "dec"]
+            ]
+
+        if ra_range is None:
+            table = read_columns(path, columns=columns, mmap=mmap)
+        else:
+            if not description["meta"]["sorted_by_ra"]:
+                raise ValueError(f"{path} isn't sorted by RA, so can't load a range.")
+            lower, upper = u.Quantity(ra_range).to_value(u.deg)
+            if (upper - lower) >= 360:
+                ranges = [(0, 360)]
+            elif (lower % 360) <= (upper % 360):
+                ranges = [(lower % 360, upper % 360)]
+            else:
+                ranges = [(lower % 360, 360), (0, upper % 360)]
+            table = vstack(
+                [
+                    read_columns(
+                        path,
+                        columns=columns,
+                        rows=find_rows(path, "ra", *r),
+                        mmap=mmap,
+                    )
+                    for r in ranges
+                ]
+            )
+
+        new = cls(description["meta"]["name"])
+        new.table = table
+        return new
+
     def __add__(self, other):
         """
         Merge two catalogs together.
         """
-        new = TUICatalog(f"{self.name}+{other.name}")
-        new.table = vstack([self.table, other.table])
-        new.sort()
+        return TUICatalog.merge(self, other)
+
+    @classmethod
+    def merge(
+        cls,
+        *catalogs,
+        name=None,
+        remove_duplicates=False,
+        tolerance=1 * u.arcsec,
+        keep="first",
+    ):
+        """
+        Merge any number of catalogs together, in one pass.
+
+        Each input catalog is (usually) already sorted by RA,
+        so the combined ordering is found with a stable merge
+        of those sorted runs rather than a fresh sort, and each
+        output column is allocated once and filled in place.
+        This is much cheaper than `a + b + c + ...`, which
+        would copy and re-sort the growing table at every step.
+
+        Parameters
+        ----------
+        *catalogs : TUICatalog
+            The catalogs to merge.
+        name : str
+            The name of the merged catalog. Default joins
+            the names of the inputs with "+".
+        remove_duplicates : bool
+            Should duplicates (see `remove_duplicates`) be
+            dropped while merging?
+        tolerance : Quantity
+            The angular separation within which two targets are
+            considered to be the same, if removing duplicates.
+        keep : str
+            Which duplicate to keep, if removing duplicates.
+            With "first", earlier catalogs take priority.
+
+        Returns
+        -------
+        merged : TUICatalog
+            A new catalog containing all the inputs, sorted by RA.
+        """
+        catalogs = [c for c in catalogs if len(c) > 0]
+        new = cls(name or "+".join(c.name for c in catalogs))
+        if len(catalogs) == 0:
+            return new
+
+        # line up each input's rows in RA order (free if already sorted)
+        radec = [c._radec() for c in catalogs]
+        orders = [np.argsort(ra, kind="stable") for ra, dec in radec]
+        ra = np.concatenate([ra[o] for (ra, dec), o in zip(radec, orders)])
+        dec = np.concatenate([dec[o] for (ra, dec), o in zip(radec, orders)])
+        lengths = [len(o) for o in orders]
+        offsets = np.cumsum([0] + lengths)
+
+        # a stable sort detects the presorted runs, so this is a k-way merge
+        merged = np.argsort(ra, kind="stable")
+
+        # optionally drop duplicates, before building any columns
+        if remove_duplicates:
+            names = np.concatenate(
+                [np.asarray(c.table["names"])[o] for c, o in zip(catalogs, orders)]
+            )
+            G = None
+            if keep == "brightest":
+                G = np.concatenate(
+                    [
+                        np.ma.filled(
+                            np.ma.asarray(c.table["G"], dtype=float)[o], np.inf
+                        )
+                        if "G" in c.table.colnames
+                        else np.full(len(o), np.inf)
+                        for c, o in zip(catalogs, orders)
+                    ]
+                )
+            survivors = find_survivors(
+                names, ra, dec, G=G, tolerance=tolerance, keep=keep
+            )
+            is_survivor = np.zeros(len(ra), dtype=bool)
+            is_survivor[survivors] = True
+            merged = merged[is_survivor[merged]]
+
+        # figure out where each input row lands in the output (-1 = dropped)
+        destination = np.full(len(ra), -1)
+        destination[merged] = np.arange(len(merged))
+        destinations = []
+        for i, o in enumerate(orders):
+            d = np.empty(lengths[i], dtype=int)
+            d[o] = destination[offsets[i] : offsets[i + 1]]
+            destinations.append(d)
+
+        # make sure every merged row remembers which catalog it came from
+        tables = []
+        for c in catalogs:
+            t = c.table
+            if "category" not in t.colnames:
+                t = Table(t, copy=False)
+                t["category"] = c.name
+            tables.append(t)
+
+        colnames = []
+        for t in tables:
+            colnames += [k for k in t.colnames if k not in colnames]
+
+        columns = {}
+        for k in colnames:
+            columns[k] = _scatter_column(
+                [t[k] if k in t.colnames else None for t in tables],
+                destinations,
+                len(merged),
+            )
+        new.table = Table(columns, copy=False)
         return new
 
 
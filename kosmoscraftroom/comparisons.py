@@ -0,0 +1,275 @@
+"""
+Tools for finding comparison stars to put on the slit with each target.
+
+For time-series spectrophotometry, the slit is rotated so a
+comparison star of similar brightness and color falls on it
+alongside the target. Candidates for each target come from a
+neighbor query on a spatial index of the Gaia field around it,
+so only stars within a slit length are ever considered. Each
+candidate is then scored by how well its magnitude and color
+match the target and by how isolated it is from contaminating
+neighbors, and the best one sets the slit center and rotation.
+"""
+import numpy as np
+import astropy.units as u
+from astropy.table import Table
+from astropy.time import Time
+from concurrent.futures import ProcessPoolExecutor
+
+from .spatial import (
+    SpatialIndex,
+    unit_vectors,
+    chord,
+    sky_positions,
+    tangent_plane,
+    slit_rotation,
+)
+from .catalogs import TUICatalog
+from .finder import gather_fields
+
+# the length of the KOSMOS slits
+slit_length = 6 * u.arcmin
+
+
+def _plain(column, unit):
+    """
+    Convert a (possibly masked) column into a plain float array, with NaN for masked.
+    """
+    return np.ma.filled(np.ma.asarray(u.Quantity(column).to_value(unit)), np.nan)
+
+
+def rank_comparisons(
+    stars,
+    ra,
+    dec,
+    max_separation=slit_length,
+    min_separation=10 * u.arcsec,
+    delta_magnitude=1.0,
+    delta_color=0.3,
+    isolation=5 * u.arcsec,
+    contrast=3.0,
+    match_radius=2 * u.arcsec,
+):
+    """
+    Rank the possible comparison stars for one target.
+
+    Parameters
+    ----------
+    stars : QTable
+        A table of Gaia stars around the target (like `get_gaia` returns).
+    ra : float
+        Right ascension of the target, in degrees.
+    dec : float
+        Declination of the target, in degrees.
+    max_separation : Quantity
+        The farthest a comparison star can be from the target
+        (so both fit on the slit). Default is the slit length.
+    min_separation : Quantity
+        The closest a comparison star can be to the target
+        (so their spectra don't blend).
+    delta_magnitude : float
+        The largest acceptable difference in G magnitude.
+    delta_color : float
+        The largest acceptable difference in BP-RP color.
+    isolation : Quantity
+        Any star within this distance of a comparison star
+        counts as a contaminant...
+    contrast : float
+        ...if it is no more than this many magnitudes fainter.
+    match_radius : Quantity
+        How close a Gaia star must be to the target's position
+        to be identified as the target itself.
+
+    Returns
+    -------
+    candidates : Table
+        The acceptable comparison stars, best first, with their
+        separations, differences from the target, numbers of
+        contaminants, scores (lower is better), and the slit
+        center and rotator angle that would put both on the slit.
+        The table is empty if the target can't be found in Gaia.
+    """
+    index = SpatialIndex(_plain(stars["ra"], u.deg), _plain(stars["dec"], u.deg))
+    G = _plain(stars["G_gaia_mag"], u.mag)
+    color = _plain(stars["BP_gaia_mag"], u.mag) - _plain(stars["RP_gaia_mag"], u.mag)
+
+    # identify the target itself in the Gaia field
+    candidates = Table(
+        dict(
+            index=np.zeros(0, int),
+            source_id=np.zeros(0, int),
+            separation=np.zeros(0) * u.arcsec,
+            G=np.zeros(0),
+            delta_magnitude=np.zeros(0),
+            delta_color=np.zeros(0),
+            contaminants=np.zeros(0, int),
+            score=np.zeros(0),
+            ra=np.zeros(0) * u.deg,
+            dec=np.zeros(0) * u.deg,
+            rotator_angle=np.zeros(0) * u.deg,
+        )
+    )
+    if len(index) == 0:
+        return candidates
+    nearest, distance = index.nearest(ra, dec, k=1)
+    if distance[0] > match_radius:
+        return candidates
+    target = nearest[0]
+
+    # find neighbors within a slit length, and apply the windows
+    neighbors = index.cone(ra, dec, max_separation)
+    separation = (
+        2
+        * np.arcsin(
+            np.linalg.norm(index.xyz[neighbors] - unit_vectors(ra, dec), axis=1) / 2
+        )
+        * u.radian
+    ).to(u.arcsec)
+    dG = G[neighbors] - G[target]
+    dcolor = color[neighbors] - color[target]
+    with np.errstate(invalid="ignore"):
+        ok = (
+            (neighbors != target)
+            & (separation >= min_separation)
+            & (np.abs(dG) <= delta_magnitude)
+            & (np.abs(dcolor) <= delta_color)
+        )
+    neighbors, separation, dG, dcolor = (
+        neighbors[ok],
+        separation[ok],
+        dG[ok],
+        dcolor[ok],
+    )
+
+    # count the contaminating stars around each candidate, in one batch
+    nearby = index.tree.query_ball_point(index.xyz[neighbors], chord(isolation))
+    contaminants = np.array(
+        [
+            np.sum((G[n] < G[c] + contrast) & (np.array(n) != c))
+            for c, n in zip(neighbors, nearby)
+        ],
+        dtype=int,
+    )
+
+    # score, preferring close matches in brightness and color, and isolation
+    score = (dG / delta_magnitude) ** 2 + (dcolor / delta_color) ** 2 + contaminants
+
+    # the slit goes through the midpoint, along the line from target to comparison
+    middle = index.xyz[neighbors] + index.xyz[target]
+    east, north = tangent_plane(middle)
+    step = index.xyz[neighbors] - index.xyz[target]
+    rotator_angle = slit_rotation(np.sum(step * east, -1), np.sum(step * north, -1))
+    middle_ra, middle_dec = sky_positions(middle)
+
+    order = np.argsort(score, kind="stable")
+    if "source_id" in stars.colnames:
+        source_id = np.asarray(stars["source_id"])[neighbors]
+    else:
+        source_id = neighbors
+    candidates = Table(
+        dict(
+            index=neighbors,
+            source_id=source_id,
+            separation=separation,
+            G=G[neighbors],
+            delta_magnitude=dG,
+            delta_color=dcolor,
+            contaminants=contaminants,
+            score=score,
+            ra=middle_ra * u.deg,
+            dec=middle_dec * u.deg,
+            rotator_angle=rotator_angle * u.deg,
+        )
+    )
+    return candidates[order]
+
+
+def _rank_field(job):
+    """
+    Rank comparisons for one field (in a worker process).
+    """
+    stars, ra, dec, criteria = job
+    return rank_comparisons(stars, ra, dec, **criteria)
+
+
+def find_comparison_stars(
+    catalog,
+    epoch="now",
+    store=None,
+    max_workers=None,
+    name=None,
+    **criteria,
+):
+    """
+    Find the best comparison star for every target in a catalog.
+
+    Parameters
+    ----------
+    catalog : TUICatalog
+        The catalog of targets.
+    epoch : float, str
+        The decimal year of the observations, or "now".
+    store : GaiaStore
+        The local store from which to get Gaia stars.
+        Default is the shared store.
+    max_workers : int
+        How many processes should rank comparisons? Default
+        is one per CPU. Use 1 to do everything in this process.
+    name : str
+        The name of the new catalog. Default is the
+        original's, with "-comparisons" appended.
+    **criteria : dict
+        Passed to `rank_comparisons` (for example, `delta_magnitude`).
+
+    Returns
+    -------
+    pointings : TUICatalog
+        A catalog with one row for each target that has an
+        acceptable comparison star, pointed at the center of
+        the pair and with a `rotator_angle` column, so
+        `.to_TUI()` produces ready-to-use slit alignments.
+    """
+    if isinstance(epoch, str) and (epoch == "now"):
+        epoch = Time.now().decimalyear
+    radius = criteria.get("max_separation", slit_length)
+    fields, groups = gather_fields(catalog, radius=radius, epoch=epoch, store=store)
+
+    names = [str(n) for n in catalog._column("names")]
+    ra, dec = catalog._radec()
+    order = sorted(fields)
+    jobs = [(fields[i], ra[i], dec[i], criteria) for i in order]
+    if max_workers == 1:
+        rankings = [_rank_field(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            rankings = list(executor.map(_rank_field, jobs, chunksize=8))
+
+    # keep the best comparison for each target
+    rows = [(i, r[0]) for i, r in zip(order, rankings) if len(r) > 0]
+    print(
+        f"Found comparison stars for {len(rows)} of {len(catalog)} targets in {catalog}."
+    )
+    table = Table(
+        dict(
+            names=[names[i] for i, _ in rows],
+            ra=[best["ra"] for _, best in rows],
+            dec=[best["dec"] for _, best in rows],
+            rotator_angle=[best["rotator_angle"] for _, best in rows],
+            target_ra=[ra[i] for i, _ in rows],
+            target_dec=[dec[i] for i, _ in rows],
+            comparison_source_id=np.array(
+                [best["source_id"] for _, best in rows], dtype=np.int64
+            ),
+            comparison_G=[best["G"] for _, best in rows],
+            comparison_separation=[best["separation"] for _, best in rows],
+            delta_magnitude=[best["delta_magnitude"] for _, best in rows],
+            delta_color=[best["delta_color"] for _, best in rows],
+        )
+    )
+    for k in ["ra", "dec", "rotator_angle", "target_ra", "target_dec"]:
+        table[k].unit = "deg"
+    table["comparison_separation"].unit = "arcsec"
+
+    pointings = TUICatalog(name or f"{catalog.name}-comparisons")
+    pointings.from_table(table, remove_duplicates=False, sort=False)
+    return pointings
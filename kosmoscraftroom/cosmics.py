@@ -0,0 +1,312 @@
+"""
+Tools for finding and removing cosmic rays from quicklook frames.
+
+For single frames, this follows L.A.Cosmic (van Dokkum 2001):
+cosmic rays have sharper edges than anything the atmosphere and
+optics can make, so they stand out in the (positive part of the)
+Laplacian of the image, relative to the expected noise. To avoid
+confusing them with the cores of stars or sky lines, candidates
+must also be much sharper than the image's "fine structure".
+Everything is built from whole-array operations and (separable)
+median filters, and big frames are split into overlapping chunks of
+rows that are cleaned in parallel by a pool of threads (so
+memory use stays bounded by the chunk size).
+
+For a time series of frames (like a transit observation), the
+stack mode is simpler and more sensitive: a pixel that suddenly
+jumps far above its own running median in time is a cosmic ray.
+"""
+import warnings
+import numpy as np
+from scipy import ndimage
+from concurrent.futures import ThreadPoolExecutor
+
+
+def laplacian_plus(image):
+    """
+    Calculate the positive part of the Laplacian of an image.
+
+    This gives the same answer as L.A.Cosmic's recipe of
+    subsampling each pixel into 2x2, convolving with a
+    Laplacian kernel, clipping negative values, and binning
+    back down, but without ever making the 4x larger image.
+    Each subpixel only sees the two neighbors on its own
+    side of the pixel, so the answer is the average over
+    the four quadrants of max(0, 2 * pixel - neighbor - neighbor).
+
+    Parameters
+    ----------
+    image : array
+        The image.
+
+    Returns
+    -------
+    laplacian : array
+        The positive part of the subsampled Laplacian.
+    """
+    padded = np.pad(image, 1, mode="edge")
+    up, down = padded[2:, 1:-1], padded[:-2, 1:-1]
+    left, right = padded[1:-1, :-2], padded[1:-1, 2:]
+    twice = 2 * image
+    total = np.zeros_like(image)
+    for a in [up, down]:
+        for b in [left, right]:
+            total += np.clip(twice - a - b, 0, None)
+    return total / 4
+
+
+def _median(image, size):
+    """
+    Apply a (separable) median filter, of rows and then of columns.
+
+    This is much faster than a full square median filter,
+    and close enough for smoothing the significance image
+    (but not for the noise around stars, or their shapes).
+    """
+    rows = ndimage.median_filter(image, size=(1, size), mode="nearest")
+    return ndimage.median_filter(rows, size=(size, 1), mode="nearest")
+
+
+def _fine_structure(image, y, x):
+    """
+    Calculate L.A.Cosmic's fine structure image, at just a few pixels.
+
+    This is median3(image) - median7(median3(image)), with full
+    square medians, but calculated only in the little 9x9 boxes
+    around the pixels that need it, rather than everywhere.
+    """
+    padded = np.pad(image, 4, mode="edge")
+    boxes = np.lib.stride_tricks.sliding_window_view(padded, (9, 9))[y, x]
+    median3 = np.median(
+        np.lib.stride_tricks.sliding_window_view(boxes, (3, 3), axis=(1, 2)).reshape(
+            len(y), 7, 7, 9
+        ),
+        axis=-1,
+    )
+    return median3[:, 3, 3] - np.median(median3.reshape(len(y), 49), axis=-1)
+
+
+def _replace(image, mask, size=5):
+    """
+    Replace masked pixels with the median of unmasked pixels around them.
+    """
+    cleaned = np.array(image)
+    y, x = np.nonzero(mask)
+    if len(y) == 0:
+        return cleaned
+    pad = size // 2
+    padded = np.pad(np.where(mask, np.nan, image), pad, constant_values=np.nan)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, (size, size))
+    # (pixels surrounded entirely by cosmic rays get an all-NaN window)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        replacement = np.nanmedian(windows[y, x].reshape(len(y), -1), axis=1)
+    cleaned[y, x] = np.where(np.isfinite(replacement), replacement, image[y, x])
+    return cleaned
+
+
+def _clean_frame(image, gain, readnoise, sigclip, sigfrac, objlim, iterations):
+    """
+    Find and replace cosmic rays in one (chunk of a) frame.
+    """
+    image = np.asarray(image, dtype=np.float32)
+    mask = np.zeros(image.shape, dtype=bool)
+    cleaned = image
+    grow = np.ones((3, 3), dtype=bool)
+
+    # the expected noise (medians already ignore cosmic rays, so only do this once)
+    median5 = ndimage.median_filter(image, size=5, mode="nearest")
+    noise = np.sqrt(np.clip(gain * median5, 0, None) + readnoise**2) / gain
+
+    for _ in range(iterations):
+        # how significant is the sharpness of every pixel, compared to the noise?
+        significance = laplacian_plus(cleaned) / (2 * noise)
+        significance -= _median(significance, 5)
+
+        # candidates must be much sharper than the fine structure (like stars)
+        found = significance > sigclip
+        y, x = np.nonzero(found)
+        structure = _fine_structure(cleaned, y, x) / noise[y, x]
+        found[y, x] = significance[y, x] / np.clip(structure, 0.01, None) > objlim
+
+        # grow cosmic rays into their fainter neighbors
+        found = ndimage.binary_dilation(found, grow) & (significance > sigclip)
+        found = ndimage.binary_dilation(found, grow) & (
+            significance > sigclip * sigfrac
+        )
+        found &= ~mask
+        if not np.any(found):
+            break
+        mask |= found
+        cleaned = _replace(image, mask)
+    return cleaned, mask
+
+
+def _chunks(N, chunk_rows, halo):
+    """
+    Split N rows into chunks, each padded with some extra rows on either side.
+
+    Returns
+    -------
+    chunks : list
+        Tuples of (start, stop) for the padded chunk, and
+        (start, stop) of the part of it that should be kept.
+    """
+    chunks = []
+    for start in range(0, N, chunk_rows):
+        stop = min(start + chunk_rows, N)
+        chunks.append(((max(start - halo, 0), min(stop + halo, N)), (start, stop)))
+    return chunks
+
+
+def clean_cosmics(
+    image,
+    gain=1.0,
+    readnoise=5.0,
+    sigclip=4.5,
+    sigfrac=0.3,
+    objlim=5.0,
+    iterations=2,
+    chunk_rows=256,
+    max_workers=None,
+):
+    """
+    Find and remove cosmic rays from one frame, L.A.Cosmic style.
+
+    Parameters
+    ----------
+    image : array
+        The frame (in ADU, bias-subtracted if possible).
+    gain : float
+        The detector gain, in electrons/ADU.
+    readnoise : float
+        The read noise, in electrons.
+    sigclip : float
+        How significant (in sigma) must a cosmic ray be?
+    sigfrac : float
+        Neighbors of cosmic rays are included if they are
+        this fraction of `sigclip` significant.
+    objlim : float
+        How much sharper than the fine structure of the
+        image must a cosmic ray be? Raise this if the
+        cores of stars or sky lines are getting flagged.
+    iterations : int
+        How many times to repeat the search (finding
+        cosmic rays hidden next to other cosmic rays).
+    chunk_rows : int
+        How many rows to clean at once. Each chunk also
+        gets some overlapping rows on either side, so
+        the answer doesn't depend on the chunk size.
+    max_workers : int
+        How many threads should clean chunks? Default
+        is one per CPU. Use 1 to do everything in order.
+
+    Returns
+    -------
+    cleaned : array
+        The frame, with cosmic rays replaced by the
+        median of the good pixels around them.
+    mask : array
+        True where cosmic rays were found.
+    """
+    image = np.asarray(image, dtype=np.float32)
+    cleaned = np.empty_like(image)
+    mask = np.zeros(image.shape, dtype=bool)
+
+    # enough overlap for the filters (and the replacement) to never see an edge
+    halo = 8 + 2 * iterations
+    chunks = _chunks(image.shape[0], chunk_rows, halo)
+
+    def clean(chunk):
+        (a, b), (start, stop) = chunk
+        chunk_cleaned, chunk_mask = _clean_frame(
+            image[a:b], gain, readnoise, sigclip, sigfrac, objlim, iterations
+        )
+        cleaned[start:stop] = chunk_cleaned[start - a : stop - a]
+        mask[start:stop] = chunk_mask[start - a : stop - a]
+
+    if max_workers == 1:
+        for chunk in chunks:
+            clean(chunk)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(clean, chunks))
+    return cleaned, mask
+
+
+def clean_stack(
+    cube,
+    gain=1.0,
+    readnoise=5.0,
+    sigclip=5.0,
+    window=7,
+    chunk_rows=256,
+    max_workers=None,
+):
+    """
+    Find and remove cosmic rays from a time series of frames.
+
+    Each pixel is compared to the median of the same pixel in
+    the frames around it in time, after scaling every frame to
+    a common brightness (so changes in transparency don't look
+    like cosmic rays). Pixels that jump up by more than
+    `sigclip` times the expected noise are replaced by that
+    running median.
+
+    Parameters
+    ----------
+    cube : array
+        The frames, with shape (time, rows, columns).
+    gain : float
+        The detector gain, in electrons/ADU.
+    readnoise : float
+        The read noise, in electrons.
+    sigclip : float
+        How significant (in sigma) must a cosmic ray be?
+    window : int
+        How many frames go into the running median?
+    chunk_rows : int
+        How many rows to clean at once.
+    max_workers : int
+        How many threads should clean chunks? Default
+        is one per CPU. Use 1 to do everything in order.
+
+    Returns
+    -------
+    cleaned : array
+        The frames, with cosmic rays replaced.
+    mask : array
+        True where cosmic rays were found.
+    """
+    cube = np.asarray(cube, dtype=np.float32)
+    N = cube.shape[0]
+    window = min(window, N)
+
+    # the relative brightness of each frame
+    scale = np.nanmedian(cube.reshape(N, -1), axis=1)
+    scale = np.where(scale > 0, scale / np.nanmedian(scale), 1.0).astype(np.float32)
+    scale = scale[:, np.newaxis, np.newaxis]
+
+    cleaned = np.empty_like(cube)
+    mask = np.zeros(cube.shape, dtype=bool)
+
+    def clean(chunk):
+        _, (start, stop) = chunk
+        frames = cube[:, start:stop]
+        expected = (
+            ndimage.median_filter(frames / scale, size=(window, 1, 1), mode="mirror")
+            * scale
+        )
+        noise = np.sqrt(np.clip(gain * expected, 0, None) + readnoise**2) / gain
+        found = (frames - expected) > sigclip * noise
+        cleaned[:, start:stop] = np.where(found, expected, frames)
+        mask[:, start:stop] = found
+
+    chunks = _chunks(cube.shape[1], chunk_rows, 0)
+    if max_workers == 1:
+        for chunk in chunks:
+            clean(chunk)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(clean, chunks))
+    return cleaned, mask
@@ -1,43 +1,549 @@
-from thefriendlystars import *
+import os
+import numpy as np
+import matplotlib.pyplot as plt
+import astropy.units as u
+from concurrent.futures import ProcessPoolExecutor
+from astropy.coordinates import SkyCoord
 from astropy.time import Time
-from ipywidgets import Output, AppLayout
+from astropy.table import Table, QTable
+from scipy.spatial import cKDTree
 
+from .gaia import default_store, _cone_table
+from .spatial import (
+    unit_vectors,
+    sky_positions,
+    tangent_plane,
+    slit_rotation,
+    friends_of_friends,
+    SpatialIndex,
+)
 
-def propagate_proper_motions(stars, epoch="now"):
-    if epoch == "now":
+
+def propagate_proper_motions(stars, epoch="now", verbose=True):
+    """
+    Move stars from their catalog positions to some other epoch(s).
+
+    Only the `ra` and `dec` columns get freshly allocated; every
+    other column is shared with the original table. If `epoch` is
+    an array, the positions for all stars at all epochs are
+    calculated in one broadcast operation, and the `ra` and `dec`
+    columns have shape (stars, epochs). Stars without measured
+    proper motions stay at their catalog positions.
+
+    Parameters
+    ----------
+    stars : QTable
+        A table of stars from `get_gaia`.
+    epoch : float, array, str
+        The decimal year(s) to which positions should be moved,
+        or "now" for the current time.
+    verbose : bool
+        Should we print a summary of how far stars moved?
+
+    Returns
+    -------
+    propagated : QTable
+        A new table (sharing all but the coordinate columns with
+        `stars`) with positions at the requested epoch(s).
+    """
+    if isinstance(epoch, str) and (epoch == "now"):
         epoch = Time.now().decimalyear
+    epoch = np.asarray(epoch, dtype=float)
+    original_epoch = stars.meta["epoch"]
 
-    from copy import deepcopy
+    # do the math with plain float arrays (in degrees and years)
+    dt = epoch - original_epoch
+    if np.ndim(dt) > 0:
+        dt = dt[np.newaxis, :]
+    mas = (1 * u.mas).to_value(u.deg)
+    ra = np.asarray(stars["ra"].to_value(u.deg))
+    dec = np.asarray(stars["dec"].to_value(u.deg))
+    pmra = np.ma.filled(stars["pmra"].to_value(u.mas / u.year), 0) * mas
+    pmdec = np.ma.filled(stars["pmdec"].to_value(u.mas / u.year), 0) * mas
+    if np.ndim(dt) > 0:
+        ra, dec, pmra, pmdec = [x[:, np.newaxis] for x in (ra, dec, pmra, pmdec)]
+
+    propagated = QTable(stars, copy=False)
+    propagated.meta = dict(stars.meta)
+    propagated["ra"] = (ra + dt * pmra / np.cos(np.radians(dec))) * u.deg
+    propagated["dec"] = (dec + dt * pmdec) * u.deg
+    propagated.meta["epoch"] = epoch if np.ndim(epoch) > 0 else float(epoch)
+
+    if verbose:
+        motion = np.sqrt(pmra**2 + pmdec**2) * np.max(np.abs(dt)) * u.deg
+        motion = motion.to(u.arcsec)
+        if np.ndim(epoch) > 0:
+            requested = f"{np.min(epoch):.2f}-{np.max(epoch):.2f}"
+        else:
+            requested = f"{epoch:.2f}"
+        print(
+            f"""
+    Propagating proper motions from {original_epoch:.2f} (catalog) to {requested} (requested).
+    The largest motion was {np.max(motion):.3g}; the median was {np.median(motion):.3g}.
+    """
+        )
+    return propagated
 
-    propagated = deepcopy(stars)
-    original_epoch = stars.meta["epoch"]
 
-    dt = (epoch - stars.meta["epoch"]) * u.year
-    propagated["ra"] = stars["ra"] + dt * stars["pmra"] / np.cos(stars["dec"])
-    propagated["dec"] = stars["dec"] + dt * stars["pmdec"]
-    propagated.meta["epoch"] = epoch
+def finder_offsets(stars, unit=u.arcmin):
+    """
+    Calculate plain (unitless) offsets of stars from the field center.
+
+    Parameters
+    ----------
+    stars : QTable
+        A table of stars from `get_gaia`, with a `center` in its meta.
+    unit : Unit
+        The unit in which offsets should be expressed.
+
+    Returns
+    -------
+    x, y : array
+        The offsets in (RA * cos(Dec), Dec), as float arrays.
+    """
+    center = stars.meta["center"]
+    ra = np.asarray(stars["ra"].to_value(u.deg))
+    dec = np.asarray(stars["dec"].to_value(u.deg))
+    scale = (1 * u.deg).to_value(unit)
+    dra = (ra - center.ra.deg + 180) % 360 - 180
+    x = dra * np.cos(np.radians(dec)) * scale
+    y = (dec - center.dec.deg) * scale
+    return x, y
 
-    dra = (propagated["ra"] - stars["ra"]) * np.cos(stars["dec"])
-    ddec = propagated["dec"] - stars["dec"]
-    motion = np.sqrt(dra**2 + ddec**2).to(u.arcsec)
 
-    print(
-        f"""
-    Propagating proper motions from {original_epoch:.2f} (catalog) to {epoch:.2f} (requested).
-    The largest motion was {np.max(motion):.3g}; the median was {np.median(motion):.3g}.
+def slit_alignment(ra, dec):
     """
+    Find the slit center and rotation that best line up some stars.
+
+    The stars are projected onto a plane tangent to the sky at
+    their average position, and the best-fit line through them is
+    found by total least squares (the direction of greatest spread).
+    For two stars, this is simply the line connecting them.
+
+    Parameters
+    ----------
+    ra : Quantity, array
+        Right ascensions of the stars (degrees, if unitless).
+    dec : Quantity, array
+        Declinations of the stars (degrees, if unitless).
+
+    Returns
+    -------
+    center : SkyCoord
+        The center of the stars, for centering the slit.
+    rotation : Quantity
+        The KOSMOS "RotType=Object" rotator angle that
+        lines the slit up along the stars.
+    scatter : Quantity
+        The RMS distance of the stars from the line.
+    """
+    ra = np.ma.filled(np.ma.asarray(u.Quantity(ra, u.deg).to_value(u.deg)), np.nan)
+    dec = np.ma.filled(np.ma.asarray(u.Quantity(dec, u.deg).to_value(u.deg)), np.nan)
+    xyz = unit_vectors(ra, dec)
+
+    # set up a plane tangent to the sky at the average position
+    middle = np.mean(xyz, axis=0)
+    middle /= np.linalg.norm(middle)
+    east, north = tangent_plane(middle)
+    depth = xyz @ middle
+    offsets = np.transpose([xyz @ east / depth, xyz @ north / depth])
+
+    # fit a line by total least squares
+    centroid = np.mean(offsets, axis=0)
+    _, _, directions = np.linalg.svd(offsets - centroid)
+    along, across = directions
+    # point the line from the first star toward the last
+    if np.dot(offsets[-1] - offsets[0], along) < 0:
+        along = -along
+    scatter = np.sqrt(np.mean(((offsets - centroid) @ across) ** 2)) * u.radian
+    kosmos_rotation = slit_rotation(*along) * u.deg
+
+    center_ra, center_dec = sky_positions(
+        middle + centroid[0] * east + centroid[1] * north
     )
-    return propagated
+    kosmos_center = SkyCoord(ra=center_ra * u.deg, dec=center_dec * u.deg)
+    return kosmos_center, kosmos_rotation.to(u.deg), scatter.to(u.arcsec)
+
+
+class FinderChart:
+    """
+    A finder chart, drawn with a small, fixed number of artists.
+
+    All stars are drawn as one scatter collection. Labels come
+    from a fixed pool of text artists that get reused whenever
+    the view changes: only stars inside the current view are
+    considered, brightest first, and any label that would
+    overlap one already placed is skipped.
+    """
+
+    # the most labels that will ever be drawn at once
+    max_labels = 50
+
+    # the font size of the labels
+    fontsize = 5
+
+    # how close (in display pixels) a click must be to pick a star
+    pick_radius = 5
+
+    # how selected stars should be highlighted
+    highlight_color = "darkorchid"
+    highlight_alpha = 0.5
+
+    def __init__(
+        self,
+        stars,
+        ax=None,
+        filter="G_gaia",
+        faintest_magnitude_to_show=20,
+        faintest_magnitude_to_label=15,
+        size_of_zero_magnitude=100,
+        unit=u.arcmin,
+        **kwargs,
+    ):
+        """
+        Draw the chart.
+
+        Parameters
+        ----------
+        stars : QTable
+            A table of stars from `get_gaia`.
+        ax : Axes
+            The axes into which the chart should be drawn.
+            Default is the current axes.
+        filter : str
+            The filter to use for setting the size of the points.
+        faintest_magnitude_to_show : float
+            What's the faintest star to show?
+        faintest_magnitude_to_label : float
+            What's the faintest magnitude to which we should
+            add a numerical label?
+        size_of_zero_magnitude : float
+            What should the size of a zeroth magnitude star be?
+        unit : Unit
+            What unit should be used for the axes?
+        **kwargs : dict
+            Passed to `scatter` for the stars.
+        """
+        self.stars = stars
+        self.ax = ax or plt.gca()
+        self.filter = filter
+        self.faintest_magnitude_to_label = faintest_magnitude_to_label
+        self.unit = unit
+        center = stars.meta["center"]
+        radius = stars.meta["radius"].to_value(unit)
+
+        # convert everything to plain arrays, once
+        self.x, self.y = finder_offsets(stars, unit=unit)
+        self.mag = np.ma.filled(
+            np.ma.asarray(stars[f"{filter}_mag"].to_value("mag")), np.inf
+        )
+        size_normalization = size_of_zero_magnitude / faintest_magnitude_to_show**2
+        marker_size = (
+            np.maximum(faintest_magnitude_to_show - self.mag, 0) ** 2
+            * size_normalization
+        )
+
+        # plot the stars
+        self.scatter = self.ax.scatter(
+            self.x, self.y, s=marker_size, color="black", **kwargs
+        )
+        self.ax.set_xlabel(
+            rf"$\Delta$(Right Ascension) [{unit}] relative to {center.ra.to_string(u.hour, format='latex', precision=2)}"
+        )
+        self.ax.set_ylabel(
+            rf"$\Delta$(Declination) [{unit}] relative to {center.dec.to_string(u.deg, format='latex', precision=2)}"
+        )
+        self.ax.set_title(f'{stars.meta["epoch"]:.2f}')
+
+        # add a grid
+        self.ax.grid(color="gray", alpha=0.2)
+
+        # plot a circle for the edge of the field
+        circle = plt.Circle(
+            [0, 0], radius, fill=False, color="gray", linewidth=2, alpha=0.2
+        )
+        self.ax.add_patch(circle)
+
+        # set the axis limits
+        self.ax.set_xlim(radius, -radius)
+        self.ax.set_ylim(-radius, radius)
+        self.ax.set_aspect("equal", adjustable="box")
+
+        # create the (hidden) pool of labels, brightest stars first
+        self.filter_label = filter.split("_")[0]
+        labelable = np.nonzero(self.mag < faintest_magnitude_to_label)[0]
+        self.labelable = labelable[np.argsort(self.mag[labelable], kind="stable")]
+        self.labels = [
+            self.ax.text(
+                0,
+                0,
+                "",
+                ha="left",
+                va="center",
+                fontsize=self.fontsize,
+                visible=False,
+                clip_on=True,
+            )
+            for _ in range(min(self.max_labels, len(self.labelable)))
+        ]
+        self.labeled = np.array([], dtype=int)
+
+        # create one (empty) collection to highlight selected stars
+        self.selected = []
+        self.highlight = self.ax.scatter(
+            np.zeros(0),
+            np.zeros(0),
+            s=100,
+            facecolor="none",
+            edgecolor=self.highlight_color,
+            alpha=self.highlight_alpha,
+        )
+        self.highlight_labels = []
+
+        # relabel whenever the view changes
+        self.ax.callbacks.connect("xlim_changed", self.update_labels)
+        self.ax.callbacks.connect("ylim_changed", self.update_labels)
+        self.update_labels()
+
+    def choose_labels(self):
+        """
+        Pick which stars should be labeled in the current view.
+
+        Returns
+        -------
+        indices : array
+            The indices of the stars to label, brightest first.
+        """
+        candidates = self.labelable
+        if len(candidates) == 0 or len(self.labels) == 0:
+            return np.array([], dtype=int)
+
+        # keep only the stars inside the current view
+        x0, x1 = sorted(self.ax.get_xlim())
+        y0, y1 = sorted(self.ax.get_ylim())
+        x, y = self.x[candidates], self.y[candidates]
+        visible = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        candidates = candidates[visible]
+
+        # find the approximate size of a label, in display pixels
+        points = self.fontsize * self.ax.figure.dpi / 72
+        width = len(f"  {self.filter_label}=00.00") * 0.6 * points
+        height = 1.2 * points
+        pixels = self.ax.transData.transform(
+            np.transpose([self.x[candidates], self.y[candidates]])
+        )
+
+        # greedily accept labels that don't overlap any already accepted
+        chosen = []
+        for i, (px, py) in enumerate(pixels):
+            if chosen:
+                dx = px - pixels[chosen, 0]
+                dy = py - pixels[chosen, 1]
+                if np.any((np.abs(dx) < width) & (np.abs(dy) < height)):
+                    continue
+            chosen.append(i)
+            if len(chosen) == len(self.labels):
+                break
+        return candidates[chosen]
+
+    def update_labels(self, *args):
+        """
+        Move the pool of labels onto the stars that should be labeled now.
+
+        This is called automatically whenever the axis limits change
+        (with the axes as an argument), in which case the canvas
+        is asked to redraw when it gets a chance.
+        """
+        indices = self.choose_labels()
+        if np.array_equal(indices, self.labeled):
+            return
+        for text, i in zip(self.labels, indices):
+            text.set_position((self.x[i], self.y[i]))
+            text.set_text(f"  {self.filter_label}={self.mag[i]:.2f}")
+            text.set_visible(True)
+        for text in self.labels[len(indices) :]:
+            text.set_visible(False)
+        self.labeled = indices
+        if len(args) > 0:
+            self.ax.figure.canvas.draw_idle()
+
+    @property
+    def tree(self):
+        """
+        A KD-tree on the plotted offsets, for finding clicked stars.
+        """
+        if not hasattr(self, "_tree"):
+            self._tree = cKDTree(np.transpose([self.x, self.y]))
+        return self._tree
+
+    def find_star(self, x, y, pick_radius=None):
+        """
+        Find the star closest to a position, if it's close enough.
+
+        Parameters
+        ----------
+        x, y : float
+            The position, in the data coordinates of the chart.
+        pick_radius : float
+            The farthest (in display pixels) a star can be
+            from the position. Default is `self.pick_radius`.
+
+        Returns
+        -------
+        i : int
+            The index of the closest star (or None if none are close enough).
+        """
+        if pick_radius is None:
+            pick_radius = self.pick_radius
+
+        # convert the pick radius from display pixels to data units
+        center = self.ax.transData.transform([x, y])
+        corner = self.ax.transData.inverted().transform(center + pick_radius)
+        radius = np.max(np.abs(corner - [x, y]))
+
+        distance, i = self.tree.query([x, y], distance_upper_bound=radius)
+        if np.isfinite(distance):
+            return int(i)
+
+    def toggle(self, i):
+        """
+        Select a star (or unselect it, if it was already selected).
+
+        Parameters
+        ----------
+        i : int
+            The index of the star.
+        """
+        if i in self.selected:
+            self.selected.remove(i)
+        else:
+            self.selected.append(i)
+
+        # update the highlight collection in place
+        indices = np.array(self.selected, dtype=int)
+        self.highlight.set_offsets(np.transpose([self.x[indices], self.y[indices]]))
+
+        # reuse (or create) the index labels above the selected stars
+        while len(self.highlight_labels) < len(indices):
+            self.highlight_labels.append(
+                self.ax.text(
+                    0,
+                    0,
+                    "",
+                    fontsize=7,
+                    color=self.highlight_color,
+                    alpha=self.highlight_alpha,
+                    va="center",
+                    ha="center",
+                )
+            )
+        for text, j in zip(self.highlight_labels, indices):
+            text.set_position((self.x[j], self.y[j]))
+            text.set_text(f"[{j}]\n\n")
+            text.set_visible(True)
+        for text in self.highlight_labels[len(indices) :]:
+            text.set_visible(False)
+        self.ax.figure.canvas.draw_idle()
+
+    def describe_selection(self):
+        """
+        Summarize the selected stars, and how to align them on the slit.
+
+        Returns
+        -------
+        summary : str
+            A printable summary.
+        """
+        indices = np.array(self.selected, dtype=int)
+        G = np.ma.filled(
+            np.ma.asarray(self.stars["G_gaia_mag"][indices].to_value("mag")), np.nan
+        )
+        BP_minus_RP = np.ma.filled(
+            np.ma.asarray(
+                (
+                    self.stars["BP_gaia_mag"][indices]
+                    - self.stars["RP_gaia_mag"][indices]
+                ).to_value("mag")
+            ),
+            np.nan,
+        )
+        lines = [
+            f"{f'[{i}]':>8}, G={g:.2f}, Bp-Rp={c:.2f}"
+            for i, g, c in zip(indices, G, BP_minus_RP)
+        ]
+
+        if len(indices) >= 2:
+            center, rotation, scatter = slit_alignment(
+                self.stars["ra"][indices], self.stars["dec"][indices]
+            )
+            kosmos_center_string = center.to_string("hmsdms", sep=":")
+            kosmos_rotation_string = f"RotType=Object; RotAng={rotation:.2f}"
+            labels = ", ".join([f"[{i}]" for i in indices])
+            command = "two" if len(indices) == 2 else len(indices)
+            lines += [
+                "",
+                f"To align stars {labels} on a KOSMOS slit, try:",
+                f"center-of-{command}-stars {kosmos_center_string} {kosmos_rotation_string}",
+            ]
+            if len(indices) > 2:
+                lines.append(f"(stars scatter by {scatter:.2f} RMS across the slit)")
+        return "\n".join(lines)
 
 
 class Finder:
-    def __init__(self, name, epoch="now", **kwargs):
-        self.stars_at_gaia_epoch = get_gaia(name, **kwargs)
+    def __init__(self, name, epoch="now", store=None, **kwargs):
+        """
+        Gather the stars around a target.
+
+        Parameters
+        ----------
+        name : str, SkyCoord
+            The name (or coordinates) of the center of the field.
+        epoch : float, str
+            The decimal year to which positions should be moved,
+            or "now" for the current time.
+        store : GaiaStore, bool
+            The local store from which to get Gaia stars. Default
+            (None) uses the shared store; False skips the store
+            and always asks the Gaia archive directly.
+        **kwargs : dict
+            Passed to the query (for example, `radius`).
+        """
+        if store is False:
+            from thefriendlystars import get_gaia
+
+            self.stars_at_gaia_epoch = get_gaia(name, **kwargs)
+        else:
+            store = store or default_store()
+            self.stars_at_gaia_epoch = store.query(name, **kwargs)
         self.stars = propagate_proper_motions(self.stars_at_gaia_epoch, epoch=epoch)
 
     def plot(self, **kwargs):
+        from thefriendlystars import plot_gaia
+
         plot_gaia(self.stars, **kwargs)
 
+    def solve(self, image, **kwargs):
+        """
+        Plate solve an acquisition image against the stars in this field.
+
+        Parameters
+        ----------
+        image : array
+            The image (indexed as [y, x]).
+        **kwargs : dict
+            Passed to `astrometry.solve` (for example, `pixel_scale`).
+
+        Returns
+        -------
+        solution : PlateSolution
+            The astrometric solution (or None if none was found),
+            which can calculate `.offset_to_slit(...)`.
+        """
+        from .astrometry import solve
+
+        return solve(image, self.stars, **kwargs)
+
     def interact(
         self,
         filter="G_gaia",
@@ -74,196 +580,284 @@ class Finder:
             What unit should be used for labels? Default is u.arcmin.
         """
 
-        table = self.stars
-        # extract the center and size of the field
-        center = table.meta["center"]
-        radius = table.meta["radius"]
+        with plt.ioff():
+            fig = plt.figure(dpi=150)
+        chart = FinderChart(
+            self.stars,
+            ax=plt.gca(),
+            filter=filter,
+            faintest_magnitude_to_show=faintest_magnitude_to_show,
+            faintest_magnitude_to_label=faintest_magnitude_to_label,
+            size_of_zero_magnitude=size_of_zero_magnitude,
+            unit=unit,
+            **kwargs,
+        )
+        self.chart = chart
+
+        # the indices of the selected stars, in the order they were clicked
+        self.selected = chart.selected
+
+        # (widgets are only needed here, so only import them here)
+        from ipywidgets import Output, AppLayout
+        from IPython.display import display
+
+        # create a space for displaying text output
+        o = Output()
+
+        def onclick(event):
+            """
+            When a star is clicked, toggle whether it is selected.
+
+            Parameters
+            ----------
+            event : MouseEvent
+            """
+            # ignore clicks outside the chart, or while zooming/panning
+            if event.inaxes is not chart.ax or event.xdata is None:
+                return
+            toolbar = getattr(fig.canvas, "toolbar", None)
+            if toolbar is not None and getattr(toolbar, "mode", "") != "":
+                return
+
+            i = chart.find_star(event.xdata, event.ydata)
+            if i is None:
+                return
+            chart.toggle(i)
+
+            # print summary of the selected stars
+            with o:
+                o.clear_output()
+                print(chart.describe_selection())
+
+        # tell the figure to watch for mouse clicks
+        cid = fig.canvas.mpl_connect("button_press_event", onclick)
+
+        layout = AppLayout(
+            center=fig.canvas,
+            footer=o,
+        )
+        display(layout)
 
-        # find offsets relative to the center
-        dra = ((table["ra"] - center.ra) * np.cos(table["dec"])).to(unit)
-        ddec = (table["dec"] - center.dec).to(unit)
+        # display(fig.canvas)
+        # display(o)
 
-        # set the sizes of the points
-        mag = table[f"{filter}_mag"].to_value("mag")
-        size_normalization = size_of_zero_magnitude / faintest_magnitude_to_show**2
-        marker_size = (
-            np.maximum(faintest_magnitude_to_show - mag, 0) ** 2 * size_normalization
-        )
+    def show_lightcurves(self):
+        from lightkurve import search_lightcurve
 
-        # handle astropy units better
-        with quantity_support():
-            with plt.ioff():
-                fig = plt.figure(dpi=150)
-
-            # plot the stars
-            plt.scatter(
-                dra,
-                ddec,
-                s=marker_size,
-                color="black",
-                picker=True,
-                pickradius=5,
-                **kwargs,
-            )
-            plt.xlabel(
-                rf"$\Delta$(Right Ascension) [{unit}] relative to {center.ra.to_string(u.hour, format='latex', precision=2)}"
-            )
-            plt.ylabel(
-                rf"$\Delta$(Declination) [{unit}] relative to {center.dec.to_string(u.deg, format='latex', precision=2)}"
-            )
-            plt.title(f'{self.stars.meta["epoch"]:.2f}')
-
-            # add labels
-            filter_label = filter.split("_")[0]
-            to_label = np.nonzero(mag < faintest_magnitude_to_label)[0]
-            for i in to_label:
-                plt.text(
-                    dra[i],
-                    ddec[i],
-                    f"  {filter_label}={mag[i]:.2f}",
-                    ha="left",
-                    va="center",
-                    fontsize=5,
-                )
+        lcs = search_lightcurve(x)
+        lc = lcs[-1].download()
+        lc.normalize().plot()
 
-            # add a grid
-            plt.grid(color="gray", alpha=0.2)
 
-            # plot a circle for the edge of the field
-            circle = plt.Circle(
-                [0, 0], radius, fill=False, color="gray", linewidth=2, alpha=0.2
+def gather_fields(
+    catalog,
+    radius=6 * u.arcmin,
+    epoch="now",
+    store=None,
+    max_group_radius=0.5 * u.deg,
+):
+    """
+    Get Gaia stars around every target in a catalog.
+
+    Targets close enough that their fields overlap are grouped
+    together (with friends-of-friends) so they can share one Gaia
+    query, and all stars are moved to the observing epoch.
+
+    Parameters
+    ----------
+    catalog : TUICatalog
+        The catalog of targets.
+    radius : Quantity
+        The radius of each field.
+    epoch : float, str
+        The decimal year of the observations, or "now".
+    store : GaiaStore
+        The local store from which to get Gaia stars.
+        Default is the shared store.
+    max_group_radius : Quantity
+        Groups of targets spread over more than this are
+        queried one target at a time instead.
+
+    Returns
+    -------
+    fields : dict
+        Tables of stars (like `get_gaia` returns, but propagated
+        to `epoch`), keyed by the index of each target.
+    groups : array
+        The group label of each target.
+    """
+    store = store or default_store()
+    if isinstance(epoch, str) and (epoch == "now"):
+        epoch = Time.now().decimalyear
+
+    # group targets whose fields overlap
+    ra, dec = catalog._radec()
+    xyz = unit_vectors(ra, dec)
+    groups = friends_of_friends(xyz, 2 * radius)
+
+    # gather and propagate the stars for every target
+    fields = {}
+    for g in np.unique(groups):
+        members = np.nonzero(groups == g)[0]
+        middle = np.sum(xyz[members], axis=0)
+        middle /= np.linalg.norm(middle)
+        spread = np.degrees(np.arccos(np.clip(xyz[members] @ middle, -1, 1)))
+        spread = np.max(spread) * u.deg
+        if (len(members) > 1) and (spread <= max_group_radius):
+            group_center = SkyCoord(
+                ra=np.degrees(np.arctan2(middle[1], middle[0])) % 360 * u.deg,
+                dec=np.degrees(np.arcsin(np.clip(middle[2], -1, 1))) * u.deg,
             )
-            plt.gca().add_patch(circle)
-
-            # set the axis limits
-            plt.xlim(radius, -radius)
-            plt.ylim(-radius, radius)
-            plt.axis("scaled")
-
-            # set up interaction defaults
-            highlight_color = "darkorchid"
-            highlight_alpha = 0.5
-
-            # simple shortcut for x + y coordinates
-            x = dra
-            y = ddec
-
-            # create a space for displaying text output
-            o = Output()
-
-            # create an empty dictionary
-            self.selected = {}
-
-            def onpick(event):
-                """
-                When a star is picked, highlight it and add it to a self.selected dictionary.
-
-                Parameters
-                ----------
-                event : PickEvent
-                """
-
-                # put text outputs in a specific spot
-                with o:
-                    # ignore scroll events (and others beside mouse clicks)
-                    if event.mouseevent.name == "button_press_event":
-                        # erase all previous output
-                        o.clear_output()
-                        # print(f"{event.mousevent}")
-
-                        # extract which index of the plotted (x,y) was self.selected
-                        i = event.ind[0]
-
-                        # events.append(event)
-
-                        # add the point into a dictionary of "self.selected" objects
-                        if i not in self.selected:
-                            self.selected[i] = {
-                                "(x,y)": (x[i], y[i]),  # position object
-                                "label": plt.text(
-                                    x[i],
-                                    y[i],
-                                    f"[{i}]\n\n",  # text label above star
-                                    fontsize=7,
-                                    color=highlight_color,
-                                    alpha=highlight_alpha,
-                                    va="center",
-                                    ha="center",
-                                ),
-                                "circle": plt.scatter(
-                                    x[i],
-                                    y[i],  # plotted circle around star
-                                    s=100,
-                                    facecolor="none",
-                                    edgecolor=highlight_color,
-                                    alpha=highlight_alpha,
-                                ),
-                            }
-                        # if point was previously self.selected, remove it!
-                        else:
-                            self.selected[i]["label"].remove()
-                            self.selected[i]["circle"].remove()
-                            self.selected.pop(i)
-
-                        # print summary of the self.selected stars
-                        for i in self.selected:
-                            G = table[i]["G_gaia_mag"]
-                            BP_minus_RP = (
-                                table[i]["BP_gaia_mag"] - table[i]["RP_gaia_mag"]
-                            )
-                            label = f"[{i}]"
-                            print(f"{label:>8}, G={G:.2f}, Bp-Rp={BP_minus_RP:.2f}")
-
-                        if len(self.selected) == 2:
-                            i_A, i_B = self.selected.keys()
-                            A = table[i_A]
-                            B = table[i_B]
-
-                            dra_AB = (B["ra"] - A["ra"]) * np.cos(
-                                0.5 * (A["dec"] + B["dec"])
-                            )
-                            ddec_AB = B["dec"] - A["dec"]
-
-                            angle = np.arctan2(ddec_AB, dra_AB).to("deg")
-                            PA = 90 * u.deg - angle
-                            kosmos_rotation = PA - 90 * u.deg
-                            kosmos_rotation_string = (
-                                f"RotType=Object; RotAng={kosmos_rotation:.2f}"
-                            )
-
-                            ra_center = 0.5 * (A["ra"] + B["ra"])
-                            dec_center = 0.5 * (A["dec"] + B["dec"])
-                            kosmos_center = SkyCoord(
-                                ra=ra_center.filled(np.nan),
-                                dec=dec_center.filled(np.nan),
-                            )
-                            kosmos_center_string = kosmos_center.to_string(
-                                "hmsdms", sep=":"
-                            )
-
-                            print()
-                            print(
-                                f"To align stars [{i_A}] and [{i_B}] on a KOSMOS slit, try:"
-                            )
-                            print(
-                                f"center-of-two-stars {kosmos_center_string} {kosmos_rotation_string}"
-                            )
-
-            # tell the figure to watch for "pick" events
-            cid = fig.canvas.mpl_connect("pick_event", onpick)
-
-            layout = AppLayout(
-                center=fig.canvas,
-                footer=o,
+            shared = store.query(group_center, spread + radius)
+            index = SpatialIndex(
+                shared["ra"].to_value(u.deg), shared["dec"].to_value(u.deg)
             )
-            display(layout)
+        else:
+            shared = None
+
+        for i in members:
+            center = SkyCoord(ra=ra[i] * u.deg, dec=dec[i] * u.deg)
+            if shared is None:
+                stars = store.query(center, radius)
+            else:
+                stars = _cone_table(
+                    shared[index.cone(ra[i], dec[i], radius)],
+                    center,
+                    radius,
+                    epoch=shared.meta["epoch"],
+                )
+            fields[i] = propagate_proper_motions(stars, epoch=epoch, verbose=False)
+    return fields, groups
 
-            # display(fig.canvas)
-            # display(o)
 
-    def show_lightcurves(self):
-        from lightkurve import search_lightcurve
+def _render_finder_chart(stars, title, basename, formats, kwargs):
+    """
+    Draw one finder chart and save it to disk (in a worker process).
 
-        lcs = search_lightcurve(x)
-        lc = lcs[-1].download()
-        lc.normalize().plot()
+    This uses a bare Agg canvas instead of pyplot, so it never
+    needs a display and never touches any global figure state.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=(6, 6), dpi=150)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    FinderChart(stars, ax=ax, **kwargs)
+    ax.set_title(title)
+    filenames = []
+    for format in formats:
+        filename = f"{basename}.{format}"
+        fig.savefig(filename)
+        filenames.append(filename)
+    return filenames
+
+
+def make_finder_charts(
+    catalog,
+    directory="finder-charts",
+    epoch="now",
+    radius=6 * u.arcmin,
+    formats=["png", "pdf"],
+    store=None,
+    max_workers=None,
+    max_group_radius=0.5 * u.deg,
+    **kwargs,
+):
+    """
+    Make finder charts for every target in a catalog.
+
+    Targets close enough that their fields overlap are grouped
+    together (with friends-of-friends) so they can share one Gaia
+    query. Stars are moved to the observing epoch, and then all
+    the charts are drawn in parallel by a pool of processes.
+    The `directory` ends up with one image per format and one
+    table of neighboring stars for each target, plus an
+    `index.ecsv` table summarizing everything.
+
+    Parameters
+    ----------
+    catalog : TUICatalog
+        The catalog of targets.
+    directory : str
+        The folder into which charts should be saved.
+    epoch : float, str
+        The decimal year of the observations, or "now".
+    radius : Quantity
+        The radius of each finder chart.
+    formats : list
+        The image formats in which to save each chart.
+    store : GaiaStore
+        The local store from which to get Gaia stars.
+        Default is the shared store.
+    max_workers : int
+        How many processes should draw charts? Default is one
+        per CPU. Use 1 to draw everything in this process.
+    max_group_radius : Quantity
+        Groups of targets spread over more than this are
+        queried one target at a time instead.
+    **kwargs : dict
+        Passed to `FinderChart` (for example, `filter`).
+
+    Returns
+    -------
+    index : Table
+        A summary of each target and its files.
+    """
+    os.makedirs(directory, exist_ok=True)
+    if isinstance(epoch, str) and (epoch == "now"):
+        epoch = Time.now().decimalyear
+    faintest = kwargs.get("faintest_magnitude_to_show", 20)
+
+    names = [str(n) for n in catalog._column("names")]
+    ra, dec = catalog._radec()
+    fields, groups = gather_fields(
+        catalog,
+        radius=radius,
+        epoch=epoch,
+        store=store,
+        max_group_radius=max_group_radius,
+    )
+
+    # save the tables of neighbors, and prepare the drawing jobs
+    jobs = {}
+    for i, stars in fields.items():
+        safe = "".join(c if (c.isalnum() or c in "-+.") else "_" for c in names[i])
+        basename = os.path.join(directory, f"{i:04d}-{safe}")
+        mag = np.ma.filled(np.ma.asarray(stars["G_gaia_mag"].to_value("mag")), np.inf)
+        neighbors = stars[mag < faintest]
+        neighbors.sort("distance_from_center")
+        neighbors.meta = dict(
+            name=names[i],
+            center=stars.meta["center"].to_string("hmsdms", sep=":"),
+            epoch=float(epoch),
+        )
+        neighbors.write(f"{basename}.ecsv", overwrite=True)
+        jobs[i] = (stars, f"{names[i]} ({epoch:.2f})", basename, formats, kwargs)
+
+    # draw all the charts, in parallel
+    print(f"Drawing {len(jobs)} finder charts into {directory}/")
+    if max_workers == 1:
+        images = {i: _render_finder_chart(*job) for i, job in jobs.items()}
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                i: executor.submit(_render_finder_chart, *job)
+                for i, job in jobs.items()
+            }
+            images = {i: f.result() for i, f in futures.items()}
+
+    # make an index of everything
+    order = sorted(jobs)
+    index = Table()
+    index["name"] = [names[i] for i in order]
+    index["ra"] = ra[order] * u.deg
+    index["dec"] = dec[order] * u.deg
+    index["group"] = groups[order]
+    index["stars"] = [len(fields[i]) for i in order]
+    index["table"] = [os.path.basename(jobs[i][2]) + ".ecsv" for i in order]
+    for k, format in enumerate(formats):
+        index[format] = [os.path.basename(images[i][k]) for i in order]
+    index.meta = dict(epoch=float(epoch), radius=str(radius))
+    index.write(os.path.join(directory, "index.ecsv"), overwrite=True)
+    return index
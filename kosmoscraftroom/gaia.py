@@ -0,0 +1,416 @@
+"""
+A local, tiled store of Gaia stars, to make finder charts fast.
+
+The sky is divided into (nested) HEALPix tiles. Whenever stars
+are needed in a tile we haven't seen before, they are downloaded
+(with one remote cone search covering all missing tiles, split
+into smaller searches if it hits the archive's row limit) and
+saved as one small binary `.npy` file per tile. After that, any
+query overlapping those tiles is answered straight from disk,
+by memory-mapping just the handful of tiles that overlap the
+requested cone. Target names are also cached once they've been
+resolved into coordinates, so repeat visits need no internet.
+"""
+import os
+import json
+import numpy as np
+import astropy.units as u
+from astropy.table import QTable, MaskedColumn
+from astropy.coordinates import SkyCoord
+
+from .spatial import (
+    unit_vectors,
+    SpatialIndex,
+    healpix_index,
+    healpix_center,
+    healpix_radius,
+    healpix_cone,
+)
+
+# where tiles get stored, unless we say otherwise
+gaia_directory = os.path.join(os.path.expanduser("~"), ".kosmoscraftroom", "gaia")
+
+# the epoch of the Gaia positions
+gaia_epoch = 2016.0
+
+
+def _cone_table(table, center, radius, epoch=gaia_epoch):
+    """
+    Tidy up a table of stars into the format `get_gaia` returns.
+
+    Parameters
+    ----------
+    table : QTable
+        The stars, with `ra` and `dec` columns.
+    center : SkyCoord
+        The center of the cone.
+    radius : Quantity
+        The radius of the cone.
+    epoch : float
+        The epoch of the positions.
+
+    Returns
+    -------
+    table : QTable
+        The same stars, with an up-to-date `distance_from_center`
+        column and `center`, `radius`, `epoch` in the meta.
+    """
+    ra = np.asarray(u.Quantity(table["ra"]).to_value(u.deg))
+    dec = np.asarray(u.Quantity(table["dec"]).to_value(u.deg))
+    cos_distance = unit_vectors(ra, dec) @ unit_vectors(
+        center.icrs.ra.deg, center.icrs.dec.deg
+    )
+    table["distance_from_center"] = (
+        np.degrees(np.arccos(np.clip(cos_distance, -1, 1))) * u.deg
+    )
+    table.meta = dict(center=center, radius=radius, epoch=epoch)
+    return table
+
+
+class LocalGaiaSource:
+    """
+    Serve cone searches from a local table of stars, instead of the Gaia archive.
+
+    This can stand in for `get_gaia` as the `remote` of
+    a `GaiaStore`, which is handy for working offline
+    (or for testing) with a pre-downloaded patch of sky.
+    """
+
+    def __init__(self, filename):
+        """
+        Read the table and index its positions.
+
+        Parameters
+        ----------
+        filename : str
+            A table (in any format astropy can read) with the
+            same columns as the output of `get_gaia`.
+        """
+        self.filename = filename
+        self.table = QTable.read(filename)
+        self.epoch = self.table.meta.get("epoch", gaia_epoch)
+        self.index = SpatialIndex(
+            u.Quantity(self.table["ra"]).to_value(u.deg),
+            u.Quantity(self.table["dec"]).to_value(u.deg),
+        )
+
+    def __repr__(self):
+        return f"<LocalGaiaSource of {len(self.index)} stars from {self.filename}>"
+
+    def __call__(self, center, radius=6 * u.arcmin):
+        """
+        Find all stars within a cone.
+
+        Parameters
+        ----------
+        center : SkyCoord
+            The center of the cone.
+        radius : Quantity
+            The radius of the cone.
+
+        Returns
+        -------
+        table : QTable
+            The stars inside the cone.
+        """
+        indices = self.index.cone(center.icrs.ra.deg, center.icrs.dec.deg, radius)
+        return _cone_table(self.table[indices], center, radius, epoch=self.epoch)
+
+
+class GaiaStore:
+    """
+    A HEALPix-tiled local cache of Gaia stars.
+    """
+
+    # the most rows a remote search returns (Gaia.ROW_LIMIT in thefriendlystars)
+    row_limit = 50000
+
+    # the finest tiles into which a search that hits the row limit gets split
+    max_nside = 2**16
+
+    def __init__(self, directory=gaia_directory, nside=256, remote=None):
+        """
+        Set up (or reconnect to) a store of Gaia tiles.
+
+        Parameters
+        ----------
+        directory : str
+            The folder in which tiles should be stored.
+        nside : int
+            The HEALPix resolution of the tiles. The default
+            of 256 makes tiles about 0.23 degrees across.
+        remote : callable
+            A function `remote(center, radius)` that returns a
+            table of stars in the same format as `get_gaia`.
+            Default is `get_gaia` itself, which queries the
+            Gaia archive over the internet.
+        """
+        self.directory = directory
+        self.nside = nside
+        self.remote = remote
+        self.tile_directory = os.path.join(directory, f"nside{nside}")
+        os.makedirs(self.tile_directory, exist_ok=True)
+
+        # the column names, data types, and units shared by all tiles
+        self.description_filename = os.path.join(self.tile_directory, "meta.json")
+        if os.path.exists(self.description_filename):
+            with open(self.description_filename) as f:
+                self.description = json.load(f)
+        else:
+            self.description = None
+
+        # the cache of names that have been resolved into coordinates
+        self.names_filename = os.path.join(directory, "names.json")
+        if os.path.exists(self.names_filename):
+            with open(self.names_filename) as f:
+                self.names = json.load(f)
+        else:
+            self.names = {}
+
+    def __repr__(self):
+        return f"<GaiaStore of {len(self.tiles())} tiles in {self.tile_directory}>"
+
+    def _tile_path(self, pixel):
+        return os.path.join(self.tile_directory, f"{pixel}.npy")
+
+    def tiles(self):
+        """
+        Which tiles have already been stored?
+
+        Returns
+        -------
+        pixels : array
+            The nested HEALPix indices of stored tiles.
+        """
+        pixels = [
+            int(f[: -len(".npy")])
+            for f in os.listdir(self.tile_directory)
+            if f.endswith(".npy")
+        ]
+        return np.sort(np.array(pixels, dtype=np.int64))
+
+    def resolve(self, name):
+        """
+        Turn a target name into coordinates, remembering the answer.
+
+        Parameters
+        ----------
+        name : str, SkyCoord
+            The name of the target (or its coordinates already).
+
+        Returns
+        -------
+        center : SkyCoord
+            The coordinates of the target.
+        """
+        if isinstance(name, SkyCoord):
+            return name
+        if name not in self.names:
+            coordinates = SkyCoord.from_name(name)
+            self.names[name] = [coordinates.icrs.ra.deg, coordinates.icrs.dec.deg]
+            with open(self.names_filename, "w") as f:
+                json.dump(self.names, f, indent=1)
+        ra, dec = self.names[name]
+        return SkyCoord(ra=ra * u.deg, dec=dec * u.deg)
+
+    def _to_records(self, table):
+        """
+        Convert a table from `remote` into a structured array of plain values.
+        """
+        if self.description is None:
+            columns = []
+            for k in table.colnames:
+                if k == "distance_from_center":
+                    continue
+                unit = getattr(table[k], "unit", None)
+                dtype = np.ma.getdata(u.Quantity(table[k]).value).dtype
+                columns.append(
+                    [k, dtype.str, None if unit is None else unit.to_string()]
+                )
+            self.description = dict(
+                columns=columns, epoch=float(table.meta.get("epoch", gaia_epoch))
+            )
+            with open(self.description_filename, "w") as f:
+                json.dump(self.description, f, indent=1)
+
+        dtype = [(k, d) for k, d, _ in self.description["columns"]]
+        records = np.zeros(len(table), dtype=dtype)
+        for k, d, unit in self.description["columns"]:
+            if k not in table.colnames:
+                records[k] = np.nan if np.dtype(d).kind == "f" else 0
+                continue
+            column = table[k]
+            if unit is not None:
+                column = u.Quantity(column).to_value(unit)
+            # masked values become NaN (or zero, for integers)
+            fill = np.nan if np.dtype(d).kind == "f" else 0
+            records[k] = np.ma.filled(np.ma.asarray(column), fill)
+        return records
+
+    def _from_records(self, records):
+        """
+        Convert a structured array of plain values back into a table.
+        """
+        table = QTable()
+        for k, d, unit in self.description["columns"]:
+            data = records[k]
+            if data.dtype.kind == "f":
+                column = MaskedColumn(data, mask=np.isnan(data), unit=unit)
+            else:
+                column = MaskedColumn(data, mask=False, unit=unit)
+            table[k] = column
+        return table
+
+    def _covering_cone(self, pixels, nside):
+        """
+        Find a cone that entirely covers a set of tiles.
+        """
+        xyz = unit_vectors(*healpix_center(pixels, nside))
+        middle = np.sum(xyz, axis=0)
+        middle /= np.linalg.norm(middle)
+        ra = np.degrees(np.arctan2(middle[1], middle[0])) % 360
+        dec = np.degrees(np.arcsin(np.clip(middle[2], -1, 1)))
+        distance = np.degrees(np.arccos(np.clip(xyz @ middle, -1, 1)))
+        radius = np.max(distance) * u.deg + healpix_radius(nside).to(u.deg)
+        return SkyCoord(ra=ra * u.deg, dec=dec * u.deg), radius
+
+    def _fetch(self, pixels, nside):
+        """
+        Get all the stars inside some tiles, splitting the search up if needed.
+
+        If a remote cone search hits the row limit, its results
+        might be missing stars, so they're thrown away and the
+        tiles are searched again in two halves (or, for a single
+        tile, as its four smaller children) until every search
+        comes back complete.
+
+        Parameters
+        ----------
+        pixels : array
+            The nested HEALPix indices of the tiles.
+        nside : int
+            The HEALPix resolution of these tiles.
+
+        Returns
+        -------
+        records : array
+            The stars inside exactly these tiles (none twice).
+        """
+        center, radius = self._covering_cone(pixels, nside)
+        print(f"Downloading Gaia stars for {len(pixels)} tile(s) within {radius:.3f}.")
+        records = self._to_records(self.remote(center, radius))
+
+        if len(records) >= self.row_limit:
+            if nside >= self.max_nside:
+                raise RuntimeError(
+                    f"Sorry! Even tiny Gaia searches around {center} are hitting "
+                    f"the row limit of {self.row_limit} stars."
+                )
+            print(f"That hit the row limit of {self.row_limit}; splitting it up.")
+            if len(pixels) > 1:
+                # (nested indices are ordered along a curve, so halves stay compact)
+                half = len(pixels) // 2
+                groups = [(pixels[:half], nside), (pixels[half:], nside)]
+            else:
+                groups = [(4 * pixels[0] + np.arange(4), 2 * nside)]
+            return np.concatenate([self._fetch(*group) for group in groups])
+
+        # keep only the stars inside these tiles (cones overlap their neighbors)
+        inside = np.isin(healpix_index(records["ra"], records["dec"], nside), pixels)
+        return records[inside]
+
+    def download(self, pixels):
+        """
+        Download and save the stars in a set of tiles.
+
+        All the tiles are covered by a single remote cone search,
+        centered on the middle of the tiles and just big enough
+        to contain every one of them entirely. If that search
+        hits the row limit, it gets split into smaller ones, so
+        tiles are only ever saved once they're complete.
+
+        Parameters
+        ----------
+        pixels : array
+            The nested HEALPix indices of the tiles to download.
+        """
+        pixels = np.sort(np.asarray(pixels, dtype=np.int64))
+        if len(pixels) == 0:
+            return
+
+        if self.remote is None:
+            from thefriendlystars import get_gaia
+
+            self.remote = get_gaia
+        records = self._fetch(pixels, self.nside)
+
+        # split the stars up by tile, and save every one (even if empty)
+        tile = healpix_index(records["ra"], records["dec"], self.nside)
+        order = np.argsort(tile, kind="stable")
+        records, tile = records[order], tile[order]
+        left = np.searchsorted(tile, pixels, side="left")
+        right = np.searchsorted(tile, pixels, side="right")
+        for p, i, j in zip(pixels, left, right):
+            np.save(self._tile_path(p), records[i:j])
+
+    def query(self, center, radius=6 * u.arcmin):
+        """
+        Get Gaia stars within a cone, downloading only tiles we don't have.
+
+        Parameters
+        ----------
+        center : SkyCoord, str
+            The center of the cone, or the name of a target.
+        radius : Quantity
+            The radius of the cone. Default is 6 arcminutes.
+
+        Returns
+        -------
+        table : QTable
+            The stars inside the cone, in the same format as `get_gaia`.
+        """
+        center = self.resolve(center)
+        ra, dec = center.icrs.ra.deg, center.icrs.dec.deg
+
+        # make sure every overlapping tile is on disk
+        pixels = healpix_cone(ra, dec, radius, self.nside)
+        missing = [p for p in pixels if not os.path.exists(self._tile_path(p))]
+        self.download(missing)
+
+        # read the tiles, and keep only the stars inside the cone
+        threshold = np.cos(u.Quantity(radius).to_value(u.radian))
+        pointing = unit_vectors(ra, dec)
+        pieces = []
+        for p in pixels:
+            tile = np.load(self._tile_path(p), mmap_mode="r")
+            if len(tile) == 0:
+                continue
+            inside = unit_vectors(tile["ra"], tile["dec"]) @ pointing >= threshold
+            pieces.append(tile[inside])
+        if len(pieces) > 0:
+            records = np.concatenate(pieces)
+        else:
+            dtype = [(k, d) for k, d, _ in self.description["columns"]]
+            records = np.zeros(0, dtype=dtype)
+
+        table = self._from_records(records)
+        return _cone_table(table, center, radius, epoch=self.description["epoch"])
+
+
+# one store shared by everything that needs Gaia stars
+_default_store = None
+
+
+def default_store():
+    """
+    Get the shared default GaiaStore (creating it if necessary).
+
+    Returns
+    -------
+    store : GaiaStore
+        A store in the default directory, backed by `get_gaia`.
+    """
+    global _default_store
+    if _default_store is None:
+        _default_store = GaiaStore()
+    return _default_store
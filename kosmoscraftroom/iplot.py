@@ -10,8 +10,6 @@ to event tracking within any of those panels.
 """
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
-import ipywidgets as widgets
-from IPython.display import display
 
 
 # turn off default key mappings for matplotlib
@@ -41,6 +39,8 @@ class iplot:
         **kwargs : dict
                 All keyword arguments will be passed to GridSpec.
         """
+        import ipywidgets as widgets
+
         # create a space for displaying outputs
         self.figure_output = widgets.Output()
         self.text_output = widgets.Output()
@@ -59,6 +59,9 @@ class iplot:
 
     def display(self):
         """ """
+        import ipywidgets as widgets
+        from IPython.display import display
+
         display(
             widgets.AppLayout(
                 header=None,
@@ -1,10 +1,7 @@
 from .iplot import iplot
 import matplotlib.colors as colors
 import matplotlib.pyplot as plt
-import matplotlib.animation as ani
 import os
-from tqdm import tqdm
-from astropy.stats import median_absolute_deviation
 import numpy as np
 
 
@@ -259,6 +256,8 @@ class loupe(iplot):
 
         # pick a scale for the plotting
         if scale == "symlog":
+            from astropy.stats import median_absolute_deviation
+
             norm = colors.SymLogNorm(
                 linthresh=median_absolute_deviation(self.imagetoplot),
                 linscale=0.1,
@@ -493,6 +492,8 @@ class loupe(iplot):
         **kw
     ):  # each frame will skip over this many timepoints):
         """Create movie of the spectral cube."""
+        import matplotlib.animation as ani
+        from tqdm import tqdm
 
         self.speak("making a movie!")
 
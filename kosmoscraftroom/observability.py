@@ -0,0 +1,361 @@
+"""
+Tools for figuring out when targets are observable from APO.
+
+The expensive part of converting sky positions into altitudes
+and azimuths is the chain of frame transformations (precession,
+nutation, sidereal time, ...), which depends only on time, not
+on the target. So, for each time on a night's grid, we transform
+just the three ICRS basis vectors into the local horizon frame,
+and cache the resulting rotation matrices. Every target at every
+time can then be handled with one broadcast matrix multiplication.
+"""
+from functools import lru_cache
+import numpy as np
+import astropy.units as u
+from astropy.time import Time
+from astropy.coordinates import SkyCoord, AltAz, EarthLocation, get_sun
+
+from .spatial import unit_vectors
+
+# the location of the ARC 3.5m telescope at Apache Point Observatory
+apo = EarthLocation.from_geodetic(
+    lon=-105.820417 * u.deg, lat=32.780361 * u.deg, height=2788 * u.m
+)
+
+# APO keeps Mountain Standard Time all year
+utc_offset = -7 * u.hour
+
+
+def horizon_rotations(times, location=apo):
+    """
+    Calculate matrices that rotate ICRS unit vectors into the horizon frame.
+
+    The most recent few time grids are cached, so re-used
+    nights don't need the coordinate transformations again.
+
+    Parameters
+    ----------
+    times : Time
+        The times at which to calculate the rotations.
+    location : EarthLocation
+        The location of the observatory.
+
+    Returns
+    -------
+    rotations : array
+        An array of shape (N_times, 3, 3), such that multiplying
+        an ICRS unit vector produces (north, east, up)-ish
+        Cartesian components of the horizon frame, with
+        x = cos(alt)cos(az), y = cos(alt)sin(az), z = sin(alt).
+    """
+    lon, lat, height = location.geodetic[:3]
+    geodetic = (lon.to_value(u.deg), lat.to_value(u.deg), height.to_value(u.m))
+    jd1 = np.asarray(times.jd1, dtype=np.float64).tobytes()
+    jd2 = np.asarray(times.jd2, dtype=np.float64).tobytes()
+    return _horizon_rotations(geodetic, times.scale, jd1, jd2)
+
+
+@lru_cache(maxsize=16)
+def _horizon_rotations(geodetic, scale, jd1, jd2):
+    """
+    Calculate (and cache) rotations, from hashable versions of the inputs.
+    """
+    lon, lat, height = geodetic
+    location = EarthLocation.from_geodetic(
+        lon=lon * u.deg, lat=lat * u.deg, height=height * u.m
+    )
+    times = Time(
+        np.frombuffer(jd1, dtype=np.float64),
+        np.frombuffer(jd2, dtype=np.float64),
+        format="jd",
+        scale=scale,
+    )
+    basis = SkyCoord(ra=[0, 90, 0] * u.deg, dec=[0, 0, 90] * u.deg)
+    frame = AltAz(obstime=times[np.newaxis, :], location=location, pressure=0)
+    horizon = basis[:, np.newaxis].transform_to(frame)
+    xyz = unit_vectors(horizon.az.deg, horizon.alt.deg)
+    # xyz has shape (3 basis vectors, N_times, 3 components)
+    rotations = np.transpose(xyz, (1, 2, 0))
+    # (everyone shares the cached copy, so nobody should change it)
+    rotations.flags.writeable = False
+    return rotations
+
+
+def airmass_from_altitude(altitude):
+    """
+    Estimate the airmass at a particular (geometric) altitude.
+
+    This uses the Pickering (2002) approximation, which
+    stays well-behaved near the horizon. Anything below
+    the horizon gets an infinite airmass.
+
+    Parameters
+    ----------
+    altitude : array
+        Altitude, in degrees.
+
+    Returns
+    -------
+    airmass : array
+        The airmass.
+    """
+    altitude = np.asarray(altitude)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        h = np.maximum(altitude, 0)
+        airmass = 1 / np.sin(np.radians(h + 244 / (165 + 47 * h**1.1)))
+    return np.where(altitude > 0, airmass, np.inf)
+
+
+def zenith(time="now", location=apo):
+    """
+    Find the sky position directly overhead.
+
+    Parameters
+    ----------
+    time : Time, str
+        The time (default is now).
+    location : EarthLocation
+        The location of the observatory.
+
+    Returns
+    -------
+    zenith : SkyCoord
+        The ICRS position of the zenith.
+    """
+    time = Time.now() if time == "now" else Time(time)
+    frame = AltAz(obstime=time, location=location, pressure=0)
+    return SkyCoord(alt=90 * u.deg, az=0 * u.deg, frame=frame).icrs
+
+
+class Night:
+    """
+    A grid of times, covering one night at APO.
+    """
+
+    def __init__(
+        self,
+        date=None,
+        cadence=10 * u.minute,
+        twilight=-12 * u.deg,
+        location=apo,
+    ):
+        """
+        Set up a time grid for the dark part of one night.
+
+        Parameters
+        ----------
+        date : str
+            The local date on which the night starts, like "2023-06-13".
+            Default is today (or rather, tonight).
+        cadence : Quantity
+            The spacing of the time grid.
+        twilight : Quantity
+            How far below the horizon the Sun must be for
+            times to count as night. Default is -12 deg
+            (nautical twilight).
+        location : EarthLocation
+            The location of the observatory.
+        """
+        if date is None:
+            date = (Time.now() + utc_offset).iso[:10]
+        self.date = date
+        self.cadence = cadence
+        self.twilight = twilight
+        self.location = location
+
+        # start from local noon, and step through the next 24 hours
+        noon = Time(f"{date} 12:00:00") - utc_offset
+        N = int(np.round((1 * u.day / cadence).decompose()))
+        day = noon + np.arange(N + 1) * cadence
+
+        # keep only the times when the Sun is low enough
+        sun = get_sun(day).transform_to(AltAz(obstime=day, location=location))
+        dark = np.nonzero(sun.alt < twilight)[0]
+        if len(dark) == 0:
+            raise ValueError(
+                f"Sorry! The Sun never gets below {twilight} on {date} at this location."
+            )
+        self.times = day[dark[0] : dark[-1] + 1]
+        self.sun_altitude = sun.alt[dark[0] : dark[-1] + 1]
+
+    def __repr__(self):
+        return (
+            f"<Night of {self.date} at APO, {self.start.iso[11:16]} to "
+            f"{self.end.iso[11:16]} UTC ({len(self)} times)>"
+        )
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def start(self):
+        return self.times[0]
+
+    @property
+    def end(self):
+        return self.times[-1]
+
+    @property
+    def rotations(self):
+        """
+        Cached ICRS-to-horizon rotation matrices for each time.
+        """
+        return horizon_rotations(self.times, location=self.location)
+
+
+class Observability:
+    """
+    Altitude, airmass, hour angle, and parallactic angle,
+    for every target in a catalog at every time in a night.
+    """
+
+    def __init__(self, catalog, night=None):
+        """
+        Calculate the positions of all targets throughout the night.
+
+        Parameters
+        ----------
+        catalog : TUICatalog
+            The catalog of targets.
+        night : Night
+            The night to consider. Default is tonight.
+        """
+        self.catalog = catalog
+        self.night = night or Night()
+
+        # rotate all (targets x times) in one broadcast operation
+        ra, dec = catalog._radec()
+        xyz = unit_vectors(ra, dec).astype(np.float32)
+        rotations = self.night.rotations.astype(np.float32)
+        horizon = np.einsum("tij,nj->nti", rotations, xyz)
+        x, y, z = horizon[..., 0], horizon[..., 1], horizon[..., 2]
+
+        # store as float32 arrays with shape (targets, times)
+        self.altitude = np.degrees(np.arcsin(np.clip(z, -1, 1)))
+        self.azimuth = np.degrees(np.arctan2(y, x)) % 360
+
+    def __repr__(self):
+        return f"<Observability of {self.catalog} on {self.night}>"
+
+    @property
+    def times(self):
+        return self.night.times
+
+    @property
+    def airmass(self):
+        """
+        The airmass, with shape (targets, times).
+        """
+        if not hasattr(self, "_airmass"):
+            self._airmass = airmass_from_altitude(self.altitude)
+        return self._airmass
+
+    def _equatorial(self):
+        """
+        Convert (alt, az) into apparent (hour angle, declination)
+        and the parallactic angle, all in radians.
+        """
+        if not hasattr(self, "_hour_angle"):
+            latitude = self.night.location.lat.radian
+            a = np.radians(self.altitude)
+            A = np.radians(self.azimuth)
+            sin_dec = np.sin(latitude) * np.sin(a) + np.cos(latitude) * np.cos(
+                a
+            ) * np.cos(A)
+            H = np.arctan2(
+                -np.sin(A) * np.cos(a),
+                np.cos(latitude) * np.sin(a) - np.sin(latitude) * np.cos(a) * np.cos(A),
+            )
+            dec = np.arcsin(np.clip(sin_dec, -1, 1))
+            q = np.arctan2(
+                np.sin(H),
+                np.tan(latitude) * np.cos(dec) - np.sin(dec) * np.cos(H),
+            )
+            self._hour_angle, self._parallactic_angle = H, q
+        return self._hour_angle, self._parallactic_angle
+
+    @property
+    def hour_angle(self):
+        """
+        The hour angle (in hours, from -12 to 12), with shape (targets, times).
+        """
+        return np.degrees(self._equatorial()[0]) / 15
+
+    @property
+    def parallactic_angle(self):
+        """
+        The parallactic angle (in degrees), with shape (targets, times).
+        """
+        return np.degrees(self._equatorial()[1])
+
+    def is_good(self, max_airmass=1.5):
+        """
+        Which (target, time) combinations have good enough airmass?
+
+        Parameters
+        ----------
+        max_airmass : float
+            The largest acceptable airmass.
+
+        Returns
+        -------
+        good : array
+            Boolean array with shape (targets, times).
+        """
+        return self.airmass < max_airmass
+
+    def hours_observable(self, max_airmass=1.5):
+        """
+        How long is each target below a particular airmass tonight?
+
+        Parameters
+        ----------
+        max_airmass : float
+            The largest acceptable airmass.
+
+        Returns
+        -------
+        duration : Quantity
+            The time each target spends below `max_airmass`.
+        """
+        n = np.sum(self.is_good(max_airmass), axis=1)
+        return (n * self.night.cadence).to(u.hour)
+
+    def observable(self, max_airmass=1.5, min_duration=2 * u.hour):
+        """
+        Which targets are observable for long enough tonight?
+
+        Parameters
+        ----------
+        max_airmass : float
+            The largest acceptable airmass.
+        min_duration : Quantity
+            The minimum time that must be spent below `max_airmass`.
+
+        Returns
+        -------
+        ok : array
+            Boolean array with one entry per target.
+        """
+        return self.hours_observable(max_airmass) >= min_duration
+
+    def filter(self, max_airmass=1.5, min_duration=2 * u.hour, name=None):
+        """
+        Make a new catalog of only the targets observable for long enough.
+
+        Parameters
+        ----------
+        max_airmass : float
+            The largest acceptable airmass.
+        min_duration : Quantity
+            The minimum time that must be spent below `max_airmass`.
+        name : str
+            The name of the new catalog. Default is the original's.
+
+        Returns
+        -------
+        catalog : TUICatalog
+            A new catalog containing only the observable targets.
+        """
+        ok = self.observable(max_airmass=max_airmass, min_duration=min_duration)
+        return self.catalog._subset(np.nonzero(ok)[0], name=name)
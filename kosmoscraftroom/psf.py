@@ -0,0 +1,309 @@
+"""
+Tools for measuring the seeing, by fitting many star profiles at once.
+
+Rather than fitting profiles one at a time, all of them are fit
+simultaneously with a batched Levenberg-Marquardt solver: the
+models, residuals, and Jacobians for every profile are arrays
+with an extra leading dimension, and each iteration solves all
+the little (parameters x parameters) linear systems together.
+Each profile keeps its own damping, so easy fits converge quickly
+without being held back by difficult ones.
+
+This works for 1D profiles (for example, the spatial profile of
+a spectrum at every wavelength, like loupe's `slicey`) and for
+2D cutouts around stars (for example, from acquisition images).
+"""
+import numpy as np
+import astropy.units as u
+from scipy.special import erf
+
+# FWHM = this * sigma, for a Gaussian
+gaussian_fwhm_per_sigma = 2 * np.sqrt(2 * np.log(2))
+
+
+def _gaussian(parameters, r2, offsets):
+    """
+    Evaluate a Gaussian (and its Jacobian) for a batch of profiles.
+
+    The parameters are [amplitude, *centers, sigma, background].
+    """
+    amplitude, sigma = parameters[:, :1], parameters[:, -2:-1]
+    e = np.exp(-0.5 * r2 / sigma**2)
+    model = amplitude * e + parameters[:, -1:]
+    jacobian = [e]
+    jacobian += [amplitude * e * d / sigma**2 for d in offsets]
+    jacobian += [amplitude * e * r2 / sigma**3, np.ones_like(e)]
+    return model, np.stack(jacobian, axis=-1)
+
+
+def _moffat(parameters, r2, offsets):
+    """
+    Evaluate a Moffat (and its Jacobian) for a batch of profiles.
+
+    The parameters are [amplitude, *centers, alpha, beta, background].
+    """
+    amplitude = parameters[:, :1]
+    alpha, beta = parameters[:, -3:-2], parameters[:, -2:-1]
+    q = 1 + r2 / alpha**2
+    f = q**-beta
+    g = amplitude * beta * f / q
+    model = amplitude * f + parameters[:, -1:]
+    jacobian = [f]
+    jacobian += [2 * g * d / alpha**2 for d in offsets]
+    jacobian += [2 * g * r2 / alpha**3, -amplitude * f * np.log(q)]
+    jacobian += [np.ones_like(f)]
+    return model, np.stack(jacobian, axis=-1)
+
+
+def levenberg_marquardt(evaluate, parameters, data, iterations=50, tolerance=1e-8):
+    """
+    Fit a batch of models to a batch of data, all at once.
+
+    Parameters
+    ----------
+    evaluate : function
+        A function that takes parameters with shape (N, P)
+        and returns the model with shape (N, M) and its
+        Jacobian with shape (N, M, P).
+    parameters : array
+        Initial guesses, with shape (N, P).
+    data : array
+        The data to fit, with shape (N, M). NaN values are ignored.
+    iterations : int
+        The maximum number of iterations.
+    tolerance : float
+        Fits stop improving once the fractional change in
+        chi-squared drops below this.
+
+    Returns
+    -------
+    parameters : array
+        The best-fit parameters, with shape (N, P).
+    chi2 : array
+        The sum of squared residuals for each fit.
+    converged : array
+        Did each fit converge?
+    """
+    parameters = np.array(parameters, dtype=np.float64)
+    good = np.isfinite(data)
+    data = np.where(good, data, 0)
+    N, P = parameters.shape
+    damping = np.full(N, 1e-3)
+    converged = np.zeros(N, dtype=bool)
+
+    model, jacobian = evaluate(parameters)
+    residuals = np.where(good, data - model, 0)
+    chi2 = np.sum(residuals**2, axis=1)
+    for _ in range(iterations):
+        active = ~converged
+        if not np.any(active):
+            break
+        J = jacobian[active] * good[active, :, np.newaxis]
+        JTJ = np.einsum("nmp,nmq->npq", J, J)
+        JTr = np.einsum("nmp,nm->np", J, residuals[active])
+
+        # damp the diagonal (Marquardt's scaling), and take a step
+        diagonal = np.einsum("npp->np", JTJ)
+        A = JTJ + (damping[active, np.newaxis] * diagonal + 1e-12)[
+            :, :, np.newaxis
+        ] * np.eye(P)
+        step = np.linalg.solve(A, JTr[:, :, np.newaxis])[:, :, 0]
+        trial = parameters[active] + step
+
+        # accept steps that help, and adjust the damping of each fit
+        trial_model, trial_jacobian = evaluate(trial)
+        trial_residuals = np.where(good[active], data[active] - trial_model, 0)
+        trial_chi2 = np.sum(trial_residuals**2, axis=1)
+        with np.errstate(invalid="ignore"):
+            better = np.isfinite(trial_chi2) & (trial_chi2 <= chi2[active])
+            change = (chi2[active] - trial_chi2) / np.maximum(chi2[active], 1e-300)
+        indices = np.nonzero(active)[0]
+        accepted = indices[better]
+        parameters[accepted] = trial[better]
+        model[accepted] = trial_model[better]
+        jacobian[accepted] = trial_jacobian[better]
+        residuals[accepted] = trial_residuals[better]
+        chi2[accepted] = trial_chi2[better]
+        damping[indices] = np.where(
+            better, damping[indices] / 10, np.minimum(damping[indices] * 10, 1e10)
+        )
+        converged[indices[better & (change < tolerance)]] = True
+        converged[indices[damping[indices] >= 1e10]] = True
+    return parameters, chi2, converged
+
+
+def _initial_guesses(data, coordinates):
+    """
+    Estimate amplitude, centers, width, and background from moments.
+    """
+    background = np.nanmin(data, axis=1)
+    above = np.clip(np.nan_to_num(data - background[:, np.newaxis]), 0, None)
+    total = np.maximum(np.sum(above, axis=1), 1e-300)
+    centers = [np.sum(above * c, axis=1) / total for c in coordinates]
+    r2 = sum((c - m[:, np.newaxis]) ** 2 for c, m in zip(coordinates, centers))
+    sigma = np.sqrt(np.sum(above * r2, axis=1) / total / len(coordinates))
+    amplitude = np.nanmax(data, axis=1) - background
+    return amplitude, centers, np.maximum(sigma, 0.5), background
+
+
+def _fit(data, coordinates, model="gaussian", iterations=50):
+    """
+    Fit circular Gaussians or Moffats to a batch of (flattened) profiles.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    amplitude, centers, sigma, background = _initial_guesses(data, coordinates)
+
+    def evaluate(parameters):
+        offsets = [
+            c - parameters[:, 1 + i, np.newaxis] for i, c in enumerate(coordinates)
+        ]
+        r2 = sum(d**2 for d in offsets)
+        if model == "gaussian":
+            return _gaussian(parameters, r2, offsets)
+        else:
+            return _moffat(parameters, r2, offsets)
+
+    if model == "gaussian":
+        guess = [amplitude, *centers, sigma, background]
+    elif model == "moffat":
+        beta = np.full_like(sigma, 3.0)
+        alpha = sigma * gaussian_fwhm_per_sigma / (2 * np.sqrt(2 ** (1 / beta) - 1))
+        guess = [amplitude, *centers, alpha, beta, background]
+    else:
+        raise ValueError('Sorry! `model` must be "gaussian" or "moffat".')
+    parameters, chi2, converged = levenberg_marquardt(
+        evaluate, np.transpose(guess), data, iterations=iterations
+    )
+
+    results = dict(amplitude=parameters[:, 0])
+    for i, k in enumerate(["x", "y"][: len(coordinates)]):
+        results[k] = parameters[:, 1 + i]
+    if model == "gaussian":
+        sigma = np.abs(parameters[:, -2])
+        results["fwhm"] = gaussian_fwhm_per_sigma * sigma
+    else:
+        alpha, beta = np.abs(parameters[:, -3]), parameters[:, -2]
+        results["fwhm"] = 2 * alpha * np.sqrt(2 ** (1 / beta) - 1)
+        results["beta"] = beta
+    results["background"] = parameters[:, -1]
+    results["chi2"] = chi2
+    results["converged"] = converged
+    return results
+
+
+def fit_profiles(profiles, x=None, model="gaussian", iterations=50):
+    """
+    Fit many 1D profiles at once.
+
+    For a spectrum displayed in `loupe` (indexed as [dispersion,
+    spatial]), passing the image itself fits the spatial profile
+    at every wavelength, exactly as `slicey` would show them.
+
+    Parameters
+    ----------
+    profiles : array
+        The profiles, with shape (N, M).
+    x : array
+        The M pixel positions. Default is 0, 1, 2, ...
+    model : str
+        "gaussian" or "moffat".
+    iterations : int
+        The maximum number of Levenberg-Marquardt iterations.
+
+    Returns
+    -------
+    results : dict
+        Arrays of `amplitude`, centroid `x`, `fwhm`, `background`
+        (and `beta` for Moffats), plus `chi2` and `converged`.
+    """
+    profiles = np.atleast_2d(profiles)
+    if x is None:
+        x = np.arange(profiles.shape[1])
+    return _fit(profiles, [np.asarray(x, dtype=np.float64)], model, iterations)
+
+
+def fit_cutouts(cutouts, model="gaussian", iterations=50):
+    """
+    Fit many 2D cutouts around stars at once, with circular profiles.
+
+    Parameters
+    ----------
+    cutouts : array
+        The cutouts, with shape (N, height, width).
+    model : str
+        "gaussian" or "moffat".
+    iterations : int
+        The maximum number of Levenberg-Marquardt iterations.
+
+    Returns
+    -------
+    results : dict
+        Arrays of `amplitude`, centroid `x` and `y` (in pixels
+        within each cutout), `fwhm`, `background` (and `beta`
+        for Moffats), plus `chi2` and `converged`.
+    """
+    cutouts = np.asarray(cutouts, dtype=np.float64)
+    N, height, width = cutouts.shape
+    y, x = np.mgrid[:height, :width]
+    return _fit(
+        cutouts.reshape(N, -1),
+        [x.ravel().astype(np.float64), y.ravel().astype(np.float64)],
+        model,
+        iterations,
+    )
+
+
+def make_cutouts(image, x, y, size=15):
+    """
+    Cut out little square images around positions, all at once.
+
+    Parameters
+    ----------
+    image : array
+        The image, indexed as [y, x].
+    x, y : array
+        The centers of the cutouts, in pixels.
+    size : int
+        The width of each (square) cutout.
+
+    Returns
+    -------
+    cutouts : array
+        The cutouts, with shape (N, size, size). Pixels
+        beyond the edge of the image are NaN.
+    corners : array
+        The (x, y) pixel of the lower-left corner of each cutout,
+        for converting centroids back into image coordinates.
+    """
+    image = np.asarray(image, dtype=np.float64)
+    padded = np.pad(image, size, constant_values=np.nan)
+    left = np.round(np.asarray(x)).astype(int) - size // 2
+    bottom = np.round(np.asarray(y)).astype(int) - size // 2
+    i = bottom[:, np.newaxis, np.newaxis] + np.arange(size)[:, np.newaxis] + size
+    j = left[:, np.newaxis, np.newaxis] + np.arange(size)[np.newaxis, :] + size
+    return padded[i, j], np.transpose([left, bottom])
+
+
+def slit_transmission(fwhm, width):
+    """
+    Estimate the fraction of a star's light that makes it through a slit.
+
+    This assumes a Gaussian seeing profile, centered on the slit.
+
+    Parameters
+    ----------
+    fwhm : Quantity, array
+        The FWHM of the seeing.
+    width : Quantity, float
+        The width of the slit (in the same units as `fwhm`).
+
+    Returns
+    -------
+    transmission : array
+        The fraction of the light passing through the slit.
+    """
+    sigma = fwhm / gaussian_fwhm_per_sigma
+    ratio = u.Quantity(width / (2 * np.sqrt(2) * sigma)).to_value(
+        u.dimensionless_unscaled
+    )
+    return erf(ratio)
@@ -0,0 +1,292 @@
+"""
+Tools for reading just the parts of FITS images that we need.
+
+Quicklook steps rarely need a whole frame: an extraction needs a
+band of rows around a trace, a bias estimate needs the overscan
+strip, and a cut needs one column. A `FITSReader` memory-maps the
+file, so the operating system only reads the bytes that actually
+get touched. `view` returns zero-copy views of the raw (stored)
+values, while `read` copies out just one region and applies any
+BZERO/BSCALE scaling to that region alone. Unsigned 16-bit data
+(stored as signed integers with BZERO = 32768) are converted with
+a cheap bit flip, rather than by going through floating point.
+
+Many regions (from one file or many) can be read concurrently
+with a pool of threads, with `read_many` or `read_regions`.
+"""
+import re
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+def parse_section(section):
+    """
+    Convert an IRAF-style section into slices for a numpy array.
+
+    Parameters
+    ----------
+    section : str
+        A section like "[2049:2080,1:4096]", as found in
+        header keywords like BIASSEC, DATASEC, or TRIMSEC.
+        These are 1-indexed, inclusive, and ordered [x,y].
+
+    Returns
+    -------
+    rows : slice
+        The rows (y) of the section.
+    columns : slice
+        The columns (x) of the section.
+    """
+    match = re.fullmatch(
+        r"\s*\[\s*(\d+)\s*:\s*(\d+)\s*,\s*(\d+)\s*:\s*(\d+)\s*\]\s*", section
+    )
+    if match is None:
+        raise ValueError(f"Sorry! {section!r} doesn't look like [x1:x2,y1:y2].")
+    x1, x2, y1, y2 = [int(x) for x in match.groups()]
+    columns = slice(min(x1, x2) - 1, max(x1, x2))
+    rows = slice(min(y1, y2) - 1, max(y1, y2))
+    return rows, columns
+
+
+class FITSReader:
+    """
+    A memory-mapped FITS image, from which regions can be read cheaply.
+    """
+
+    def __init__(self, filename, ext=None):
+        """
+        Open a FITS image (without reading any of its pixels yet).
+
+        Parameters
+        ----------
+        filename : str
+            The FITS file.
+        ext : int, str
+            The extension containing the image. Default is
+            the first extension that has 2D image data.
+        """
+        from astropy.io import fits
+
+        self.filename = filename
+        self.hdulist = fits.open(filename, memmap=True, do_not_scale_image_data=True)
+        if ext is None:
+            ext = next(
+                i
+                for i, hdu in enumerate(self.hdulist)
+                if hdu.is_image and hdu.header.get("NAXIS", 0) >= 2
+            )
+        self.ext = ext
+        self.header = self.hdulist[ext].header
+
+        # how are stored values scaled into physical values?
+        self.bzero = self.header.get("BZERO", 0)
+        self.bscale = self.header.get("BSCALE", 1)
+
+    def __repr__(self):
+        return f"<FITSReader {self.shape} of {self.filename}[{self.ext}]>"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Close the file (any views into it should no longer be used).
+        """
+        self.hdulist.close()
+
+    @property
+    def raw(self):
+        """
+        The memory-mapped stored values (no scaling applied).
+        """
+        return self.hdulist[self.ext].data
+
+    @property
+    def shape(self):
+        return tuple(
+            self.header[f"NAXIS{i}"] for i in range(self.header["NAXIS"], 0, -1)
+        )
+
+    @property
+    def unsigned(self):
+        """
+        Are these unsigned integers, stored as signed integers with an offset?
+        """
+        bitpix = self.header["BITPIX"]
+        return (bitpix > 8) and (self.bscale == 1) and (self.bzero == 2 ** (bitpix - 1))
+
+    def view(self, rows=slice(None), columns=slice(None)):
+        """
+        Get a zero-copy view of the stored (unscaled!) values in a region.
+
+        Parameters
+        ----------
+        rows : slice, int
+            The rows (y) of the region.
+        columns : slice, int
+            The columns (x) of the region.
+
+        Returns
+        -------
+        view : array
+            A view into the memory-mapped file.
+        """
+        return self.raw[rows, columns]
+
+    def read(self, rows=slice(None), columns=slice(None), dtype=None):
+        """
+        Read the physical values in a region.
+
+        Only the bytes inside the region are read
+        from disk, and only they get scaled.
+
+        Parameters
+        ----------
+        rows : slice, int
+            The rows (y) of the region.
+        columns : slice, int
+            The columns (x) of the region.
+        dtype : dtype
+            The data type of the result. Default is unsigned
+            integers for unsigned integer images, the stored
+            type for unscaled images, and float32 otherwise.
+
+        Returns
+        -------
+        data : array
+            A fresh (native byte order) array of the region.
+        """
+        stored = self.view(rows, columns)
+        if self.unsigned:
+            # flip the sign bit, instead of adding BZERO in floating point
+            unsigned = stored.dtype.str.replace("i", "u")
+            flip = np.array(self.bzero, dtype=unsigned)
+            data = np.bitwise_xor(stored.view(unsigned), flip)
+        elif (self.bscale == 1) and (self.bzero == 0):
+            data = stored.astype(stored.dtype.newbyteorder("="))
+        else:
+            data = stored * np.float32(self.bscale) + np.float32(self.bzero)
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+        return data
+
+    def row(self, i, **kwargs):
+        """
+        Read one row.
+        """
+        return self.read(i, slice(None), **kwargs)
+
+    def column(self, i, **kwargs):
+        """
+        Read one column.
+        """
+        return self.read(slice(None), i, **kwargs)
+
+    def band(self, center, width, axis=0, **kwargs):
+        """
+        Read a band of rows (or columns), like the region around a trace.
+
+        Parameters
+        ----------
+        center : int
+            The middle row (or column) of the band.
+        width : int
+            The total number of rows (or columns) in the band.
+        axis : int
+            0 for a band of rows, 1 for a band of columns.
+        **kwargs : dict
+            Passed to `read`.
+
+        Returns
+        -------
+        data : array
+            The band.
+        """
+        start = max(int(round(center - width / 2)), 0)
+        band = slice(start, start + int(width))
+        if axis == 0:
+            return self.read(band, slice(None), **kwargs)
+        else:
+            return self.read(slice(None), band, **kwargs)
+
+    def section(self, keyword, **kwargs):
+        """
+        Read a section named by a header keyword.
+
+        Parameters
+        ----------
+        keyword : str
+            A header keyword containing an IRAF-style section,
+            like "BIASSEC", "DATASEC", or "TRIMSEC".
+        **kwargs : dict
+            Passed to `read`.
+
+        Returns
+        -------
+        data : array
+            The section.
+        """
+        return self.read(*parse_section(self.header[keyword]), **kwargs)
+
+    def overscan(self, keyword="BIASSEC", **kwargs):
+        """
+        Read the overscan strip.
+        """
+        return self.section(keyword, **kwargs)
+
+    def read_many(self, regions, max_workers=8, **kwargs):
+        """
+        Read many regions of this image at once, with a pool of threads.
+
+        Parameters
+        ----------
+        regions : list
+            Pairs of (rows, columns).
+        max_workers : int
+            The number of threads.
+        **kwargs : dict
+            Passed to `read`.
+
+        Returns
+        -------
+        data : list
+            The regions, in the same order.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda r: self.read(*r, **kwargs), regions))
+
+
+def read_regions(
+    filenames, rows=slice(None), columns=slice(None), max_workers=8, **kwargs
+):
+    """
+    Read the same region from many FITS files at once, with a pool of threads.
+
+    Parameters
+    ----------
+    filenames : list
+        The FITS files.
+    rows : slice, int
+        The rows (y) of the region.
+    columns : slice, int
+        The columns (x) of the region.
+    max_workers : int
+        The number of threads.
+    **kwargs : dict
+        Passed to `FITSReader.read` (for example, `dtype`).
+
+    Returns
+    -------
+    data : list
+        The region from each file, in the same order.
+    """
+
+    def read(filename):
+        with FITSReader(filename) as reader:
+            return reader.read(rows, columns, **kwargs)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(read, filenames))
@@ -0,0 +1,458 @@
+"""
+Tools for putting a night's targets into a sensible order.
+
+The scheduler works on the (targets x times) grid calculated
+by `Observability`, so checking whether a target is at good
+airmass over an exposure is just a couple of array lookups.
+A greedy pass builds a sequence by repeatedly choosing the
+target that's cheapest to move to next (while favoring targets
+that are about to set), and then a windowed 2-opt pass reverses
+short stretches of the sequence whenever that gets through them
+sooner without losing any targets.
+"""
+import time
+import numpy as np
+import astropy.units as u
+from astropy.table import Table
+
+from .observability import Observability
+
+
+class Scheduler:
+    """
+    Order targets for a night, accounting for slews and overheads.
+    """
+
+    # rough ARC 3.5m overheads (in seconds, or degrees per second)
+    slew_rate = 1.5
+    rotator_rate = 2.0
+    settle_time = 30.0
+    acquisition_time = 180.0
+    calibration_time = 120.0
+
+    def __init__(
+        self,
+        catalog,
+        exposure_times,
+        night=None,
+        max_airmass=1.5,
+        observability=None,
+        **overheads,
+    ):
+        """
+        Set up the scheduling problem.
+
+        Parameters
+        ----------
+        catalog : TUICatalog
+            The catalog of candidate targets.
+        exposure_times : Quantity, dict
+            The total time to spend on each target, either as a
+            single Quantity, an array with one entry per row of the
+            catalog, or a dictionary of {name: Quantity}.
+        night : Night
+            The night to schedule. Default is tonight.
+        max_airmass : float
+            The largest airmass at which we're willing to observe.
+        observability : Observability
+            Precalculated observability for this catalog and night,
+            if one is already handy.
+        **overheads : dict
+            Overrides for any of the class-level overheads
+            (`slew_rate`, `rotator_rate`, `settle_time`,
+            `acquisition_time`, `calibration_time`).
+        """
+        for k, v in overheads.items():
+            if not hasattr(Scheduler, k):
+                raise ValueError(f"{k} is not a recognized overhead.")
+            setattr(self, k, v)
+
+        self.catalog = catalog
+        self.observability = observability or Observability(catalog, night)
+        self.night = self.observability.night
+        self.max_airmass = max_airmass
+
+        # figure out the exposure time for each target, in seconds
+        N = len(catalog.table)
+        if isinstance(exposure_times, dict):
+            names = catalog.table["names"]
+            self.exposure = np.array(
+                [exposure_times[n].to_value(u.s) for n in names], dtype=float
+            )
+        else:
+            self.exposure = np.broadcast_to(
+                u.Quantity(exposure_times).to_value(u.s), (N,)
+            ).astype(float)
+
+        # pull out the grids we need (all with shape (targets, times))
+        o = self.observability
+        self.cadence = self.night.cadence.to_value(u.s)
+        self.airmass = o.airmass
+        self.azimuth = o.azimuth
+        self.altitude = o.altitude
+        self.parallactic_angle = o.parallactic_angle
+        self.good = o.is_good(max_airmass)
+        self._find_runs()
+
+    def __repr__(self):
+        return f"<Scheduler for {self.catalog} on {self.night}>"
+
+    def _find_runs(self):
+        """
+        For each (target, time), record the next good time
+        and the last time of the current run of good times.
+        """
+        good = self.good
+        N, T = good.shape
+        self.next_good = np.full((N, T + 1), T)
+        self.run_end = np.full((N, T + 1), -1)
+        for i in range(T - 1, -1, -1):
+            self.next_good[:, i] = np.where(good[:, i], i, self.next_good[:, i + 1])
+            self.run_end[:, i] = np.where(
+                good[:, i], np.maximum(self.run_end[:, i + 1], i), -1
+            )
+
+    def _index(self, t):
+        """
+        Convert seconds since the start of the night into a grid index.
+        """
+        return np.minimum((np.asarray(t) // self.cadence).astype(int), self.T)
+
+    @property
+    def T(self):
+        return self.good.shape[1]
+
+    def overhead(self, previous, targets, t):
+        """
+        How long does it take to get set up on targets?
+
+        Parameters
+        ----------
+        previous : int
+            The index of the target we're currently on (or None).
+        targets : array
+            The indices of the targets we might go to next.
+        t : float
+            The current time, in seconds since the start of the night.
+
+        Returns
+        -------
+        overhead : array
+            The time (in seconds) before we can start exposing.
+        """
+        fixed = self.acquisition_time + self.calibration_time
+        if previous is None:
+            return np.full(np.shape(targets), fixed)
+        i = min(int(t // self.cadence), self.T - 1)
+        daz = np.abs(
+            (self.azimuth[targets, i] - self.azimuth[previous, i] + 180) % 360 - 180
+        )
+        dalt = np.abs(self.altitude[targets, i] - self.altitude[previous, i])
+        drot = np.abs(
+            (
+                self.parallactic_angle[targets, i]
+                - self.parallactic_angle[previous, i]
+                + 90
+            )
+            % 180
+            - 90
+        )
+        slew = np.maximum(daz, dalt) / self.slew_rate + self.settle_time
+        rotate = drot / self.rotator_rate
+        return fixed + np.maximum(slew, rotate)
+
+    def earliest_start(self, targets, t):
+        """
+        Find the earliest time each target's exposure could start.
+
+        An exposure can only start once the target is below
+        the maximum airmass, and it must stay there until
+        the exposure finishes. This might mean waiting.
+
+        Parameters
+        ----------
+        targets : array
+            The indices of the targets.
+        t : array
+            The earliest possible start time (in seconds).
+
+        Returns
+        -------
+        start : array
+            The earliest start time (in seconds), or infinity
+            if the target can't be fit in tonight.
+        """
+        targets = np.atleast_1d(targets)
+        start = np.broadcast_to(np.asarray(t, dtype=float), targets.shape).copy()
+        done = np.zeros(targets.shape, dtype=bool)
+        fits = np.zeros(targets.shape, dtype=bool)
+        for _ in range(self.T):
+            i = self._index(start)
+            i_next = self.next_good[targets, i]
+            start = np.where(i_next > i, i_next * self.cadence, start)
+            i = np.minimum(i_next, self.T)
+            finish = self._index(start + self.exposure[targets])
+            fits = (finish < self.T) & (self.run_end[targets, i] >= finish)
+            done |= fits | (i >= self.T)
+            start = np.where(
+                fits | done, start, (self.run_end[targets, i] + 1) * self.cadence
+            )
+            if np.all(done):
+                break
+        return np.where(fits, start, np.inf)
+
+    def _step(self, previous, target, t):
+        """
+        Move to one target and observe it, starting at time t.
+
+        Returns the (start, end) of the exposure, in seconds,
+        or (inf, inf) if it can't be observed.
+        """
+        arrive = t + self.overhead(previous, target, t)
+        start = self.earliest_start(target, arrive)[0]
+        return start, start + self.exposure[target]
+
+    def greedy(self, urgency=0.05, airmass_weight=600.0):
+        """
+        Build a sequence by always picking the best next target.
+
+        Parameters
+        ----------
+        urgency : float
+            How much (in seconds per second) to favor targets
+            whose window of good airmass is closing soon.
+        airmass_weight : float
+            How much (in seconds per unit airmass) to favor
+            targets at lower airmass.
+
+        Returns
+        -------
+        order : list
+            The indices of the targets, in the order to observe them.
+        """
+        remaining = np.arange(len(self.exposure))
+        order = []
+        t, previous = 0.0, None
+        while len(remaining) > 0:
+            arrive = t + self.overhead(previous, remaining, t)
+            start = self.earliest_start(remaining, arrive)
+            feasible = np.isfinite(start)
+            if not np.any(feasible):
+                break
+            candidates, start = remaining[feasible], start[feasible]
+            end = start + self.exposure[candidates]
+            i_end = self._index(end)
+            slack = (self.run_end[candidates, i_end] + 1) * self.cadence - end
+            i_start = self._index(start)
+            cost = (
+                (start - t)
+                + urgency * slack
+                + airmass_weight * (self.airmass[candidates, i_start] - 1)
+            )
+            best = np.argmin(cost)
+            previous, t = candidates[best], end[best]
+            order.append(previous)
+            remaining = remaining[remaining != previous]
+        return order
+
+    def simulate(self, order):
+        """
+        Step through a sequence, calculating when each target is observed.
+
+        Targets that can't be fit in are skipped.
+
+        Parameters
+        ----------
+        order : list
+            The indices of the targets, in order.
+
+        Returns
+        -------
+        observed : list
+            The indices of the targets actually observed.
+        starts, ends : list
+            The start and end of each observation, in seconds.
+        """
+        observed, starts, ends = [], [], []
+        t, previous = 0.0, None
+        for target in order:
+            start, end = self._step(previous, target, t)
+            if np.isfinite(start):
+                observed.append(target)
+                starts.append(start)
+                ends.append(end)
+                t, previous = end, target
+        return observed, starts, ends
+
+    def improve(self, order, window=10, max_seconds=5.0):
+        """
+        Polish a sequence with windowed 2-opt moves.
+
+        A stretch of the sequence is reversed if doing so keeps all of
+        its targets (and the one after it) observable while finishing
+        that next target sooner. Because waiting is allowed, finishing
+        sooner can never make the rest of the sequence worse, so each
+        move only needs to be checked locally.
+
+        Parameters
+        ----------
+        order : list
+            The indices of the targets, in order (all observable).
+        window : int
+            The longest stretch to consider reversing.
+        max_seconds : float
+            The maximum wall-clock time to spend.
+
+        Returns
+        -------
+        order : list
+            The improved sequence.
+        """
+        order = list(order)
+        clock = time.time()
+        improved = True
+        while improved and (time.time() - clock < max_seconds):
+            improved = False
+            observed, starts, ends = self.simulate(order)
+            ends = [0.0] + ends
+            for i in range(len(order) - 1):
+                for j in range(i + 1, min(i + window, len(order))):
+                    # try reversing order[i:j+1], then check through j+1 (if any)
+                    after = order[j + 1 : j + 2]
+                    candidate = order[i : j + 1][::-1] + after
+                    t = ends[i]
+                    previous = order[i - 1] if i > 0 else None
+                    for target in candidate:
+                        _, t = self._step(previous, target, t)
+                        previous = target
+                        if not np.isfinite(t):
+                            break
+                    if t < ends[j + 1 + len(after)] - 1e-6:
+                        trial = order[:i] + order[i : j + 1][::-1] + order[j + 1 :]
+                        observed, starts, trial_ends = self.simulate(trial)
+                        if len(observed) == len(order):
+                            order, ends = trial, [0.0] + trial_ends
+                            improved = True
+                if time.time() - clock > max_seconds:
+                    break
+        return order
+
+    def schedule(self, urgency=0.05, airmass_weight=600.0, window=10, max_seconds=5.0):
+        """
+        Make a schedule for the night.
+
+        Parameters
+        ----------
+        urgency : float
+            How much (in seconds per second) to favor targets
+            whose window of good airmass is closing soon.
+        airmass_weight : float
+            How much (in seconds per unit airmass) to favor
+            targets at lower airmass.
+        window : int
+            The longest stretch to consider reversing in 2-opt.
+        max_seconds : float
+            The maximum wall-clock time to spend on 2-opt.
+
+        Returns
+        -------
+        schedule : Schedule
+            The ordered sequence of observations.
+        """
+        order = self.greedy(urgency=urgency, airmass_weight=airmass_weight)
+        order = self.improve(order, window=window, max_seconds=max_seconds)
+        observed, starts, ends = self.simulate(order)
+        return Schedule(self, observed, starts, ends)
+
+
+class Schedule:
+    """
+    An ordered sequence of observations for one night.
+    """
+
+    def __init__(self, scheduler, order, starts, ends):
+        """
+        Store the results of a Scheduler.
+
+        Parameters
+        ----------
+        scheduler : Scheduler
+            The scheduler that made this schedule.
+        order : list
+            The indices of the catalog targets, in order.
+        starts, ends : list
+            The start and end of each observation,
+            in seconds since the start of the night.
+        """
+        self.scheduler = scheduler
+        self.order = np.array(order, dtype=int)
+        night_start = scheduler.night.start
+        self.starts = night_start + np.array(starts) * u.s
+        self.ends = night_start + np.array(ends) * u.s
+        i = scheduler._index(np.array(starts, dtype=float))
+        self.airmass = scheduler.airmass[self.order, i]
+
+    def __repr__(self):
+        N = len(self.scheduler.exposure)
+        return f"<Schedule of {len(self.order)}/{N} targets on {self.scheduler.night}>"
+
+    def __len__(self):
+        return len(self.order)
+
+    @property
+    def skipped(self):
+        """
+        The indices of targets that didn't fit into the night.
+        """
+        return np.setdiff1d(np.arange(len(self.scheduler.exposure)), self.order)
+
+    def summary(self):
+        """
+        Make a table summarizing the schedule.
+
+        Returns
+        -------
+        table : Table
+            One row per observation, in order.
+        """
+        table = self.scheduler.catalog.table
+        return Table(
+            dict(
+                names=table["names"][self.order],
+                start=[t.iso[11:19] for t in self.starts],
+                end=[t.iso[11:19] for t in self.ends],
+                airmass=np.round(self.airmass, 2),
+            )
+        )
+
+    def to_catalog(self, name=None):
+        """
+        Make a new catalog, with the targets in scheduled order.
+
+        Parameters
+        ----------
+        name : str
+            The name of the new catalog.
+
+        Returns
+        -------
+        catalog : TUICatalog
+            A catalog of the scheduled targets, in order.
+        """
+        catalog = self.scheduler.catalog
+        return catalog._subset(
+            self.order, name=name or f"{catalog.name}-{self.scheduler.night.date}"
+        )
+
+    def to_TUI(self, name=None, **kwargs):
+        """
+        Write the schedule out as a TUI catalog, in scheduled order.
+
+        Parameters
+        ----------
+        name : str
+            The name of the catalog (and file).
+        **kwargs : dict
+            Keyword arguments are passed to `TUICatalog.to_TUI`.
+        """
+        self.to_catalog(name=name).to_TUI(**kwargs)
@@ -1,5 +1,4 @@
 import numpy as np
-import pyperclip as pc
 
 
 class ScriptWriter:
@@ -14,11 +13,17 @@ class ScriptWriter:
     )
     reference_slit_width = 2.0
 
+    # rough overheads (in seconds) for planning the order of calibrations
+    slit_move_time = 15.0
+    disperser_move_time = 30.0
+    lamp_warmup_time = 30.0
+
     def __init__(
         self,
         slits={"7.1-ctr": 1, "1.18-ctr": 2},
         dispersers={"red": 6, "blue": 3},
         binning=[2, 2],
+        planning=False,
     ):
         """
         Initialize the basic script setup.
@@ -31,8 +36,15 @@ class ScriptWriter:
             List of disperser names for which calibrations are wanted.
         binning : list
             List of binning in x + y pixel directions ([xbinning, ybinning])
+        planning : bool
+            If True, `take_lamps` and `take_bias` only queue up
+            calibrations, and `write_plan` then writes them all
+            out in whichever order needs the fewest mechanism
+            moves and lamp switches.
         """
         self.lines = []
+        self.planning = planning
+        self.queue = []
 
         print("Assuming dispersers to calibrate are...")
         for k, v in dispersers.items():
@@ -105,6 +117,80 @@ class ScriptWriter:
         """
         return float(s.split("-")[0])
 
+    def estimate_slit_losses(self, fwhm, pixel_scale=None):
+        """
+        Estimate how much light each slit would lose, for some seeing.
+
+        This assumes a Gaussian seeing profile, centered on the slit.
+
+        Parameters
+        ----------
+        fwhm : Quantity, array
+            The FWHM of the seeing (in angle, or in pixels if
+            `pixel_scale` is given), for example from
+            `psf.fit_cutouts` or `psf.fit_profiles`. Several
+            measurements are summarized by their median.
+        pixel_scale : Quantity
+            The angular size of a pixel, if `fwhm` is in pixels.
+
+        Returns
+        -------
+        losses : dict
+            The fraction of light lost, for each slit name.
+        """
+        import astropy.units as u
+        from .psf import slit_transmission
+
+        if pixel_scale is not None:
+            fwhm = np.asarray(fwhm) * pixel_scale
+        fwhm = np.nanmedian(u.Quantity(fwhm).to_value(u.arcsec))
+        losses = {}
+        for slit_name in self.slits:
+            slit_width = self.guess_slit_width(slit_name)
+            losses[slit_name] = 1 - slit_transmission(fwhm, slit_width)
+        return losses
+
+    def lamp_exposure_time(self, lamp, slit_name, disperser_name):
+        """
+        Scale the suggested exposure time for a lamp to a slit and binning.
+
+        Parameters
+        ----------
+        lamp : str
+            The lamp.
+        slit_name : str
+            The name of the slit.
+        disperser_name : str
+            The name of the disperser.
+        """
+        binning_factor = 1 / np.prod(self.binning)
+        slit_width = self.guess_slit_width(slit_name)
+        slit_factor = self.reference_slit_width / slit_width
+        return (
+            self.suggested_exposure_times[disperser_name][lamp]
+            * binning_factor
+            * slit_factor
+        )
+
+    def lamp_filename(self, lamp, slit_name, disperser_name, note=""):
+        """
+        Make the filename for a lamp calibration.
+        """
+        filename = f"{self.binning_string()}/cals/{disperser_name}-{slit_name}-{lamp}"
+        if note != "":
+            filename += f"-{note}"
+        return filename
+
+    def lamps_command(self, lamp=None):
+        """
+        Make the command that turns on one lamp (or None) and the rest off.
+        """
+        s = "kosmos set calstage=in"
+        for l in self.available_lamps:
+            onoff = {True: "on", False: "off"}[l == lamp]
+            s += f" {l}={onoff}"
+        return s
+
     def take_lamps(self, lamp, n=3, note=""):
         """
         Take calibrations with lamps.
@@ -118,40 +204,26 @@ class ScriptWriter:
         note : str
             An extra note to add to the filename.
         """
+        if self.planning:
+            self.queue.append(dict(kind="lamp", lamp=lamp, n=n, note=note))
+            return
 
         # turn off all lamps but the active one
         self.comment(f"taking {n} {lamp} calibrations")
-
-        s = "kosmos set calstage=in"
-        for l in self.available_lamps:
-            onoff = {True: "on", False: "off"}[l == lamp]
-            s += f" {l}={onoff}"
-        self.say(s)
-
-        binning_factor = 1 / np.product(self.binning)
+        self.say(self.lamps_command(lamp))
 
         for i_slit, slit_name in enumerate(self.slits):
             slit_number = self.slits[slit_name]
-            slit_width = self.guess_slit_width(slit_name)
-            slit_factor = self.reference_slit_width / slit_width
 
             for i_disperser, disperser_name in enumerate(self.dispersers):
                 disperser_number = self.dispersers[disperser_name]
-                t = (
-                    self.suggested_exposure_times[disperser_name][lamp]
-                    * binning_factor
-                    * slit_factor
-                )
+                t = self.lamp_exposure_time(lamp, slit_name, disperser_name)
 
                 self.say(
                     f"# lamp {lamp}, slit={slit_name} ({i_slit+1}/{len(self.slits)}), disperser={disperser_name} ({i_disperser+1}/{len(self.dispersers)}),  {n} iterations"
                 )
                 self.say(f"kosmos set slit={slit_number} disperser={disperser_number}")
-                filename = (
-                    f"{self.binning_string()}/cals/{disperser_name}-{slit_name}-{lamp}"
-                )
-                if note != "":
-                    filename += f"-{note}"
+                filename = self.lamp_filename(lamp, slit_name, disperser_name, note)
                 self.say(
                     f'kosmosExpose flat time={t:.2f} n={n} name="{filename}" seq=nextByDir comment=""'
                 )
@@ -161,6 +233,10 @@ class ScriptWriter:
         self.say()
 
     def take_bias(self, n=10):
+        if self.planning:
+            self.queue.append(dict(kind="bias", n=n))
+            return
+
         self.comment(f"taking {n} bias calibrations")
         self.say(f"kosmos set calstage=in neon=off krypton=off argon=off quartz=off")
         self.say(
@@ -168,11 +244,176 @@ class ScriptWriter:
         )
         self.say()
 
+    def plan_steps(self, order="config"):
+        """
+        Order the queued calibrations into a list of individual exposures.
+
+        Parameters
+        ----------
+        order : str
+            "lamp" does each queued lamp through every slit and
+            disperser in turn (the order `take_lamps` uses).
+            "config" visits each slit + disperser combination once,
+            in a snake through the dispersers, cycling through all
+            lamps at each stop (reversing the lamp order each time,
+            so the last lamp at one stop is the first at the next).
+            Biases come first either way, while the lamps are off.
+
+        Returns
+        -------
+        steps : list
+            Dictionaries describing each exposure.
+        """
+        biases = [q for q in self.queue if q["kind"] == "bias"]
+        lamps = [q for q in self.queue if q["kind"] == "lamp"]
+        slits, dispersers = list(self.slits), list(self.dispersers)
+
+        steps = [dict(q, lamp=None, slit=None, disperser=None) for q in biases]
+        if order == "lamp":
+            for q in lamps:
+                for slit_name in slits:
+                    for disperser_name in dispersers:
+                        steps.append(dict(q, slit=slit_name, disperser=disperser_name))
+        elif order == "config":
+            configurations = []
+            for i_slit, slit_name in enumerate(slits):
+                for disperser_name in dispersers[:: (-1) ** i_slit]:
+                    configurations.append((slit_name, disperser_name))
+            for i_config, (slit_name, disperser_name) in enumerate(configurations):
+                for q in lamps[:: (-1) ** i_config]:
+                    steps.append(dict(q, slit=slit_name, disperser=disperser_name))
+        else:
+            raise ValueError('Sorry! `order` must be "lamp" or "config".')
+        return steps
+
+    def plan_lines(self, steps, order=""):
+        """
+        Turn a list of exposures into the lines of a script.
+
+        Only the things that change between exposures are set,
+        so each configuration and each lamp is set just once
+        for every run of exposures that share it.
+
+        Parameters
+        ----------
+        steps : list
+            Exposures, from `plan_steps`.
+        order : str
+            The name of the order, for the comment at the top.
+
+        Returns
+        -------
+        lines : list
+            The commands (and comments) for the script.
+        """
+        lines = [f"#{len(steps)} calibration exposures, in {order} order"]
+
+        # keep track of the state, so we only say what needs to change
+        lamp, slit, disperser = "unknown", None, None
+        for step in steps:
+            if step["kind"] == "bias":
+                if lamp is not None:
+                    lamp = None
+                    lines.append(self.lamps_command(None))
+                lines.append(
+                    f'kosmosExpose bias n={step["n"]} name="{self.binning_string()}/cals/bias" seq=nextByDir comment=""'
+                )
+                continue
+            if (step["slit"], step["disperser"]) != (slit, disperser):
+                slit, disperser = step["slit"], step["disperser"]
+                lines.append("")
+                lines.append(f"#slit={slit}, disperser={disperser}")
+                lines.append(
+                    f"kosmos set slit={self.slits[slit]} disperser={self.dispersers[disperser]}"
+                )
+            if step["lamp"] != lamp:
+                lamp = step["lamp"]
+                lines.append(self.lamps_command(lamp))
+            t = self.lamp_exposure_time(lamp, slit, disperser)
+            filename = self.lamp_filename(lamp, slit, disperser, step["note"])
+            lines.append(
+                f'kosmosExpose flat time={t:.2f} n={step["n"]} name="{filename}" seq=nextByDir comment=""'
+            )
+
+        lines.append("#turning off lamps")
+        lines.append(self.lamps_command(None))
+        lines.append("")
+        return lines
+
+    def timer(self):
+        """
+        Make a ScriptTimer with the same overheads as this ScriptWriter.
+
+        Returns
+        -------
+        timer : ScriptTimer
+            A timer, for estimating how long scripts will take.
+        """
+        from .timing import ScriptTimer
+
+        return ScriptTimer(
+            slit_move_time=self.slit_move_time,
+            disperser_move_time=self.disperser_move_time,
+            lamp_warmup_time=self.lamp_warmup_time,
+        )
+
+    def estimate_duration(self):
+        """
+        Estimate how long the script (so far) will take to run.
+
+        Returns
+        -------
+        total : float
+            The estimated duration, in seconds.
+        timeline : Table
+            The start, duration, and end of each command.
+        """
+        return self.timer().simulate(self.lines)
+
+    def write_plan(self, order="best"):
+        """
+        Write out all the queued calibrations, in an efficient order.
+
+        Parameters
+        ----------
+        order : str
+            "lamp" or "config" (see `plan_steps`), or "best" to
+            pick whichever the `timer` says will finish soonest.
+
+        Returns
+        -------
+        savings : float
+            The time saved (in seconds) compared to
+            the lamp-by-lamp order of `take_lamps`.
+        """
+        # simulate the script with each order, to see which is fastest
+        timer = self.timer()
+        plans = {o: self.plan_lines(self.plan_steps(o), o) for o in ["lamp", "config"]}
+        durations = {o: timer.duration(self.lines + plans[o]) for o in plans}
+        durations = {o: durations[o] - timer.duration(self.lines) for o in plans}
+        if order == "best":
+            order = min(durations, key=durations.get)
+        for line in plans[order]:
+            self.say(line)
+        self.queue = []
+
+        savings = durations["lamp"] - durations[order]
+        print(
+            f"""
+        These calibrations should take about {durations[order]/60:.1f} minutes
+        ({order} order), instead of {durations['lamp']/60:.1f} minutes (lamp order),
+        saving about {savings/60:.1f} minutes of the afternoon.
+        """
+        )
+        return savings
+
     def print(self):
         s = "\n".join(self.lines)
         print(s)
 
     def copy(self):
+        import pyperclip as pc
+
         s = "\n".join(self.lines)
         pc.copy(s)
         print(
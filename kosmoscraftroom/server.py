@@ -0,0 +1,516 @@
+"""
+A long-lived quicklook server, so clients don't start from scratch.
+
+Importing astropy and matplotlib, connecting to the Gaia store,
+and reading images all take time that a notebook or a terminal
+command pays again on every run. A `QuicklookServer` pays it
+once, keeps everything warm in memory (the Gaia store, images
+it has read, and the display limits it has computed for them),
+and then answers requests over a local socket in milliseconds.
+
+The protocol is one line of JSON per request and one line of
+JSON per reply, over a Unix socket (by default) or a localhost
+TCP port. Each request looks like
+
+    {"action": "thumbnail", "filename": "frame.fits", "size": 256}
+
+and each reply looks like
+
+    {"ok": true, "result": ..., "seconds": 0.003}
+
+or, if something went wrong,
+
+    {"ok": false, "error": "...", "seconds": 0.001}
+
+A `QuicklookClient` hides all this behind simple methods. New
+actions can be added to a server with `register`. To run a
+server from the terminal, use `python -m kosmoscraftroom.server`.
+"""
+import os
+import io
+import json
+import time
+import base64
+import importlib
+import socket
+import threading
+import socketserver
+import numpy as np
+
+# where the server listens, unless we say otherwise
+default_address = os.path.join(
+    os.path.expanduser("~"), ".kosmoscraftroom", "quicklook.sock"
+)
+
+
+def _is_unix(address):
+    """
+    Is this the address of a Unix socket (a path), rather than (host, port)?
+    """
+    return isinstance(address, str)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """
+    Answer JSON-line requests on one connection, until the client hangs up.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if line.strip() == b"":
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as error:
+                reply = dict(ok=False, error=f"Sorry! Couldn't parse JSON ({error}).")
+            else:
+                reply = self.server.quicklook.handle(request)
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+            self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class QuicklookServer:
+    """
+    A server that keeps quicklook tools warm, and answers requests over a socket.
+    """
+
+    # the most images to keep in memory at once
+    max_images = 32
+
+    # slow modules to import before the first request arrives
+    warm_modules = [
+        "astropy.units",
+        "astropy.io.fits",
+        "matplotlib.image",
+        "kosmoscraftroom.finder",
+        "kosmoscraftroom.timing",
+    ]
+
+    def __init__(self, address=default_address, store=None):
+        """
+        Set up a server (but don't start listening yet).
+
+        Parameters
+        ----------
+        address : str, tuple
+            A path for a Unix socket, or a (host, port) for
+            TCP. Please only use "localhost" for the host;
+            there is no authentication!
+        store : GaiaStore
+            The local store from which to get Gaia stars.
+            Default is the shared store.
+        """
+        self.address = address
+        self.store = store
+        self.server = None
+        self.thread = None
+
+        # one request at a time touches the caches
+        self.lock = threading.Lock()
+
+        # images (and their display limits), keyed by filename
+        self.images = {}
+
+        # the actions this server knows how to do
+        self.actions = {}
+        self.register("ping", self.ping)
+        self.register("actions", self.list_actions)
+        self.register("thumbnail", self.thumbnail)
+        self.register("finder", self.finder)
+        self.register("time_script", self.time_script)
+
+    def __repr__(self):
+        status = "listening" if self.server is not None else "not listening"
+        return f"<QuicklookServer at {self.address} ({status})>"
+
+    def register(self, action, function):
+        """
+        Teach the server a new action.
+
+        Parameters
+        ----------
+        action : str
+            The name clients use to ask for this action.
+        function : callable
+            A function that takes the request's parameters
+            as keywords, and returns something JSON can encode.
+        """
+        self.actions[action] = function
+
+    def handle(self, request):
+        """
+        Answer one request.
+
+        Parameters
+        ----------
+        request : dict
+            The request, with an "action" and any parameters.
+
+        Returns
+        -------
+        reply : dict
+            The reply, with "ok", "seconds", and either
+            "result" or "error".
+        """
+        start = time.perf_counter()
+        parameters = dict(request)
+        action = parameters.pop("action", None)
+        try:
+            if action not in self.actions:
+                raise ValueError(
+                    f"Sorry! {action!r} isn't one of {sorted(self.actions)}."
+                )
+            with self.lock:
+                result = self.actions[action](**parameters)
+            reply = dict(ok=True, result=result)
+        except Exception as error:
+            reply = dict(ok=False, error=f"{type(error).__name__}: {error}")
+        reply["seconds"] = time.perf_counter() - start
+        return reply
+
+    def warm_up(self):
+        """
+        Import the slow things now, so the first request doesn't have to.
+        """
+        for name in self.warm_modules:
+            importlib.import_module(name)
+
+        if self.store is None:
+            from .gaia import default_store
+
+            self.store = default_store()
+
+    def start(self, background=False):
+        """
+        Start listening for requests.
+
+        Parameters
+        ----------
+        background : bool
+            If True, serve from a background thread and return
+            immediately (handy in a notebook, or for testing).
+            If False, serve until interrupted.
+        """
+        self.warm_up()
+        if _is_unix(self.address):
+            os.makedirs(os.path.dirname(os.path.abspath(self.address)), exist_ok=True)
+            if os.path.exists(self.address):
+                os.remove(self.address)
+            self.server = _UnixServer(self.address, _Handler)
+        else:
+            self.server = _TCPServer(tuple(self.address), _Handler)
+            self.address = self.server.server_address[:2]
+        self.server.quicklook = self
+        print(f"Quicklook server listening at {self.address}")
+
+        if background:
+            self.thread = threading.Thread(
+                target=self.server.serve_forever, daemon=True
+            )
+            self.thread.start()
+        else:
+            try:
+                self.server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                self.stop()
+
+    def stop(self):
+        """
+        Stop listening, and tidy up the socket.
+        """
+        if self.server is None:
+            return
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread.join()
+            self.thread = None
+        self.server.server_close()
+        self.server = None
+        if _is_unix(self.address) and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def ping(self):
+        """
+        Say hello (so clients can check the server is awake).
+        """
+        return dict(pid=os.getpid(), images=len(self.images))
+
+    def list_actions(self):
+        """
+        List the actions this server knows how to do.
+        """
+        return sorted(self.actions)
+
+    def read_image(self, filename):
+        """
+        Read an image, or get it from memory if it hasn't changed on disk.
+
+        Parameters
+        ----------
+        filename : str
+            A FITS (or .npy) file.
+
+        Returns
+        -------
+        cached : dict
+            The `image` and its display limits `vmin` and `vmax`.
+        """
+        filename = os.path.abspath(filename)
+        modified = os.path.getmtime(filename)
+        cached = self.images.get(filename)
+        if (cached is None) or (cached["modified"] != modified):
+            if filename.endswith(".npy"):
+                image = np.load(filename)
+            else:
+                from .reader import FITSReader
+
+                with FITSReader(filename) as reader:
+                    image = reader.read(dtype=np.float32)
+            image = np.asarray(image, dtype=np.float32)
+
+            # work out display limits once, so thumbnails are instant
+            vmin, vmax = np.nanpercentile(image, [1, 99.5])
+            cached = dict(image=image, vmin=vmin, vmax=vmax, modified=modified)
+
+            # forget the oldest image, if we're holding too many
+            self.images.pop(filename, None)
+            if len(self.images) >= self.max_images:
+                self.images.pop(next(iter(self.images)))
+            self.images[filename] = cached
+        return cached
+
+    def thumbnail(self, filename, size=256, output=None, cmap="gray"):
+        """
+        Render a small PNG of an image.
+
+        Parameters
+        ----------
+        filename : str
+            A FITS (or .npy) file.
+        size : int
+            The (rough) largest dimension of the thumbnail.
+        output : str
+            A filename for the PNG. If None, the PNG is
+            returned as a base64-encoded string instead.
+        cmap : str
+            The matplotlib colormap.
+
+        Returns
+        -------
+        thumbnail : dict
+            The `shape` of the thumbnail, plus either the
+            `filename` or the base64-encoded `png`.
+        """
+        from matplotlib.image import imsave
+
+        cached = self.read_image(filename)
+        image = cached["image"]
+
+        # bin down by averaging blocks of pixels
+        factor = max(1, int(np.ceil(max(image.shape) / size)))
+        ny, nx = image.shape[0] // factor, image.shape[1] // factor
+        binned = np.nanmean(
+            image[: ny * factor, : nx * factor].reshape(ny, factor, nx, factor),
+            axis=(1, 3),
+        )
+
+        kw = dict(vmin=cached["vmin"], vmax=cached["vmax"], cmap=cmap, origin="lower")
+        if output is not None:
+            imsave(output, binned, format="png", **kw)
+            return dict(shape=binned.shape, filename=output)
+        buffer = io.BytesIO()
+        imsave(buffer, binned, format="png", **kw)
+        return dict(
+            shape=binned.shape, png=base64.b64encode(buffer.getvalue()).decode()
+        )
+
+    def finder(self, name, radius=6.0, epoch="now", output=None):
+        """
+        Find Gaia stars around a target, and (optionally) draw a finder chart.
+
+        Parameters
+        ----------
+        name : str
+            The name of the target.
+        radius : float
+            The radius of the field, in arcminutes.
+        epoch : float, str
+            The decimal year of the observations, or "now".
+        output : str
+            A filename for the finder chart (the format comes
+            from its extension). If None, no chart is drawn.
+
+        Returns
+        -------
+        field : dict
+            The target's `ra` and `dec`, the number of stars,
+            the brightest few stars, and the chart's `filename`.
+        """
+        import astropy.units as u
+        from .finder import propagate_proper_motions, _render_finder_chart
+
+        if self.store is None:
+            self.warm_up()
+        stars = propagate_proper_motions(
+            self.store.query(name, radius=radius * u.arcmin), epoch=epoch, verbose=False
+        )
+        center = stars.meta["center"]
+        field = dict(
+            ra=center.icrs.ra.deg,
+            dec=center.icrs.dec.deg,
+            N=len(stars),
+            epoch=stars.meta["epoch"],
+        )
+        order = np.argsort(np.ma.filled(stars["G_gaia_mag"].value, np.inf))[:10]
+        field["brightest"] = [
+            dict(
+                ra=float(stars["ra"][i].to_value(u.deg)),
+                dec=float(stars["dec"][i].to_value(u.deg)),
+                G=float(stars["G_gaia_mag"][i].to_value(u.mag)),
+            )
+            for i in order
+        ]
+        if output is not None:
+            basename, extension = os.path.splitext(output)
+            _render_finder_chart(stars, name, basename, [extension[1:]], {})
+            field["filename"] = output
+        return field
+
+    def time_script(self, lines, binning="1x1"):
+        """
+        Estimate how long a TUI script will take.
+
+        Parameters
+        ----------
+        lines : list
+            The lines of the script.
+        binning : str
+            The binning to assume, until the script sets one.
+
+        Returns
+        -------
+        timing : dict
+            The `total` duration (in seconds), and the
+            `timeline` as a list of rows.
+        """
+        from .timing import ScriptTimer
+
+        total, timeline = ScriptTimer(binning=binning).simulate(lines)
+        return dict(
+            total=total,
+            timeline=[
+                {
+                    k: row[k].item() if hasattr(row[k], "item") else row[k]
+                    for k in row.colnames
+                }
+                for row in timeline
+            ],
+        )
+
+
+class QuicklookClient:
+    """
+    A thin client, for talking to a QuicklookServer.
+    """
+
+    def __init__(self, address=default_address, timeout=60):
+        """
+        Connect to a server.
+
+        Parameters
+        ----------
+        address : str, tuple
+            The path of the server's Unix socket, or its (host, port).
+        timeout : float
+            How long (in seconds) to wait for a reply.
+        """
+        self.address = address
+        if _is_unix(address):
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            address = tuple(address)
+        self.socket.settimeout(timeout)
+        self.socket.connect(address)
+        self.file = self.socket.makefile("rwb")
+
+    def __repr__(self):
+        return f"<QuicklookClient connected to {self.address}>"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Hang up.
+        """
+        self.file.close()
+        self.socket.close()
+
+    def request(self, action, **parameters):
+        """
+        Ask the server to do something, and wait for the answer.
+
+        Parameters
+        ----------
+        action : str
+            The name of the action.
+        **parameters : dict
+            Passed along to the action.
+
+        Returns
+        -------
+        result
+            Whatever the action returned.
+        """
+        self.file.write(json.dumps(dict(action=action, **parameters)).encode() + b"\n")
+        self.file.flush()
+        line = self.file.readline()
+        if line == b"":
+            raise ConnectionError("Sorry! The quicklook server hung up.")
+        reply = json.loads(line)
+        if not reply["ok"]:
+            raise RuntimeError(reply["error"])
+        return reply["result"]
+
+    def ping(self):
+        return self.request("ping")
+
+    def thumbnail(self, filename, **kwargs):
+        return self.request("thumbnail", filename=os.path.abspath(filename), **kwargs)
+
+    def finder(self, name, **kwargs):
+        return self.request("finder", name=name, **kwargs)
+
+    def time_script(self, lines, **kwargs):
+        return self.request("time_script", lines=list(lines), **kwargs)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Run a kosmoscraftroom quicklook server."
+    )
+    parser.add_argument("--socket", default=None, help="a path for a Unix socket")
+    parser.add_argument("--port", default=None, type=int, help="a localhost TCP port")
+    args = parser.parse_args()
+    if args.port is not None:
+        address = ("localhost", args.port)
+    else:
+        address = args.socket or default_address
+    QuicklookServer(address).start()
@@ -0,0 +1,191 @@
+"""
+Tools for modeling and subtracting the sky along a long slit.
+
+The sky under a long slit is smooth along the spatial direction,
+so at every wavelength it can be fit with a low-order polynomial
+(ignoring the pixels with the target, and any bad pixels). Rather
+than doing thousands of separate fits, all wavelengths are fit at
+once with linear algebra on whole arrays:
+
+- To start, many wavelengths share exactly the same pattern of
+  pixels to use (for example, everything but the target), so one
+  pseudo-inverse is calculated for each unique pattern and applied
+  to every wavelength with that pattern in a single matrix product.
+
+- Then outliers (like cosmic rays or unmasked stars) are clipped
+  iteratively. Each wavelength's normal equations are updated by
+  subtracting just the contributions of the newly-clipped pixels,
+  and all the little (order+1) x (order+1) systems are re-solved
+  together.
+
+Images are indexed as [dispersion, spatial], like `loupe` shows
+them, and masks are `ok`-style (True = good), like `loupe` uses.
+"""
+import numpy as np
+
+
+def _design_matrix(N, order):
+    """
+    Make the Legendre polynomial basis along the slit.
+
+    Returns
+    -------
+    A : array
+        The basis, with shape (N, order + 1).
+    """
+    x = np.linspace(-1, 1, N)
+    return np.polynomial.legendre.legvander(x, order)
+
+
+def _fit_patterns(data, used, A, max_patterns=64):
+    """
+    Fit every row, with one pseudo-inverse for each unique pattern of used pixels.
+
+    Returns None if there are too many patterns for this to be worthwhile.
+    """
+    # find the unique patterns quickly, by packing each one into bytes
+    packed = np.packbits(used, axis=1)
+    keys = np.ascontiguousarray(packed).view(np.dtype((np.void, packed.shape[1])))
+    _, first, which = np.unique(keys.ravel(), return_index=True, return_inverse=True)
+    if len(first) > max_patterns:
+        return None
+    patterns, which = used[first], np.ravel(which)
+    coefficients = np.full((len(data), A.shape[1]), np.nan)
+    for i, pattern in enumerate(patterns):
+        if np.sum(pattern) <= A.shape[1]:
+            continue
+        rows = which == i
+        pseudo_inverse = np.linalg.pinv(A[pattern])
+        coefficients[rows] = data[rows][:, pattern] @ pseudo_inverse.T
+    return coefficients
+
+
+def _solve(normal, projection, N):
+    """
+    Solve many normal equations at once (leaving hopeless ones as NaN).
+    """
+    coefficients = np.full(projection.shape, np.nan)
+    good = N > projection.shape[1]
+    if np.any(good):
+        coefficients[good] = np.linalg.solve(
+            normal[good], projection[good][:, :, np.newaxis]
+        )[:, :, 0]
+    return coefficients
+
+
+def fit_sky(
+    image,
+    ok=None,
+    exclude=None,
+    order=2,
+    sigma=3.0,
+    iterations=5,
+    axis=1,
+):
+    """
+    Fit a smooth sky model along the slit, at every wavelength at once.
+
+    Parameters
+    ----------
+    image : array
+        The 2D spectrum, indexed as [dispersion, spatial]
+        (or [spatial, dispersion] with `axis=0`).
+    ok : array
+        Which pixels are good (True) or bad (False), with
+        the same shape as `image`. Default is all good.
+    exclude : array
+        Which pixels should be left out of the sky fit (True),
+        like the rows around the target's trace. This can have
+        the same shape as `image`, or be 1D along the slit.
+    order : int
+        The order of the polynomial along the slit.
+    sigma : float
+        Pixels more than this many standard deviations
+        from the fit are clipped, and the fit is repeated.
+    iterations : int
+        The most times to clip outliers and re-fit.
+    axis : int
+        Which axis of `image` is along the slit.
+
+    Returns
+    -------
+    sky : array
+        The sky model, with the same shape as `image`. Where
+        there weren't enough good pixels to fit, it's NaN.
+    used : array
+        Which pixels were used in the final fit.
+    """
+    image = np.asarray(image, dtype=np.float64)
+    if axis == 0:
+        image = image.T
+    Nd, Ns = image.shape
+
+    # decide which pixels can be used for the sky
+    used = np.isfinite(image)
+    if ok is not None:
+        used &= ok.T if axis == 0 else np.asarray(ok, dtype=bool)
+    if exclude is not None:
+        exclude = np.asarray(exclude, dtype=bool)
+        if exclude.ndim == 2 and axis == 0:
+            exclude = exclude.T
+        used &= ~exclude
+    data = np.where(used, image, 0.0)
+
+    # set up the normal equations, so clipping can update them
+    A = _design_matrix(Ns, order)
+    outer = (A[:, :, np.newaxis] * A[:, np.newaxis, :]).reshape(Ns, -1)
+    normal = (used @ outer).reshape(Nd, order + 1, order + 1)
+    projection = data @ A
+
+    # fit everything once, sharing pseudo-inverses between identical masks
+    # (or, if every wavelength's mask is different, solving them all together)
+    N = np.sum(used, axis=1)
+    coefficients = _fit_patterns(data, used, A)
+    if coefficients is None:
+        coefficients = _solve(normal, projection, N)
+
+    # only wavelengths that changed in the last iteration need checking again
+    active = np.arange(Nd)
+    for _ in range(iterations):
+        # clip pixels far from the fit, compared to the scatter at that wavelength
+        u, y = used[active], image[active]
+        residuals = np.where(u, y - coefficients[active] @ A.T, 0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            scatter = np.sqrt(np.sum(residuals**2, axis=1) / (N[active] - order - 1))
+        clipped = u & (np.abs(residuals) > sigma * scatter[:, np.newaxis])
+        changed = np.any(clipped, axis=1)
+        if not np.any(changed):
+            break
+        active, clipped, y = active[changed], clipped[changed], y[changed]
+
+        # remove just the clipped pixels from the normal equations, and re-solve
+        used[active] &= ~clipped
+        N[active] -= np.sum(clipped, axis=1)
+        normal[active] -= (clipped @ outer).reshape(-1, order + 1, order + 1)
+        projection[active] -= np.where(clipped, y, 0.0) @ A
+        coefficients[active] = _solve(normal[active], projection[active], N[active])
+
+    sky = coefficients @ A.T
+    if axis == 0:
+        return sky.T, used.T
+    return sky, used
+
+
+def subtract_sky(image, **kwargs):
+    """
+    Subtract a smooth sky model along the slit.
+
+    Parameters
+    ----------
+    image : array
+        The 2D spectrum, indexed as [dispersion, spatial].
+    **kwargs : dict
+        Passed to `fit_sky` (for example, `ok` and `exclude`).
+
+    Returns
+    -------
+    subtracted : array
+        The image, minus the sky.
+    """
+    sky, used = fit_sky(image, **kwargs)
+    return np.asarray(image) - sky
@@ -0,0 +1,455 @@
+"""
+Tools for fast positional lookups on the sky.
+
+Everything here works on plain arrays of right ascension
+and declination (in degrees), which get converted into
+3D unit vectors. Straight-line (chord) distances between
+unit vectors increase monotonically with angular separation,
+so a KD-tree built on them can answer "what's near here?"
+questions without any trigonometry in the inner loop.
+"""
+import numpy as np
+import astropy.units as u
+from scipy.spatial import cKDTree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+
+def unit_vectors(ra, dec):
+    """
+    Convert sky positions into 3D Cartesian unit vectors.
+
+    Parameters
+    ----------
+    ra : array
+        Right ascension, in degrees.
+    dec : array
+        Declination, in degrees.
+
+    Returns
+    -------
+    xyz : array
+        Unit vectors, with shape (N, 3).
+    """
+    ra = np.radians(np.asarray(ra, dtype=np.float64))
+    dec = np.radians(np.asarray(dec, dtype=np.float64))
+    cos_dec = np.cos(dec)
+    return np.stack([cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)], -1)
+
+
+def sky_positions(xyz):
+    """
+    Convert 3D Cartesian vectors back into sky positions.
+
+    Parameters
+    ----------
+    xyz : array
+        Vectors (which needn't be normalized), with shape (..., 3).
+
+    Returns
+    -------
+    ra : array
+        Right ascension, in degrees.
+    dec : array
+        Declination, in degrees.
+    """
+    x, y, z = np.moveaxis(np.asarray(xyz, dtype=np.float64), -1, 0)
+    ra = np.degrees(np.arctan2(y, x)) % 360
+    dec = np.degrees(np.arctan2(z, np.hypot(x, y)))
+    return ra, dec
+
+
+def tangent_plane(xyz):
+    """
+    Find the directions of east and north on the sky at some positions.
+
+    Parameters
+    ----------
+    xyz : array
+        Unit vectors, with shape (..., 3).
+
+    Returns
+    -------
+    east : array
+        Unit vectors pointing east, with shape (..., 3).
+    north : array
+        Unit vectors pointing north, with shape (..., 3).
+    """
+    ra, dec = np.radians(sky_positions(xyz))
+    east = np.stack([-np.sin(ra), np.cos(ra), np.zeros_like(ra)], -1)
+    north = np.stack(
+        [-np.sin(dec) * np.cos(ra), -np.sin(dec) * np.sin(ra), np.cos(dec)], -1
+    )
+    return east, north
+
+
+def slit_rotation(east, north):
+    """
+    Find the KOSMOS rotator angle that lines the slit up along a direction.
+
+    A direction with these east and north components has a
+    position angle (east of north) of 90 deg - arctan2(north, east),
+    and the "RotType=Object" rotator angle is that position
+    angle minus 90 deg.
+
+    Parameters
+    ----------
+    east : array
+        The eastward component of the direction.
+    north : array
+        The northward component of the direction.
+
+    Returns
+    -------
+    rotation : array
+        The rotator angle, in degrees, in [-180, 180).
+    """
+    angle = np.degrees(np.arctan2(north, east))
+    return (-angle + 180) % 360 - 180
+
+
+def chord(angle):
+    """
+    Convert an angular separation into a chord length on the unit sphere.
+
+    Parameters
+    ----------
+    angle : Quantity
+        The angular separation (with units of angle).
+
+    Returns
+    -------
+    chord : float
+        The straight-line distance between two unit vectors
+        separated by that angle.
+    """
+    return 2 * np.sin(0.5 * np.minimum(u.Quantity(angle).to_value(u.radian), np.pi))
+
+
+def friends_of_friends(xyz, radius, tree=None, extra_pairs=None):
+    """
+    Group points that are linked by chains of close neighbors.
+
+    Any two points closer than `radius` end up in the same group,
+    as do any points that can be connected by a chain of such pairs.
+
+    Parameters
+    ----------
+    xyz : array
+        Unit vectors, with shape (N, 3).
+    radius : Quantity
+        The linking length (with units of angle).
+    tree : cKDTree
+        A KD-tree already built on `xyz`, if one is handy.
+    extra_pairs : array
+        Additional (M, 2) array of index pairs that should be
+        linked, regardless of how far apart they are.
+
+    Returns
+    -------
+    labels : array
+        An integer group label for each point.
+    """
+    N = len(xyz)
+    if tree is None:
+        tree = cKDTree(xyz)
+    pairs = tree.query_pairs(r=chord(radius), output_type="ndarray")
+    if extra_pairs is not None:
+        pairs = np.concatenate([pairs, np.reshape(extra_pairs, (-1, 2))])
+    if len(pairs) == 0:
+        return np.arange(N)
+    graph = coo_matrix((np.ones(len(pairs), dtype=bool), pairs.T), shape=(N, N))
+    _, labels = connected_components(graph, directed=False)
+    return labels
+
+
+class SpatialIndex:
+    """
+    A reusable index for cone, box, and nearest-neighbor queries.
+
+    The index keeps a KD-tree on unit vectors (for cones and
+    nearest neighbors) and an ordering by right ascension
+    (for boxes), so each query only touches the rows it returns.
+    """
+
+    def __init__(self, ra, dec):
+        """
+        Build the index.
+
+        Parameters
+        ----------
+        ra : array
+            Right ascension, in degrees.
+        dec : array
+            Declination, in degrees.
+        """
+        self.ra = np.asarray(ra, dtype=np.float64) % 360
+        self.dec = np.asarray(dec, dtype=np.float64)
+        self.xyz = unit_vectors(self.ra, self.dec)
+        self.tree = cKDTree(self.xyz)
+        self.ra_order = np.argsort(self.ra, kind="stable")
+        self.ra_sorted = self.ra[self.ra_order]
+
+    def __len__(self):
+        return len(self.ra)
+
+    def __repr__(self):
+        return f"<SpatialIndex ({len(self)} positions)>"
+
+    def cone(self, ra, dec, radius):
+        """
+        Find all positions within a radius of a center.
+
+        Parameters
+        ----------
+        ra : float
+            Right ascension of the center, in degrees.
+        dec : float
+            Declination of the center, in degrees.
+        radius : Quantity
+            The radius of the cone (with units of angle).
+
+        Returns
+        -------
+        indices : array
+            Sorted indices of the positions inside the cone.
+        """
+        indices = self.tree.query_ball_point(unit_vectors(ra, dec), chord(radius))
+        return np.sort(np.asarray(indices, dtype=int))
+
+    def box(self, ra_range=(0, 360), dec_range=(-90, 90)):
+        """
+        Find all positions within a window of RA and Dec.
+
+        Parameters
+        ----------
+        ra_range : tuple
+            The (lower, upper) right ascension, in degrees.
+            If lower > upper, the window wraps through 0.
+        dec_range : tuple
+            The (lower, upper) declination, in degrees.
+
+        Returns
+        -------
+        indices : array
+            Sorted indices of the positions inside the box.
+        """
+        ra_min, ra_max = ra_range
+        if (ra_max - ra_min) >= 360:
+            candidates = self.ra_order
+        else:
+            ra_min, ra_max = ra_min % 360, ra_max % 360
+            left = np.searchsorted(self.ra_sorted, ra_min, side="left")
+            right = np.searchsorted(self.ra_sorted, ra_max, side="right")
+            if ra_min <= ra_max:
+                candidates = self.ra_order[left:right]
+            else:
+                candidates = np.concatenate(
+                    [self.ra_order[left:], self.ra_order[:right]]
+                )
+        dec = self.dec[candidates]
+        ok = (dec >= dec_range[0]) & (dec <= dec_range[1])
+        return np.sort(candidates[ok])
+
+    def nearest(self, ra, dec, k=1):
+        """
+        Find the k positions nearest to a center.
+
+        Parameters
+        ----------
+        ra : float
+            Right ascension of the center, in degrees.
+        dec : float
+            Declination of the center, in degrees.
+        k : int
+            How many neighbors to find.
+
+        Returns
+        -------
+        indices : array
+            Indices of the nearest positions, closest first
+            (empty, if there are no positions at all).
+        separations : Quantity
+            Angular separations of those positions from the center.
+        """
+        k = min(k, len(self))
+        if k < 1:
+            # (the KD-tree can't look for zero neighbors)
+            return np.zeros(0, dtype=int), np.zeros(0) * u.deg
+        distances, indices = self.tree.query(unit_vectors(ra, dec), k=k)
+        distances, indices = np.atleast_1d(distances), np.atleast_1d(indices)
+        separations = 2 * np.arcsin(np.minimum(distances / 2, 1)) * u.radian
+        return indices, separations.to(u.deg)
+
+
+def _spread_bits(i):
+    """
+    Spread the bits of an integer out to even positions (0b111 -> 0b10101).
+    """
+    i = np.asarray(i, dtype=np.int64)
+    i = (i | (i << 16)) & 0x0000FFFF0000FFFF
+    i = (i | (i << 8)) & 0x00FF00FF00FF00FF
+    i = (i | (i << 4)) & 0x0F0F0F0F0F0F0F0F
+    i = (i | (i << 2)) & 0x3333333333333333
+    i = (i | (i << 1)) & 0x5555555555555555
+    return i
+
+
+def _compress_bits(i):
+    """
+    Gather the even bits of an integer back together (0b10101 -> 0b111).
+    """
+    i = np.asarray(i, dtype=np.int64) & 0x5555555555555555
+    i = (i | (i >> 1)) & 0x3333333333333333
+    i = (i | (i >> 2)) & 0x0F0F0F0F0F0F0F0F
+    i = (i | (i >> 4)) & 0x00FF00FF00FF00FF
+    i = (i | (i >> 8)) & 0x0000FFFF0000FFFF
+    i = (i | (i >> 16)) & 0x00000000FFFFFFFF
+    return i
+
+
+def healpix_index(ra, dec, nside):
+    """
+    Find the (nested) HEALPix pixel containing each sky position.
+
+    Parameters
+    ----------
+    ra : array
+        Right ascension, in degrees.
+    dec : array
+        Declination, in degrees.
+    nside : int
+        The HEALPix resolution parameter (a power of 2).
+
+    Returns
+    -------
+    pixels : array
+        The nested pixel index of each position.
+    """
+    z = np.sin(np.radians(np.asarray(dec, dtype=np.float64)))
+    za = np.abs(z)
+    tt = (np.asarray(ra, dtype=np.float64) % 360) / 90.0
+
+    # the equatorial region
+    temp1 = nside * (0.5 + tt)
+    temp2 = nside * z * 0.75
+    jp = (temp1 - temp2).astype(np.int64)
+    jm = (temp1 + temp2).astype(np.int64)
+    ifp, ifm = jp // nside, jm // nside
+    face_equator = np.where(
+        ifp == ifm, (ifp % 4) + 4, np.where(ifp < ifm, ifp % 4, (ifm % 4) + 8)
+    )
+    ix_equator = jm & (nside - 1)
+    iy_equator = nside - (jp & (nside - 1)) - 1
+
+    # the polar caps
+    ntt = np.minimum(tt.astype(np.int64), 3)
+    tp = tt - ntt
+    tmp = nside * np.sqrt(3 * (1 - za))
+    jp = np.minimum((tp * tmp).astype(np.int64), nside - 1)
+    jm = np.minimum(((1 - tp) * tmp).astype(np.int64), nside - 1)
+    north = z >= 0
+    face_polar = np.where(north, ntt, ntt + 8)
+    ix_polar = np.where(north, nside - jm - 1, jp)
+    iy_polar = np.where(north, nside - jp - 1, jm)
+
+    equator = za <= 2 / 3
+    face = np.where(equator, face_equator, face_polar)
+    ix = np.where(equator, ix_equator, ix_polar)
+    iy = np.where(equator, iy_equator, iy_polar)
+    return face * nside**2 + _spread_bits(ix) + (_spread_bits(iy) << 1)
+
+
+def healpix_center(pixels, nside):
+    """
+    Find the center of each (nested) HEALPix pixel.
+
+    Parameters
+    ----------
+    pixels : array
+        The nested pixel indices.
+    nside : int
+        The HEALPix resolution parameter (a power of 2).
+
+    Returns
+    -------
+    ra, dec : array
+        The coordinates of the pixel centers, in degrees.
+    """
+    pixels = np.asarray(pixels, dtype=np.int64)
+    face = pixels // nside**2
+    within = pixels % nside**2
+    ix, iy = _compress_bits(within), _compress_bits(within >> 1)
+
+    jrll = np.array([2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4])
+    jpll = np.array([1, 3, 5, 7, 0, 2, 4, 6, 1, 3, 5, 7])
+    jr = jrll[face] * nside - ix - iy - 1
+
+    north, south = jr < nside, jr > 3 * nside
+    nr = np.where(north, jr, np.where(south, 4 * nside - jr, nside))
+    z_cap = 1 - nr**2 / (3.0 * nside**2)
+    z = np.where(
+        north, z_cap, np.where(south, -z_cap, (2 * nside - jr) * 2 / (3.0 * nside))
+    )
+    kshift = np.where(north | south, 0, (jr - nside) & 1)
+
+    jp = (jpll[face] * nr + ix - iy + 1 + kshift) // 2
+    jp = np.where(jp > 4 * nside, jp - 4 * nside, jp)
+    jp = np.where(jp < 1, jp + 4 * nside, jp)
+    phi = (jp - (kshift + 1) * 0.5) * (90.0 / nr)
+    return phi % 360, np.degrees(np.arcsin(z))
+
+
+def healpix_radius(nside):
+    """
+    A safe upper limit on the distance from any pixel's center to its edge.
+
+    Parameters
+    ----------
+    nside : int
+        The HEALPix resolution parameter (a power of 2).
+
+    Returns
+    -------
+    radius : Quantity
+        The maximum pixel radius.
+    """
+    # generous compared to the true maximum, which is ~1.05 rad / nside
+    return np.minimum(1.1 / nside, np.pi) * u.radian
+
+
+def healpix_cone(ra, dec, radius, nside):
+    """
+    Find all (nested) HEALPix pixels that might overlap a cone.
+
+    The search works down through the nested hierarchy, from the
+    12 base pixels to the requested resolution, only ever splitting
+    pixels that are close enough to the cone to possibly overlap it.
+
+    Parameters
+    ----------
+    ra : float
+        Right ascension of the center, in degrees.
+    dec : float
+        Declination of the center, in degrees.
+    radius : Quantity
+        The radius of the cone (with units of angle).
+    nside : int
+        The HEALPix resolution parameter (a power of 2).
+
+    Returns
+    -------
+    pixels : array
+        The nested indices of pixels that might overlap the cone.
+    """
+    center = unit_vectors(ra, dec)
+    radius = u.Quantity(radius).to_value(u.radian)
+    pixels, level = np.arange(12), 1
+    while True:
+        xyz = unit_vectors(*healpix_center(pixels, level))
+        reach = radius + healpix_radius(level).to_value(u.radian)
+        close = xyz @ center >= np.cos(np.minimum(reach, np.pi))
+        pixels = pixels[close]
+        if level >= nside:
+            return pixels
+        pixels, level = (4 * pixels[:, np.newaxis] + np.arange(4)).ravel(), level * 2
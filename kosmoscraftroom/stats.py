@@ -0,0 +1,396 @@
+"""
+Tools for keeping track of how a night is going, frame by frame.
+
+While observing, it helps to watch a few numbers from every frame:
+how bright the sky is, how many pixels are saturated (or in the
+nonlinear regime), and what S/N we're getting. `FrameStatistics`
+gathers them in a single pass over a frame, one chunk of rows at a
+time, so only one chunk is ever in memory:
+
+- the mean and variance are accumulated with Welford's method
+  (merging the moments of each chunk into the running totals),
+- percentiles come from a histogram with fixed bins,
+- saturated and nonlinear pixels are counted, and
+- the sky (and any other regions you define) get their own
+  running moments and histograms.
+
+`NightTrends` then appends the statistics of each new frame to a
+time series for the night, which can be plotted (and updated live)
+without ever going back to read earlier frames.
+"""
+import numpy as np
+
+from .reader import FITSReader, parse_section
+
+
+def _merge_moments(a, b):
+    """
+    Combine two sets of (N, mean, M2) moments, following Welford/Chan.
+    """
+    N_a, mean_a, M2_a = a
+    N_b, mean_b, M2_b = b
+    N = N_a + N_b
+    if N == 0:
+        return a
+    delta = mean_b - mean_a
+    mean = mean_a + delta * N_b / N
+    M2 = M2_a + M2_b + delta**2 * N_a * N_b / N
+    return N, mean, M2
+
+
+def _moments(values):
+    """
+    Calculate the (N, mean, M2) moments of some values.
+    """
+    N = values.size
+    if N == 0:
+        return 0, 0.0, 0.0
+    mean = np.mean(values, dtype=np.float64)
+    return N, mean, np.sum((values - mean) ** 2, dtype=np.float64)
+
+
+def _percentile(counts, edges, q):
+    """
+    Estimate a percentile from a histogram, interpolating within bins.
+    """
+    cumulative = np.cumsum(counts)
+    if cumulative[-1] == 0:
+        return np.nan
+    target = q / 100 * cumulative[-1]
+    i = min(np.searchsorted(cumulative, target), len(counts) - 1)
+    before = cumulative[i - 1] if i > 0 else 0
+    fraction = (target - before) / max(counts[i], 1)
+    return edges[i] + fraction * (edges[i + 1] - edges[i])
+
+
+class _Accumulator:
+    """
+    Running moments and a fixed histogram, for one set of pixels.
+    """
+
+    def __init__(self, lower, upper, bins):
+        self.lower, self.upper, self.bins = lower, upper, bins
+        self.width = (upper - lower) / bins
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.moments = (0, 0.0, 0.0)
+        self.min, self.max = np.inf, -np.inf
+
+    def update(self, values):
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return
+        self.moments = _merge_moments(self.moments, _moments(values))
+        self.min = min(self.min, np.min(values))
+        self.max = max(self.max, np.max(values))
+        # (values outside the range land in the first or last bin)
+        i = ((values - self.lower) / self.width).astype(np.int64)
+        self.counts += np.bincount(np.clip(i, 0, self.bins - 1), minlength=self.bins)
+
+    @property
+    def edges(self):
+        return np.linspace(self.lower, self.upper, self.bins + 1)
+
+    def percentile(self, q):
+        return _percentile(self.counts, self.edges, q)
+
+    @property
+    def N(self):
+        return self.moments[0]
+
+    @property
+    def mean(self):
+        return self.moments[1] if self.N > 0 else np.nan
+
+    @property
+    def std(self):
+        N, _, M2 = self.moments
+        return np.sqrt(M2 / (N - 1)) if N > 1 else np.nan
+
+
+class FrameStatistics:
+    """
+    Gather statistics for one frame, a chunk of rows at a time.
+    """
+
+    # the detector's limits (in ADU), and the range of the histograms
+    saturation_level = 65535
+    nonlinearity_level = 55000
+    histogram_range = (0, 65536)
+    histogram_bins = 4096
+
+    def __init__(self, regions=None, gain=1.0, readnoise=5.0, **levels):
+        """
+        Start gathering statistics for a frame.
+
+        Parameters
+        ----------
+        regions : dict
+            Regions for which to measure their own statistics,
+            with names as keys and either IRAF-style sections
+            ("[x1:x2,y1:y2]") or (rows, columns) slices as values.
+            A region named "sky" sets the sky brightness, and one
+            named "target" (along with "sky") sets the S/N.
+            Default is no regions.
+        gain : float
+            The detector gain, in electrons/ADU.
+        readnoise : float
+            The read noise, in electrons.
+        **levels : dict
+            Any of `saturation_level`, `nonlinearity_level`,
+            `histogram_range`, or `histogram_bins`, to override
+            the defaults.
+        """
+        for k, v in levels.items():
+            if not hasattr(self, k):
+                raise ValueError(f"Sorry! {k} isn't something FrameStatistics knows.")
+            setattr(self, k, v)
+        self.gain, self.readnoise = gain, readnoise
+        self.regions = {}
+        for name, region in (regions or {}).items():
+            if isinstance(region, str):
+                region = parse_section(region)
+            self.regions[name] = region
+        self.all = self._accumulator()
+        self.within = {name: self._accumulator() for name in self.regions}
+        self.saturated = 0
+        self.nonlinear = 0
+        self.rows = 0
+
+    def __repr__(self):
+        return f"<FrameStatistics of {self.all.N} pixels>"
+
+    def _accumulator(self):
+        return _Accumulator(*self.histogram_range, self.histogram_bins)
+
+    def update(self, chunk, start=None):
+        """
+        Include another chunk of rows.
+
+        Parameters
+        ----------
+        chunk : array
+            The rows, with shape (rows, columns).
+        start : int
+            The index of the first row of this chunk in the
+            frame. Default is right after the last chunk.
+        """
+        chunk = np.atleast_2d(chunk)
+        if start is None:
+            start = self.rows
+        stop = start + chunk.shape[0]
+        self.rows = max(self.rows, stop)
+
+        self.all.update(chunk.ravel())
+        self.saturated += np.count_nonzero(chunk >= self.saturation_level)
+        self.nonlinear += np.count_nonzero(chunk >= self.nonlinearity_level)
+
+        # include the part of each region that falls in this chunk
+        for name, (rows, columns) in self.regions.items():
+            lower = max(rows.start or 0, start)
+            upper = min(stop if rows.stop is None else rows.stop, stop)
+            if upper > lower:
+                self.within[name].update(
+                    chunk[lower - start : upper - start, columns].ravel()
+                )
+
+    def result(self):
+        """
+        Summarize the statistics of the frame.
+
+        Returns
+        -------
+        statistics : dict
+            Single numbers describing the frame.
+        """
+        N = self.all.N
+        statistics = dict(
+            N=N,
+            mean=self.all.mean,
+            std=self.all.std,
+            min=self.all.min,
+            max=self.all.max,
+            p01=self.all.percentile(1),
+            p50=self.all.percentile(50),
+            p99=self.all.percentile(99),
+            saturated_fraction=self.saturated / N if N > 0 else np.nan,
+            nonlinear_fraction=self.nonlinear / N if N > 0 else np.nan,
+        )
+        for name, accumulator in self.within.items():
+            statistics[f"{name}_mean"] = accumulator.mean
+            statistics[f"{name}_median"] = accumulator.percentile(50)
+            statistics[f"{name}_std"] = accumulator.std
+
+        # estimate the S/N of the target, above the sky
+        if ("target" in self.within) and ("sky" in self.within):
+            target, sky = self.within["target"], self.within["sky"]
+            signal = (target.mean - sky.percentile(50)) * target.N * self.gain
+            variance = (
+                max(signal, 0)
+                + target.N * max(sky.percentile(50), 0) * self.gain
+                + target.N * self.readnoise**2
+            )
+            statistics["snr"] = signal / np.sqrt(variance)
+        return statistics
+
+
+def measure_frame(frame, chunk_rows=256, **kwargs):
+    """
+    Measure the statistics of a frame, in one pass over chunks of rows.
+
+    Parameters
+    ----------
+    frame : str, FITSReader, array
+        A FITS filename, an open FITSReader, or an image.
+    chunk_rows : int
+        How many rows to read into memory at once.
+    **kwargs : dict
+        Passed to `FrameStatistics` (for example, `regions`).
+
+    Returns
+    -------
+    statistics : dict
+        Single numbers describing the frame.
+    """
+    if isinstance(frame, str):
+        with FITSReader(frame) as reader:
+            return measure_frame(reader, chunk_rows=chunk_rows, **kwargs)
+    statistics = FrameStatistics(**kwargs)
+    if isinstance(frame, FITSReader):
+        N = frame.shape[0]
+
+        def read(start, stop):
+            return frame.read(slice(start, stop), dtype=np.float32)
+
+    else:
+        N = np.shape(frame)[0]
+
+        def read(start, stop):
+            return np.asarray(frame[start:stop], dtype=np.float32)
+
+    for start in range(0, N, chunk_rows):
+        statistics.update(read(start, min(start + chunk_rows, N)), start=start)
+    return statistics.result()
+
+
+class NightTrends:
+    """
+    A running time series of frame statistics, for watching a night unfold.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Start a new night.
+
+        Parameters
+        ----------
+        **kwargs : dict
+            Passed to `measure_frame` for every frame
+            (for example, `regions`, `gain`, or `chunk_rows`).
+        """
+        self.kwargs = kwargs
+        self.rows = []
+        self.lines = {}
+
+    def __repr__(self):
+        return f"<NightTrends of {len(self.rows)} frames>"
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, frame, time=None, name=None):
+        """
+        Measure a new frame, and add it to the night.
+
+        Parameters
+        ----------
+        frame : str, FITSReader, array
+            A FITS filename, an open FITSReader, or an image.
+        time : Time, float
+            When the frame was taken. Default is DATE-OBS
+            from the header (for FITS), or else the frame number.
+        name : str
+            A name for the frame. Default is the filename.
+
+        Returns
+        -------
+        statistics : dict
+            The statistics of this frame.
+        """
+        if isinstance(frame, str):
+            with FITSReader(frame) as reader:
+                return self.add(reader, time=time, name=name or frame)
+
+        if (time is None) and isinstance(frame, FITSReader):
+            if "DATE-OBS" in frame.header:
+                from astropy.time import Time
+
+                time = Time(frame.header["DATE-OBS"])
+        if time is None:
+            time = len(self.rows)
+        if hasattr(time, "jd"):
+            time = time.jd
+
+        statistics = dict(time=time, name=name or f"frame-{len(self.rows)}")
+        statistics.update(measure_frame(frame, **self.kwargs))
+        self.rows.append(statistics)
+        self.update_plot()
+        return statistics
+
+    @property
+    def table(self):
+        """
+        The statistics of every frame so far, as a table.
+        """
+        from astropy.table import Table
+
+        return Table(rows=self.rows)
+
+    def plot(self, keys=None, axes=None):
+        """
+        Plot trends through the night (which update as frames are added).
+
+        Parameters
+        ----------
+        keys : list
+            Which statistics to plot (any that are missing are skipped).
+            Default is the median, the sky, and the saturated fraction.
+        axes : list
+            The axes in which to plot each statistic. Default
+            is a new figure with one panel per statistic.
+
+        Returns
+        -------
+        axes : list
+            The axes.
+        """
+        if keys is None:
+            keys = ["p50", "sky_median", "saturated_fraction"]
+        keys = [k for k in keys if (len(self.rows) == 0) or (k in self.rows[0])]
+        if axes is None:
+            import matplotlib.pyplot as plt
+
+            fig, axes = plt.subplots(
+                len(keys), 1, sharex=True, figsize=(6, 1.5 * len(keys)), squeeze=False
+            )
+            axes = axes[:, 0]
+        self.lines = {}
+        for k, ax in zip(keys, axes):
+            (self.lines[k],) = ax.plot([], [], marker=".")
+            ax.set_ylabel(k)
+        axes[-1].set_xlabel("time")
+        self.update_plot()
+        return axes
+
+    def update_plot(self):
+        """
+        Redraw any plotted trends with the latest frames.
+        """
+        if len(self.lines) == 0:
+            return
+        time = [row["time"] for row in self.rows]
+        for k, line in self.lines.items():
+            # (a statistic this night doesn't measure is left blank)
+            line.set_data(time, [row.get(k, np.nan) for row in self.rows])
+            line.axes.relim()
+            line.axes.autoscale_view()
+        line.figure.canvas.draw_idle()
@@ -0,0 +1,142 @@
+"""
+Tools for saving and loading tables as folders of binary columns.
+
+Each column is stored as its own `.npy` file, alongside a small
+`meta.json` describing units, masks, and anything else worth
+remembering. Because `.npy` files can be memory-mapped, loading
+is nearly instant and only the bytes that actually get used are
+ever read from disk. Reading a subset of columns just means
+opening fewer files, and if the table is sorted by some column,
+a range of rows can be found by binary search on that column.
+"""
+import os
+import json
+import numpy as np
+from astropy.table import Table, Column, MaskedColumn
+
+# the file that describes the rest of the folder
+meta_filename = "meta.json"
+
+
+def write_columns(directory, table, meta={}):
+    """
+    Write a table out as a folder of binary columns.
+
+    Parameters
+    ----------
+    directory : str
+        The folder into which the columns should be written.
+    table : Table
+        The table to write. Every column must be a plain
+        (possibly masked) array, with a numeric or string dtype.
+    meta : dict
+        Extra JSON-friendly information to store alongside.
+    """
+    os.makedirs(directory, exist_ok=True)
+    description = dict(meta=meta, columns={})
+    for k in table.colnames:
+        column = table[k]
+        data = np.ma.getdata(column)
+        if data.dtype.kind == "O":
+            data = data.astype(str)
+        np.save(os.path.join(directory, f"{k}.npy"), np.asarray(data))
+        masked = bool(np.any(np.ma.getmaskarray(column)))
+        if masked:
+            np.save(
+                os.path.join(directory, f"{k}.mask.npy"), np.ma.getmaskarray(column)
+            )
+        unit = getattr(column, "unit", None)
+        description["columns"][k] = dict(
+            unit=None if unit is None else unit.to_string(), masked=masked
+        )
+    with open(os.path.join(directory, meta_filename), "w") as f:
+        json.dump(description, f, indent=1)
+
+
+def describe_columns(directory):
+    """
+    Read the description of a folder of binary columns.
+
+    Parameters
+    ----------
+    directory : str
+        The folder containing the columns.
+
+    Returns
+    -------
+    description : dict
+        With "columns" (names, units, masks) and "meta" entries.
+    """
+    with open(os.path.join(directory, meta_filename)) as f:
+        return json.load(f)
+
+
+def read_columns(directory, columns=None, rows=None, mmap=True):
+    """
+    Read a folder of binary columns back in as a table.
+
+    Parameters
+    ----------
+    directory : str
+        The folder containing the columns.
+    columns : list
+        The names of the columns to read. Default is all of them.
+    rows : slice
+        The rows to read. Default is all of them. Slices
+        keep memory-mapped columns as zero-copy views.
+    mmap : bool
+        Should the columns be memory-mapped (True) or
+        read completely into memory (False)?
+
+    Returns
+    -------
+    table : Table
+        The table, with the stored meta dictionary as `.meta`.
+    """
+    description = describe_columns(directory)
+    mmap_mode = "r" if mmap else None
+    if columns is None:
+        columns = list(description["columns"])
+    if rows is None:
+        rows = slice(None)
+
+    table = Table(meta=description["meta"])
+    for k in columns:
+        about = description["columns"][k]
+        data = np.load(os.path.join(directory, f"{k}.npy"), mmap_mode=mmap_mode)[rows]
+        if about["masked"]:
+            mask = np.load(
+                os.path.join(directory, f"{k}.mask.npy"), mmap_mode=mmap_mode
+            )[rows]
+            column = MaskedColumn(data, mask=mask, unit=about["unit"], copy=False)
+        else:
+            column = Column(data, unit=about["unit"], copy=False)
+        table.add_column(column, name=k, copy=False)
+    return table
+
+
+def find_rows(directory, column, lower=-np.inf, upper=np.inf):
+    """
+    Find the range of rows where a sorted column falls within limits.
+
+    Only the handful of pages touched by a binary search
+    through the memory-mapped column are read from disk.
+
+    Parameters
+    ----------
+    directory : str
+        The folder containing the columns.
+    column : str
+        The name of the (sorted) column to search.
+    lower, upper : float
+        The inclusive limits.
+
+    Returns
+    -------
+    rows : slice
+        The rows with lower <= column <= upper.
+    """
+    data = np.load(os.path.join(directory, f"{column}.npy"), mmap_mode="r")
+    left = np.searchsorted(data, lower, side="left")
+    right = np.searchsorted(data, upper, side="right")
+    return slice(int(left), int(right))
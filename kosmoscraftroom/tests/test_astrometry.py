@@ -0,0 +1,89 @@
+from kosmoscraftroom.astrometry import *
+from astropy.table import QTable
+from astropy.coordinates import SkyCoord
+import time
+
+
+def make_fake_image(N=200, spread=0.04, shape=(400, 500), seed=0):
+    """
+    Make a fake field of Gaia stars, and a (rotated, mirrored) image of it.
+    """
+    rng = np.random.default_rng(seed)
+    center = SkyCoord(ra=150 * u.deg, dec=20 * u.deg)
+    stars = QTable()
+    stars["ra"] = (
+        150 + rng.uniform(-spread, spread, N) / np.cos(np.radians(20))
+    ) * u.deg
+    stars["dec"] = (20 + rng.uniform(-spread, spread, N)) * u.deg
+    stars["G_gaia_mag"] = rng.uniform(12, 19, N) * u.mag
+    stars.meta["center"] = center
+
+    # a WCS with 0.5"/pixel, rotated by 30 degrees, and mirrored
+    angle = np.radians(30)
+    scale = (0.5 * u.arcsec).to_value(u.deg)
+    truth = WCS(naxis=2)
+    truth.wcs.ctype = ["RA---TAN", "DEC--TAN"]
+    truth.wcs.crval = [150.01, 20.005]
+    truth.wcs.crpix = [200, 150]
+    truth.wcs.cd = scale * np.array(
+        [[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]]
+    )
+
+    # draw the stars as Gaussians, with some noise
+    x, y = truth.world_to_pixel(SkyCoord(ra=stars["ra"], dec=stars["dec"]))
+    yy, xx = np.mgrid[: shape[0], : shape[1]]
+    image = rng.normal(100, 3, shape)
+    flux = 10 ** (-0.4 * (stars["G_gaia_mag"].to_value("mag") - 19)) * 200
+    inside = (x > -5) & (x < shape[1] + 5) & (y > -5) & (y < shape[0] + 5)
+    for i in np.nonzero(inside)[0]:
+        image += flux[i] * np.exp(
+            -0.5 * ((xx - x[i]) ** 2 + (yy - y[i]) ** 2) / 1.5**2
+        )
+    return image, stars, truth
+
+
+def test_detect_sources():
+    image, stars, truth = make_fake_image()
+    sources = detect_sources(image)
+    assert len(sources) > 20
+    assert np.all(np.diff(sources["flux"]) <= 0)
+
+
+def test_solve():
+    image, stars, truth = make_fake_image()
+    start = time.time()
+    solution = solve(image, stars)
+    assert time.time() - start < 1
+    assert len(solution.matches) > 10
+    assert solution.rms < 0.2 * u.arcsec
+    assert np.isclose(solution.pixel_scale.to_value(u.arcsec), 0.5, rtol=1e-3)
+
+    # the solved WCS should agree with the truth, across the image
+    x, y = np.array([0, 250, 499]), np.array([0, 200, 399])
+    separation = solution.pixel_to_sky(x, y).separation(truth.pixel_to_world(x, y))
+    assert np.all(separation < 0.5 * u.arcsec)
+
+    # putting the first star on a slit at the image center
+    target = SkyCoord(
+        ra=solution.matches["ra"][0], dec=solution.matches["dec"][0], unit="deg"
+    )
+    offset = solution.offset_to_slit(target, slit=(250, 200))
+    assert np.isclose(offset["dx"], 250 - solution.matches["x"][0], atol=0.3)
+    moved = solution.pixel_to_sky(250, 200).spherical_offsets_by(
+        offset["dra"], offset["ddec"]
+    )
+    assert moved.separation(target) < 0.1 * u.arcsec
+
+    # stars from somewhere else entirely shouldn't give a solution
+    elsewhere = make_fake_image(seed=1)[1]
+    assert solve(image, elsewhere) is None
+
+
+def test_solve_with_scale():
+    # a field much bigger than the image needs a hint about the scale
+    image, stars, truth = make_fake_image(N=600, spread=0.1)
+    solution = solve(image, stars, pixel_scale=0.5 * u.arcsec)
+    assert solution.rms < 0.2 * u.arcsec
+    x, y = np.array([0, 499]), np.array([0, 399])
+    separation = solution.pixel_to_sky(x, y).separation(truth.pixel_to_world(x, y))
+    assert np.all(separation < 0.5 * u.arcsec)
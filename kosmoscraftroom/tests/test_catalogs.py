@@ -1,5 +1,6 @@
 from kosmoscraftroom.catalogs import *
 import os
+import shutil
 
 
 def test_basic_catalog():
@@ -19,3 +20,239 @@ def test_basic_catalog():
 
     # cleanupt
     os.remove("random-tiny-test.tui")
+
+
+def test_remove_duplicates_by_position():
+    # the same star under two names, plus a neighbor that's far enough away
+    names = ["WASP-39", "WASP 39", "neighbor", "WASP-39"]
+    coordinates = SkyCoord(
+        ra=[217.3266, 217.3266 + 0.1 / 3600, 217.3266, 217.3266] * u.deg,
+        dec=[-3.4445, -3.4445, -3.4445 + 10 / 3600, -3.4445] * u.deg,
+    )
+    table = Table(
+        dict(names=names, sky_coordinates=coordinates, G=[12.1, 12.0, 15, 12.2])
+    )
+
+    by_name = TUICatalog("by-name")
+    by_name.from_table(table.copy(), remove_duplicates=False)
+    by_name.remove_duplicates(tolerance=None)
+    assert len(by_name.table) == 3
+
+    by_position = TUICatalog("by-position")
+    by_position.from_table(table.copy(), remove_duplicates=False)
+    by_position.remove_duplicates(tolerance=1 * u.arcsec, keep="brightest")
+    assert sorted(by_position.table["names"]) == ["WASP 39", "neighbor"]
+
+
+def test_spatial_queries():
+    rng = np.random.default_rng(0)
+    N = 1000
+    ra = rng.uniform(0, 360, N)
+    dec = np.degrees(np.arcsin(rng.uniform(-1, 1, N)))
+    coordinates = SkyCoord(ra=ra * u.deg, dec=dec * u.deg)
+    table = Table(dict(names=[f"{i}" for i in range(N)], sky_coordinates=coordinates))
+    big = TUICatalog("random-big-test")
+    big.from_table(table)
+
+    # compare a cone to a brute-force separation calculation
+    center = SkyCoord(ra=10 * u.deg, dec=20 * u.deg)
+    cone = big.cone(center, 30 * u.deg)
+    separation = big.sky_coordinates.separation(center)
+    assert len(cone.table) == np.sum(separation < 30 * u.deg)
+
+    # a box that wraps through RA = 0
+    box = big.box(ra_range=[350, 10] * u.deg, dec_range=[-20, 20] * u.deg)
+    box_ra = box.table["ra"]
+    assert np.all((box_ra >= 350) | (box_ra <= 10))
+    assert len(box.table) == np.sum(
+        ((ra >= 350) | (ra <= 10)) & (dec >= -20) & (dec <= 20)
+    )
+
+    # the nearest targets should come back closest first
+    nearest = big.nearest(center, k=5)
+    assert nearest.table["names"][0] == big.table["names"][np.argmin(separation)]
+
+    # replacing the table should reset the cached index
+    big.from_table(table[:10])
+    assert len(big.spatial_index) == 10
+
+    # an empty catalog should have no nearest targets, rather than crashing
+    empty = TUICatalog("empty")
+    empty.from_table(table[:0])
+    assert len(empty.nearest(center, k=3).table) == 0
+    assert len(empty.cone(center, 10 * u.deg).table) == 0
+
+
+def test_merge():
+    # (a fixed seed, so no random pair lands within the duplicate tolerance)
+    rng = np.random.default_rng(0)
+    catalogs = []
+    for i, category in enumerate(["planets", "standards", "friends"]):
+        ra = rng.uniform(0, 360, 100)
+        ra[0] = 123.0
+        table = Table(
+            dict(
+                names=[f"{category}-{j}" for j in range(100)],
+                sky_coordinates=SkyCoord(ra=ra * u.deg, dec=np.zeros(100) * u.deg),
+            )
+        )
+        if category != "friends":
+            table["G"] = rng.uniform(8, 15, 100)
+        c = TUICatalog(category)
+        c.from_table(table)
+        catalogs.append(c)
+
+    merged = TUICatalog.merge(*catalogs)
+    assert len(merged.table) == 300
+    assert np.all(np.diff(merged._radec()[0]) >= 0)
+    assert set(merged.table["category"]) == {"planets", "standards", "friends"}
+    assert np.sum(merged.table["G"].mask) == 100
+
+    # the shared position at RA=123 should only survive once
+    deduplicated = TUICatalog.merge(*catalogs, remove_duplicates=True)
+    assert len(deduplicated.table) == 298
+    assert "planets-0" in deduplicated.table["names"]
+
+    added = catalogs[0] + catalogs[1] + catalogs[2]
+    assert np.all(added.table["names"] == merged.table["names"])
+
+
+def test_save_and_load():
+    rng = np.random.default_rng(0)
+    N = 100
+    ra = rng.uniform(0, 360, N)
+    coordinates = SkyCoord(ra=ra * u.deg, dec=np.zeros(N) * u.deg)
+    table = Table(
+        dict(names=[f"star{i}" for i in range(N)], sky_coordinates=coordinates)
+    )
+    table["G"] = np.ma.masked_array(rng.uniform(8, 15, N), mask=ra > 300)
+    table["distance"] = rng.uniform(10, 100, N) * u.pc
+    original = TUICatalog("random-save-test")
+    original.from_table(table)
+    original.save("random-save-test.catalog")
+
+    # everything should come back the same
+    reloaded = TUICatalog.load("random-save-test.catalog")
+    assert reloaded.name == original.name
+    assert np.all(reloaded.table["names"] == original.table["names"])
+    assert np.allclose(reloaded._radec()[0], original._radec()[0])
+    assert np.all(reloaded.table["G"].mask == original.table["G"].mask)
+    assert reloaded.table["distance"].unit == u.pc
+
+    # a subset of columns and a wrapping range of RA
+    subset = TUICatalog.load(
+        "random-save-test.catalog", columns=["G"], ra_range=[350, 10] * u.deg
+    )
+    assert subset.table.colnames == ["names", "ra", "dec", "G"]
+    assert len(subset.table) == np.sum((ra >= 350) | (ra <= 10))
+
+    # a full circle of RA (however it's written) should load everything
+    for ra_range in [[0, 360], [10, 370], [-180, 180]]:
+        everything = TUICatalog.load(
+            "random-save-test.catalog", ra_range=ra_range * u.deg
+        )
+        assert len(everything.table) == len(original.table)
+
+    # a range past 360 should wrap around
+    wrapped = TUICatalog.load("random-save-test.catalog", ra_range=[350, 370] * u.deg)
+    assert len(wrapped.table) == np.sum((ra >= 350) | (ra <= 10))
+
+    shutil.rmtree("random-save-test.catalog")
+
+
+def test_where():
+    rng = np.random.default_rng(0)
+    N = 200
+    table = Table(
+        dict(
+            names=[f"star{i}" for i in range(N)],
+            ra=rng.uniform(0, 360, N) * u.deg,
+            dec=rng.uniform(-90, 90, N) * u.deg,
+            G=rng.uniform(5, 15, N),
+            distance=rng.uniform(5, 300, N) * u.pc,
+        )
+    )
+    everything = TUICatalog("random-where-test")
+    everything.from_table(table)
+
+    # the selection should be a view, matching a brute-force mask
+    some = everything.where(col.G < 12, col.distance < 100 * u.pc, col.dec > -20)
+    t = everything.table
+    expected = (t["G"] < 12) & (t["distance"] < 100) & (t["dec"] > -20)
+    assert len(some) == np.sum(expected)
+    assert some._rows is not None
+
+    # criteria can be combined, chained, sorted, and exported
+    fewer = some.where((col.G < 8) | ~(col.distance > 50 * u.pc)).sort()
+    assert np.all(np.diff(fewer._radec()[0]) >= 0)
+    assert np.all((fewer.table["G"] < 8) | (fewer.table["distance"] <= 50))
+    fewer.to_TUI()
+    os.remove("random-where-test.tui")
+
+
+def test_exoatlas_cache(tmp_path, monkeypatch):
+    import kosmoscraftroom.catalogs
+
+    monkeypatch.setattr(kosmoscraftroom.catalogs, "cache_directory", str(tmp_path))
+
+    # a local file can stand in for an exoatlas population
+    standard = Table(
+        dict(
+            hostname=["WASP-39", "GJ 1214", "GJ 1214"],
+            ra=[217.3266, 258.8289, 258.8289] * u.deg,
+            dec=[-3.4445, 4.9639, 4.9639] * u.deg,
+            gaiamag=[11.9, 13.0, 13.0],
+            distance=[213.0, 14.6, 14.6] * u.pc,
+        )
+    )
+    filename = str(tmp_path / "fake-population.ecsv")
+    standard.write(filename)
+
+    # count how many times the (expensive) population gets built
+    built = []
+
+    def make_population():
+        class FakePopulation:
+            pass
+
+        built.append(1)
+        pop = FakePopulation()
+        pop.standard = Table.read(filename)
+        return pop
+
+    first = TUICatalog("planets")
+    first.from_exoatlas(make_population, key="fake-population")
+    second = TUICatalog("more-planets")
+    second.from_exoatlas(make_population, key="fake-population")
+    assert len(built) == 1
+    assert np.all(first.table["names"] == second.table["names"])
+    assert set(second.table["category"]) == {"more-planets"}
+
+    # without a key, functions can't be told apart, so they aren't cached
+    TUICatalog("planets").from_exoatlas(make_population)
+    TUICatalog("planets").from_exoatlas(make_population)
+    assert len(built) == 3
+
+    # different populations with the same label and length shouldn't collide
+    populations = []
+    for names in [["A", "B"], ["C", "D"]]:
+        pop = make_population()
+        pop.label = "subset"
+        pop.standard = pop.standard[:2]
+        pop.standard["hostname"] = names
+        populations.append(pop)
+    subsets = [TUICatalog("subset") for pop in populations]
+    for catalog, pop in zip(subsets, populations):
+        catalog.from_exoatlas(pop)
+    assert list(subsets[0].table["names"]) == ["A", "B"]
+    assert list(subsets[1].table["names"]) == ["C", "D"]
+
+    # but the same population again should come from the cache
+    again = TUICatalog("subset")
+    again.from_exoatlas(populations[1])
+    assert list(again.table["names"]) == ["C", "D"]
+    assert not hasattr(again, "_exoatlas_pop")
+
+    offline = TUICatalog("offline")
+    offline.from_exoatlas(filename, cache=False)
+    assert len(offline) == 2
@@ -0,0 +1,72 @@
+from kosmoscraftroom.comparisons import *
+from kosmoscraftroom.gaia import GaiaStore, LocalGaiaSource
+from astropy.table import QTable
+
+
+def make_field(ra=150.0, dec=20.0, N=300, seed=0):
+    """
+    Make a fake Gaia field, with a target and one ideal comparison star.
+    """
+    rng = np.random.default_rng(seed)
+    stars = QTable()
+    stars["source_id"] = np.arange(N)
+    stars["ra"] = (ra + rng.uniform(-0.1, 0.1, N)) * u.deg
+    stars["dec"] = (dec + rng.uniform(-0.1, 0.1, N)) * u.deg
+    stars["pmra"] = np.zeros(N) * u.mas / u.year
+    stars["pmdec"] = np.zeros(N) * u.mas / u.year
+    stars["G_gaia_mag"] = rng.uniform(16, 20, N) * u.mag
+    stars["BP_gaia_mag"] = stars["G_gaia_mag"] + 0.5 * u.mag
+    stars["RP_gaia_mag"] = stars["G_gaia_mag"] - 0.5 * u.mag
+
+    # the target, and a comparison 2' due north with nearly the same magnitude
+    stars["ra"][0], stars["dec"][0] = ra * u.deg, dec * u.deg
+    stars["ra"][1], stars["dec"][1] = ra * u.deg, (dec + 2 / 60) * u.deg
+    for k, m in zip(["G", "BP", "RP"], [12.0, 12.5, 11.5]):
+        stars[f"{k}_gaia_mag"][0] = m * u.mag
+        stars[f"{k}_gaia_mag"][1] = (m + 0.1) * u.mag
+    stars.meta["epoch"] = 2016.0
+    return stars
+
+
+def test_rank_comparisons():
+    stars = make_field()
+    candidates = rank_comparisons(stars, 150.0, 20.0)
+    assert candidates["source_id"][0] == 1
+    assert np.isclose(candidates["separation"][0], 120, atol=0.1)
+    assert np.isclose(candidates["dec"][0], 20 + 1 / 60)
+    assert np.isclose(np.abs(candidates["rotator_angle"][0]), 90)
+
+    # the slit should line up the same way as finder's slit_alignment
+    from kosmoscraftroom.finder import slit_alignment
+
+    stars["ra"][1] = (150.0 + 1 / 60) * u.deg
+    best = rank_comparisons(stars, 150.0, 20.0)[0]
+    center, rotation, scatter = slit_alignment(stars["ra"][:2], stars["dec"][:2])
+    assert np.isclose(best["rotator_angle"], rotation.to_value(u.deg))
+    assert np.isclose(best["ra"], center.ra.deg) and np.isclose(
+        best["dec"], center.dec.deg
+    )
+
+    # no target in Gaia should give no comparisons
+    assert len(rank_comparisons(stars, 10.0, 20.0)) == 0
+
+
+def test_find_comparison_stars(tmp_path):
+    filename = str(tmp_path / "stars.ecsv")
+    make_field().write(filename)
+    store = GaiaStore(
+        directory=str(tmp_path / "gaia"), nside=64, remote=LocalGaiaSource(filename)
+    )
+    targets = TUICatalog("targets")
+    targets.from_table(
+        Table(dict(names=["target", "nothing"], ra=[150.0, 150.05], dec=[20.0, 19.95]))
+    )
+    pointings = find_comparison_stars(targets, epoch=2016.0, store=store, max_workers=1)
+    assert list(pointings.table["names"]) == ["target"]
+    assert pointings.table["comparison_source_id"][0] == 1
+
+    # the TUI catalog should include the slit rotation
+    pointings.name = str(tmp_path / "pointings")
+    pointings.to_TUI()
+    with open(f"{pointings.name}.tui") as f:
+        assert "RotType=Object; RotAng=" in f.read()
@@ -0,0 +1,75 @@
+from kosmoscraftroom.cosmics import *
+
+
+def make_fake_scene(shape=(200, 150), N=20, seed=0):
+    """
+    Make a noiseless image of a smooth background and some stars.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[: shape[0], : shape[1]]
+    model = np.full(shape, 100.0)
+    sigma = 1.5
+    for x0, y0, flux in zip(
+        rng.uniform(0, shape[1], N),
+        rng.uniform(0, shape[0], N),
+        rng.uniform(1e3, 5e4, N),
+    ):
+        model += (
+            flux
+            / (2 * np.pi * sigma**2)
+            * np.exp(-0.5 * ((x - x0) ** 2 + (y - y0) ** 2) / sigma**2)
+        )
+    return model
+
+
+def add_noise_and_cosmics(model, N=50, seed=0):
+    rng = np.random.default_rng(seed)
+    image = rng.poisson(model) + rng.normal(0, 5, model.shape)
+    truth = np.zeros(model.shape, dtype=bool)
+    y = rng.integers(5, model.shape[0] - 5, N)
+    x = rng.integers(5, model.shape[1] - 5, N)
+    image[y, x] += rng.uniform(300, 3000, N)
+    truth[y, x] = True
+    return image, truth
+
+
+def test_laplacian_plus():
+    # compare to the original recipe, with a subsampled image
+    image = np.random.default_rng(0).normal(0, 1, (20, 30))
+    subsampled = np.repeat(np.repeat(image, 2, axis=0), 2, axis=1)
+    kernel = np.array([[0, -1, 0], [-1, 4, -1], [0, -1, 0]])
+    convolved = ndimage.convolve(subsampled, kernel, mode="nearest").clip(0, None)
+    binned = convolved.reshape(20, 2, 30, 2).mean(axis=(1, 3))
+    assert np.allclose(laplacian_plus(image), binned)
+
+
+def test_clean_cosmics():
+    model = make_fake_scene()
+    image, truth = add_noise_and_cosmics(model)
+    cleaned, mask = clean_cosmics(image, chunk_rows=64)
+
+    # cosmic rays should be found, but stars should be left alone
+    assert np.mean(mask[truth]) > 0.95
+    neighbors = ndimage.binary_dilation(truth, np.ones((3, 3), dtype=bool))
+    assert np.sum(mask & (model > 300) & ~neighbors) == 0
+    assert np.std((cleaned - model)[truth]) < 5 * np.sqrt(np.median(model))
+
+    # the chunk size (and threading) shouldn't change the answer
+    same_cleaned, same_mask = clean_cosmics(image, chunk_rows=1000, max_workers=1)
+    assert np.array_equal(mask, same_mask)
+    assert np.allclose(cleaned, same_cleaned)
+
+
+def test_clean_stack():
+    model = make_fake_scene()
+    cube, truth = [], []
+    for i in range(15):
+        # let the transparency change a bit
+        image, t = add_noise_and_cosmics(model * (1 - 0.02 * i), N=10, seed=i)
+        cube.append(image)
+        truth.append(t)
+    cube, truth = np.array(cube), np.array(truth)
+    cleaned, mask = clean_stack(cube, chunk_rows=64)
+    assert np.mean(mask[truth]) > 0.95
+    assert np.sum(mask & ~truth) < 0.0001 * mask.size
+    assert not np.any(mask & ~truth & (model > 300))
@@ -0,0 +1,211 @@
+from kosmoscraftroom.finder import *
+from kosmoscraftroom.gaia import GaiaStore, LocalGaiaSource
+from kosmoscraftroom.catalogs import TUICatalog
+from astropy.table import Table
+import os
+
+
+def make_fake_stars(N=100, seed=42):
+    """
+    Make a fake table of Gaia stars, so we don't need the internet.
+    """
+    rng = np.random.default_rng(seed)
+    stars = QTable()
+    stars["ra"] = rng.normal(100, 0.05, N) * u.deg
+    stars["dec"] = rng.normal(30, 0.05, N) * u.deg
+    stars["pmra"] = np.ma.masked_array(rng.normal(0, 50, N), mask=rng.random(N) < 0.1)
+    stars["pmra"].unit = u.mas / u.year
+    stars["pmdec"] = rng.normal(0, 50, N) * u.mas / u.year
+    stars["G_gaia_mag"] = rng.uniform(8, 20, N) * u.mag
+    stars["BP_gaia_mag"] = stars["G_gaia_mag"] + 0.4 * u.mag
+    stars["RP_gaia_mag"] = stars["G_gaia_mag"] - 0.4 * u.mag
+    stars.meta["center"] = SkyCoord(ra=100 * u.deg, dec=30 * u.deg)
+    stars.meta["radius"] = 6 * u.arcmin
+    stars.meta["epoch"] = 2016.0
+    return stars
+
+
+def test_propagate_proper_motions():
+    stars = make_fake_stars()
+
+    # one epoch should share everything but the coordinates
+    later = propagate_proper_motions(stars, epoch=2026.0)
+    assert np.shares_memory(later["G_gaia_mag"], stars["G_gaia_mag"])
+    assert not np.shares_memory(later["ra"], stars["ra"])
+    assert stars.meta["epoch"] == 2016.0
+    ddec = (later["dec"] - stars["dec"]).to_value(u.mas)
+    assert np.allclose(ddec, 10 * stars["pmdec"].to_value(u.mas / u.year))
+
+    # many epochs should give a (stars x epochs) array of positions
+    epochs = np.linspace(2016, 2036, 5)
+    animated = propagate_proper_motions(stars, epoch=epochs, verbose=False)
+    assert animated["ra"].shape == (len(stars), len(epochs))
+    assert np.allclose(animated["dec"][:, 2], later["dec"])
+
+
+def test_gaia_store(tmp_path):
+    stars = make_fake_stars(N=1000)
+    stars["source_id"] = np.arange(len(stars))
+    stars.meta.pop("center")
+    stars.meta.pop("radius")
+    filename = str(tmp_path / "stars.ecsv")
+    stars.write(filename)
+
+    # count how often the "remote" archive gets asked
+    source = LocalGaiaSource(filename)
+    calls = []
+
+    def remote(center, radius):
+        calls.append(radius)
+        return source(center, radius)
+
+    store = GaiaStore(directory=str(tmp_path / "gaia"), nside=64, remote=remote)
+    center = SkyCoord(ra=100.02 * u.deg, dec=30.01 * u.deg)
+    radius = 3 * u.arcmin
+    nearby = store.query(center, radius)
+
+    # compare to a brute-force search
+    distance = center.separation(SkyCoord(ra=stars["ra"], dec=stars["dec"]))
+    expected = stars["source_id"][distance < radius]
+    assert set(nearby["source_id"]) == set(expected)
+    assert np.all(nearby["distance_from_center"] < radius)
+    assert np.sum(nearby["pmra"].mask) == np.sum(stars["pmra"].mask[distance < radius])
+    assert nearby.meta["epoch"] == 2016.0
+    assert len(calls) == 1
+
+    # a second (overlapping) query should come entirely from disk
+    again = store.query(center, radius * 0.5)
+    assert len(calls) == 1
+    assert set(again["source_id"]) <= set(nearby["source_id"])
+    assert len(GaiaStore(directory=str(tmp_path / "gaia"), nside=64).tiles()) > 0
+
+
+def test_gaia_store_row_limit(tmp_path):
+    stars = make_fake_stars(N=3000)
+    stars["source_id"] = np.arange(len(stars))
+    stars.meta.pop("center")
+    stars.meta.pop("radius")
+    filename = str(tmp_path / "stars.ecsv")
+    stars.write(filename)
+
+    # a "remote" archive that quietly truncates big searches, like Gaia does
+    source = LocalGaiaSource(filename)
+    row_limit = 200
+    calls = []
+
+    def remote(center, radius):
+        calls.append(radius)
+        return source(center, radius)[:row_limit]
+
+    store = GaiaStore(directory=str(tmp_path / "gaia"), nside=64, remote=remote)
+    store.row_limit = row_limit
+    center = SkyCoord(ra=100.0 * u.deg, dec=30.0 * u.deg)
+    radius = 6 * u.arcmin
+    nearby = store.query(center, radius)
+
+    # the searches should have been split up until none were truncated
+    assert len(calls) > 1
+    distance = center.separation(SkyCoord(ra=stars["ra"], dec=stars["dec"]))
+    expected = stars["source_id"][distance < radius]
+    assert len(expected) > row_limit
+    assert sorted(nearby["source_id"]) == sorted(expected)
+
+
+def test_finder_chart():
+    stars = make_fake_stars(N=2000)
+    fig, ax = plt.subplots()
+    chart = FinderChart(stars, ax=ax, faintest_magnitude_to_label=18)
+
+    # one scatter for all stars (plus one for highlights), and a fixed pool of labels
+    assert len(ax.collections) == 2
+    assert len(ax.texts) == chart.max_labels
+    assert 0 < len(chart.labeled) <= chart.max_labels
+    assert np.all(np.diff(chart.mag[chart.labeled]) >= 0)
+
+    # zooming in should only label stars inside the view
+    ax.set_xlim(0.5, -0.5)
+    ax.set_ylim(-0.5, 0.5)
+    assert np.all(np.abs(chart.x[chart.labeled]) <= 0.5)
+    assert np.all(np.abs(chart.y[chart.labeled]) <= 0.5)
+    assert len(ax.texts) == chart.max_labels
+    plt.close(fig)
+
+
+def test_slit_alignment():
+    # two stars should match the simple two-star calculation
+    ra, dec = [100.0, 100.01] * u.deg, [30.0, 30.005] * u.deg
+    center, rotation, scatter = slit_alignment(ra, dec)
+    dra = (ra[1] - ra[0]) * np.cos(0.5 * (dec[0] + dec[1]))
+    angle = np.arctan2(dec[1] - dec[0], dra).to("deg")
+    assert np.isclose(rotation.to_value(u.deg), (-angle).to_value(u.deg), atol=1e-3)
+    assert np.isclose(center.ra.deg, 100.005) and np.isclose(center.dec.deg, 30.0025)
+
+    # more stars along one line should fit it exactly
+    t = np.linspace(-1, 1, 5)
+    center, rotation, scatter = slit_alignment(100 + 0.01 * t, 30 + 0.01 * t)
+    assert scatter < 0.01 * u.arcsec
+
+
+def test_finder_chart_selection():
+    stars = make_fake_stars(N=5000)
+    fig, ax = plt.subplots()
+    chart = FinderChart(stars, ax=ax)
+    fig.canvas.draw()
+
+    # clicking right on a star should find it, and far away nothing
+    assert chart.find_star(chart.x[123], chart.y[123]) == 123
+    assert chart.find_star(100.0, 100.0) is None
+
+    # selections should reuse the same highlight collection
+    for i in [1, 2, 3]:
+        chart.toggle(i)
+    chart.toggle(2)
+    assert chart.selected == [1, 3]
+    assert len(chart.highlight.get_offsets()) == 2
+    assert len(ax.collections) == 2
+    assert "center-of-two-stars" in chart.describe_selection()
+    chart.toggle(2)
+    assert "center-of-3-stars" in chart.describe_selection()
+    plt.close(fig)
+
+
+def test_make_finder_charts(tmp_path):
+    stars = make_fake_stars(N=2000)
+    stars["source_id"] = np.arange(len(stars))
+    stars.meta.pop("center")
+    stars.meta.pop("radius")
+    filename = str(tmp_path / "stars.ecsv")
+    stars.write(filename)
+    calls = []
+    source = LocalGaiaSource(filename)
+
+    def remote(center, radius):
+        calls.append(radius)
+        return source(center, radius)
+
+    store = GaiaStore(directory=str(tmp_path / "gaia"), nside=64, remote=remote)
+
+    # two targets that share a field, and one off on its own
+    catalog = TUICatalog("test")
+    catalog.from_table(
+        Table(
+            dict(
+                names=["A", "B", "C"],
+                ra=[100.0, 100.02, 100.5],
+                dec=[30.0, 30.01, 30.5],
+            )
+        ),
+        sort=False,
+    )
+    directory = str(tmp_path / "charts")
+    index = make_finder_charts(
+        catalog, directory, epoch=2024.0, store=store, max_workers=1, formats=["png"]
+    )
+    assert len(index) == 3
+    assert index["group"][0] == index["group"][1] != index["group"][2]
+    assert len(calls) == 2
+    for row in index:
+        assert os.path.exists(os.path.join(directory, row["png"]))
+        neighbors = Table.read(os.path.join(directory, row["table"]))
+        assert neighbors.meta["epoch"] == 2024.0
+    assert os.path.exists(os.path.join(directory, "index.ecsv"))
@@ -0,0 +1,52 @@
+import sys
+import subprocess
+
+# how long (in seconds) headless tools are allowed to take to import
+import_budget = 0.5
+
+# heavy dependencies that headless tools shouldn't need
+heavy_modules = [
+    "matplotlib",
+    "ipywidgets",
+    "IPython",
+    "thefriendlystars",
+    "astroquery",
+]
+
+
+def time_import(statement):
+    """
+    Time an import in a fresh python, and list which heavy modules it loaded.
+    """
+    code = f"""
+import sys, time
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start)
+print(",".join(m for m in {heavy_modules!r} if m in sys.modules))
+"""
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout.split("\n")
+    return float(output[0]), [m for m in output[1].split(",") if m != ""]
+
+
+def test_lazy_package():
+    seconds, loaded = time_import("import kosmoscraftroom")
+    assert loaded == []
+
+    seconds, loaded = time_import(
+        "import kosmoscraftroom; kosmoscraftroom.ScriptWriter"
+    )
+    assert loaded == []
+
+
+def test_headless_import_budget():
+    for statement in [
+        "from kosmoscraftroom.scripts import ScriptWriter",
+        "from kosmoscraftroom.timing import ScriptTimer",
+    ]:
+        # take the fastest of a few tries, to ignore a busy machine
+        results = [time_import(statement) for i in range(3)]
+        assert min(seconds for seconds, _ in results) < import_budget
+        assert results[0][1] == []
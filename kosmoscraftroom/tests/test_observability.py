@@ -0,0 +1,39 @@
+import pytest
+from kosmoscraftroom.catalogs import *
+from kosmoscraftroom.observability import *
+
+
+def test_observability():
+    names = ["A", "B", "C", "D"]
+    coordinates = SkyCoord(
+        ra=[15, 18, 6, 21] * u.hourangle, dec=[30, -60, 0, 80] * u.deg
+    )
+    table = Table(dict(names=names, sky_coordinates=coordinates))
+    tiny = TUICatalog("random-tiny-test")
+    tiny.from_table(table)
+
+    night = Night("2023-06-13", cadence=20 * u.minute)
+    o = Observability(tiny, night)
+    assert o.altitude.shape == (4, len(night))
+
+    # compare to a direct (slow) astropy transformation
+    frame = AltAz(obstime=night.times[np.newaxis, :], location=apo, pressure=0)
+    direct = tiny.sky_coordinates[:, np.newaxis].transform_to(frame)
+    assert np.all(np.abs(direct.alt.deg - o.altitude) < 1 / 60)
+
+    # a far-southern target should never get to a good airmass from APO
+    assert np.isfinite(o.airmass).any()
+    observable = o.filter(max_airmass=2, min_duration=1 * u.hour)
+    assert "B" not in observable.table["names"]
+    assert "A" in observable.table["names"]
+
+    # re-used time grids should share cached rotations
+    again = Night("2023-06-13", cadence=20 * u.minute)
+    assert again.rotations is night.rotations
+
+
+def test_night_without_darkness():
+    # the Sun never sets in the Arctic summer
+    arctic = EarthLocation.from_geodetic(lon=15 * u.deg, lat=78 * u.deg)
+    with pytest.raises(ValueError):
+        Night("2023-06-13", location=arctic)
@@ -0,0 +1,64 @@
+import pytest
+from kosmoscraftroom.psf import *
+from kosmoscraftroom.scripts import ScriptWriter
+
+
+def test_fit_profiles():
+    rng = np.random.default_rng(0)
+    N, x = 2000, np.arange(40)
+    center = rng.uniform(15, 25, N)
+    fwhm = rng.uniform(3, 8, N)
+    sigma = fwhm / gaussian_fwhm_per_sigma
+    amplitude = rng.uniform(100, 1000, N)
+    profiles = (
+        amplitude[:, np.newaxis]
+        * np.exp(-0.5 * (x - center[:, np.newaxis]) ** 2 / sigma[:, np.newaxis] ** 2)
+        + 10
+        + rng.normal(0, 1, (N, len(x)))
+    )
+    profiles[0, 3] = np.nan
+
+    results = fit_profiles(profiles)
+    assert np.mean(results["converged"]) > 0.95
+    assert np.allclose(results["fwhm"], fwhm, rtol=0.05)
+    assert np.allclose(results["x"], center, atol=0.1)
+    assert np.allclose(results["amplitude"], amplitude, rtol=0.05)
+
+    # Moffat profiles should give back their FWHM and beta
+    alpha = fwhm / (2 * np.sqrt(2 ** (1 / 3.0) - 1))
+    r2 = (x - center[:, np.newaxis]) ** 2 / alpha[:, np.newaxis] ** 2
+    profiles = amplitude[:, np.newaxis] * (1 + r2) ** -3.0 + 10
+    profiles += rng.normal(0, 1, (N, len(x)))
+    moffat = fit_profiles(profiles, model="moffat")
+    assert np.mean(moffat["converged"]) > 0.95
+    assert np.median(np.abs(moffat["fwhm"] / fwhm - 1)) < 0.01
+    assert np.median(moffat["beta"]) == pytest.approx(3.0, rel=0.05)
+
+
+def test_fit_cutouts():
+    rng = np.random.default_rng(1)
+    image = rng.normal(100, 2, (200, 300))
+    x, y = rng.uniform(20, 280, 50), rng.uniform(20, 180, 50)
+    yy, xx = np.mgrid[:200, :300]
+    for i in range(len(x)):
+        image += 500 * np.exp(-0.5 * ((xx - x[i]) ** 2 + (yy - y[i]) ** 2) / 2.0**2)
+    cutouts, corners = make_cutouts(image, x, y, size=15)
+    assert cutouts.shape == (50, 15, 15)
+
+    results = fit_cutouts(cutouts)
+    assert np.mean(results["converged"]) > 0.9
+    # (a few stars overlap their neighbors, so look at the typical star)
+    error = np.hypot(results["x"] + corners[:, 0] - x, results["y"] + corners[:, 1] - y)
+    assert np.median(error) < 0.05
+    assert np.median(results["fwhm"]) == pytest.approx(
+        2.0 * gaussian_fwhm_per_sigma, rel=0.05
+    )
+
+
+def test_slit_losses():
+    # a slit as wide as the FWHM passes ~76% of the light
+    assert np.isclose(slit_transmission(1.0, 1.0), 0.7610, atol=1e-3)
+    s = ScriptWriter(slits={"7.1-ctr": 1, "1.18-ctr": 2})
+    losses = s.estimate_slit_losses([4, 4.2, 3.8], pixel_scale=0.3 * u.arcsec)
+    assert losses["7.1-ctr"] < 1e-6
+    assert np.isclose(losses["1.18-ctr"], 1 - slit_transmission(1.2, 1.18))
@@ -0,0 +1,67 @@
+from kosmoscraftroom.reader import *
+from astropy.io import fits
+import numpy as np
+
+
+def make_fake_frame(filename, seed=0, shape=(400, 300)):
+    """
+    Write an unsigned 16-bit image, with an overscan strip.
+    """
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 65536, shape, dtype=np.uint16)
+    hdu = fits.PrimaryHDU(image)
+    hdu.header["BIASSEC"] = f"[{shape[1] - 19}:{shape[1]},1:{shape[0]}]"
+    hdu.writeto(filename)
+    return image
+
+
+def test_parse_section():
+    rows, columns = parse_section("[2049:2080,1:4096]")
+    assert columns == slice(2048, 2080)
+    assert rows == slice(0, 4096)
+
+
+def test_fits_reader(tmp_path):
+    filename = str(tmp_path / "frame.fits")
+    image = make_fake_frame(filename)
+
+    with FITSReader(filename) as reader:
+        assert reader.shape == image.shape
+        assert reader.unsigned
+
+        # views should point into the memory-mapped file, without copying
+        view = reader.view(slice(10, 20), slice(5, 50))
+        assert np.shares_memory(view, reader.raw)
+
+        # reads should undo the unsigned integer scaling, only for the region
+        region = reader.read(slice(10, 20), slice(5, 50))
+        assert region.dtype == np.uint16
+        assert np.array_equal(region, image[10:20, 5:50])
+        assert np.array_equal(reader.read(), image)
+        assert np.array_equal(reader.column(7), image[:, 7])
+        assert np.array_equal(reader.row(7, dtype=np.float32), image[7])
+        assert np.array_equal(reader.band(100, 10), image[95:105])
+        assert np.array_equal(reader.band(100, 10, axis=1), image[:, 95:105])
+        assert np.array_equal(reader.overscan(), image[:, -20:])
+
+        # many regions should come back in order
+        regions = [(slice(i, i + 5), slice(None)) for i in range(0, 400, 50)]
+        for r, data in zip(regions, reader.read_many(regions)):
+            assert np.array_equal(data, image[r])
+
+
+def test_read_regions(tmp_path):
+    filenames = [str(tmp_path / f"frame-{i}.fits") for i in range(5)]
+    images = [make_fake_frame(f, seed=i) for i, f in enumerate(filenames)]
+    columns = read_regions(filenames, columns=42, dtype=np.float32)
+    for image, column in zip(images, columns):
+        assert np.array_equal(column, image[:, 42])
+
+    # scaled floating point data should be scaled
+    filename = str(tmp_path / "scaled.fits")
+    hdu = fits.PrimaryHDU(np.arange(12, dtype=np.int16).reshape(3, 4))
+    hdu.header["BSCALE"] = 2.0
+    hdu.header["BZERO"] = 10.0
+    hdu.writeto(filename)
+    with FITSReader(filename) as reader:
+        assert np.allclose(reader.read(), 2 * np.arange(12).reshape(3, 4) + 10)
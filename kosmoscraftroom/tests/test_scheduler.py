@@ -0,0 +1,55 @@
+from kosmoscraftroom.catalogs import *
+from kosmoscraftroom.observability import Night
+from kosmoscraftroom.scheduler import *
+import os
+
+
+def make_scheduler(N=50):
+    """
+    Make a scheduler for some random targets.
+    """
+    rng = np.random.default_rng(0)
+    ra = rng.uniform(0, 360, N)
+    dec = rng.uniform(-10, 60, N)
+    coordinates = SkyCoord(ra=ra * u.deg, dec=dec * u.deg)
+    table = Table(
+        dict(names=[f"star{i}" for i in range(N)], sky_coordinates=coordinates)
+    )
+    targets = TUICatalog("random-schedule-test")
+    targets.from_table(table)
+
+    night = Night("2023-06-13", cadence=10 * u.minute)
+    return Scheduler(targets, 20 * u.minute, night=night, max_airmass=2)
+
+
+def test_schedule():
+    s = make_scheduler()
+    schedule = s.schedule(max_seconds=1)
+    assert len(schedule) > 0
+
+    # every observation should be in order, and at acceptable airmass
+    assert np.all(schedule.ends[:-1] <= schedule.starts[1:])
+    assert np.all(schedule.airmass < 2)
+
+    schedule.to_TUI(name="random-schedule-test")
+    os.remove("random-schedule-test.tui")
+
+
+def test_improve_edges():
+    s = make_scheduler()
+
+    # 2-opt should be able to reverse a stretch that ends the sequence
+    order = s.greedy()
+    pairs = [(a, b) for a, b in zip(order[:-1], order[1:])]
+    for a, b in pairs:
+        forward, reverse = s.simulate([a, b]), s.simulate([b, a])
+        if len(forward[0]) == len(reverse[0]) == 2 and reverse[2][-1] < forward[2][-1]:
+            break
+    else:
+        assert False, "no pair finishes sooner in reverse"
+    assert s.improve([a, b]) == [b, a]
+
+    # a night with no good times at all shouldn't break anything
+    s.good = s.good[:, :0]
+    s._find_runs()
+    assert np.all(np.isinf(s.earliest_start([0, 1], 0.0)))
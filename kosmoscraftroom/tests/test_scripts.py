@@ -10,3 +10,39 @@ def test_basic_calibration_script():
     s.take_bias(n=5)
     s.print()
     s.copy()
+
+
+def test_planned_calibration_script():
+    s = ScriptWriter(planning=True)
+    s.take_bias(n=5)
+    for lamp in ["neon", "argon", "krypton"]:
+        s.take_lamps(lamp, n=3)
+    s.take_lamps("quartz", n=10)
+    s.take_bias(n=5)
+
+    # the queued calibrations haven't been written yet
+    assert not any("kosmosExpose" in line for line in s.lines)
+
+    # the planned order should take less time than lamp order
+    timer = s.timer()
+    lamp_order = timer.duration(s.plan_lines(s.plan_steps("lamp")))
+    config_order = timer.duration(s.plan_lines(s.plan_steps("config")))
+    assert config_order < lamp_order
+    savings = s.write_plan()
+    assert savings > 0
+    assert abs(savings - (lamp_order - config_order)) < 1
+
+    # every exposure should appear exactly once, biases first
+    exposures = [line for line in s.lines if "kosmosExpose" in line]
+    assert len(exposures) == 2 + 4 * len(s.slits) * len(s.dispersers)
+    assert "bias" in exposures[0] and "bias" in exposures[1]
+    for lamp in ["neon", "argon", "krypton", "quartz"]:
+        for slit in s.slits:
+            for disperser in s.dispersers:
+                name = f"{disperser}-{slit}-{lamp}"
+                assert sum(f'/{name}"' in line for line in exposures) == 1
+
+    # each configuration should only be set once
+    moves = [line for line in s.lines if line.startswith("kosmos set slit=")]
+    assert len(moves) == len(s.slits) * len(s.dispersers)
+    assert s.queue == []
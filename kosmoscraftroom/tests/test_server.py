@@ -0,0 +1,62 @@
+from kosmoscraftroom.server import *
+from kosmoscraftroom.gaia import GaiaStore, LocalGaiaSource
+from kosmoscraftroom.tests.test_finder import make_fake_stars
+import pytest
+
+
+def test_quicklook_server(tmp_path):
+    # set up a store that doesn't need the internet
+    stars = make_fake_stars(N=1000)
+    stars.meta.pop("center")
+    stars.meta.pop("radius")
+    filename = str(tmp_path / "stars.ecsv")
+    stars.write(filename)
+    store = GaiaStore(
+        directory=str(tmp_path / "gaia"), nside=64, remote=LocalGaiaSource(filename)
+    )
+    store.names["somewhere"] = [100.0, 30.0]
+
+    # make an image to look at
+    image = np.random.default_rng(0).normal(0, 1, (300, 200))
+    image_filename = str(tmp_path / "image.npy")
+    np.save(image_filename, image)
+
+    server = QuicklookServer(str(tmp_path / "quicklook.sock"), store=store)
+    server.start(background=True)
+    try:
+        with QuicklookClient(server.address) as client:
+            assert client.ping()["pid"] == os.getpid()
+            assert "thumbnail" in client.request("actions")
+
+            # thumbnails should come back as PNGs, and the image should stay warm
+            thumbnail = client.thumbnail(image_filename, size=100)
+            assert thumbnail["shape"] == [100, 66]
+            assert base64.b64decode(thumbnail["png"]).startswith(b"\x89PNG")
+            assert client.ping()["images"] == 1
+            output = str(tmp_path / "thumbnail.png")
+            client.thumbnail(image_filename, size=50, output=output)
+            assert os.path.exists(output)
+
+            # finders should find the fake stars (and draw a chart)
+            chart = str(tmp_path / "finder.png")
+            field = client.finder("somewhere", radius=3.0, epoch=2016.0, output=chart)
+            assert field["N"] > 0
+            assert np.isclose(field["ra"], 100.0)
+            assert os.path.exists(chart)
+
+            # scripts should be timed
+            timing = client.time_script(
+                ["kosmos set rowBin=2 colBin=2", 'kosmosExpose bias n=2 name="x"']
+            )
+            assert len(timing["timeline"]) == 2
+            assert timing["total"] == timing["timeline"][-1]["end"]
+
+            # errors should be reported, without breaking the connection
+            with pytest.raises(RuntimeError):
+                client.request("nonsense")
+            with pytest.raises(RuntimeError):
+                client.thumbnail(str(tmp_path / "missing.npy"))
+            assert client.ping()["images"] == 1
+    finally:
+        server.stop()
+    assert not os.path.exists(str(tmp_path / "quicklook.sock"))
@@ -0,0 +1,69 @@
+from kosmoscraftroom.sky import *
+from kosmoscraftroom.sky import _fit_patterns, _solve, _design_matrix
+
+
+def make_fake_spectrum(Nd=300, Ns=100, seed=0):
+    """
+    Make a fake 2D spectrum, with a curved sky and a target along the slit.
+    """
+    rng = np.random.default_rng(seed)
+    s = np.linspace(-1, 1, Ns)
+    sky = (
+        rng.uniform(50, 500, Nd)[:, np.newaxis]
+        + rng.normal(0, 20, Nd)[:, np.newaxis] * s
+        + rng.normal(0, 10, Nd)[:, np.newaxis] * s**2
+    )
+    target = 1000 * np.exp(-0.5 * ((np.arange(Ns) - 40) / 2) ** 2)
+    image = sky + target[np.newaxis, :] + rng.normal(0, 5, (Nd, Ns))
+    return image, sky
+
+
+def test_fit_sky_matches_polyfit():
+    image, sky = make_fake_spectrum()
+    exclude = np.abs(np.arange(image.shape[1]) - 40) < 10
+    model, used = fit_sky(image, exclude=exclude, order=2, iterations=0)
+
+    # compare to fitting every column separately
+    x = np.linspace(-1, 1, image.shape[1])
+    for i in [0, 17, 299]:
+        p = np.polyfit(x[~exclude], image[i, ~exclude], 2)
+        assert np.allclose(model[i], np.polyval(p, x))
+
+
+def test_fit_sky_clipping():
+    image, sky = make_fake_spectrum()
+    rng = np.random.default_rng(1)
+    ok = rng.random(image.shape) > 0.01
+    image[~ok] = np.nan
+    y, x = rng.integers(0, image.shape[0], 200), rng.integers(0, image.shape[1], 200)
+    image[y, x] += 5000
+
+    # without clipping, cosmic rays should hurt, and with it, they shouldn't
+    exclude = np.abs(np.arange(image.shape[1]) - 40) < 10
+    bad, _ = fit_sky(image, ok=ok, exclude=exclude, iterations=0)
+    model, used = fit_sky(image, ok=ok, exclude=exclude)
+    assert np.std(model - sky) < 2
+    assert np.std(model - sky) < np.std(bad - sky) / 3
+    assert not np.any(used[y, x] & ~exclude[x])
+    assert not np.any(used[:, exclude])
+
+    # the other orientation should give the same answer
+    transposed, _ = fit_sky(image.T, ok=ok.T, exclude=exclude, axis=0)
+    assert np.allclose(transposed.T, model, equal_nan=True)
+
+    # subtracting should leave just the target (and noise)
+    subtracted = subtract_sky(image, ok=ok, exclude=exclude)
+    assert np.abs(np.nanmedian(subtracted[:, ~exclude])) < 1
+
+
+def test_pseudo_inverses_match_normal_equations():
+    image, sky = make_fake_spectrum()
+    used = np.ones(image.shape, dtype=bool)
+    used[::2, 40:50] = False
+    A = _design_matrix(image.shape[1], 3)
+    data = np.where(used, image, 0)
+    from_patterns = _fit_patterns(data, used, A)
+    normal = np.einsum("ns,sp,sq->npq", used, A, A)
+    from_normal = _solve(normal, data @ A, np.sum(used, axis=1))
+    assert np.allclose(from_patterns, from_normal)
+    assert _fit_patterns(data, used, A, max_patterns=1) is None
@@ -0,0 +1,84 @@
+from kosmoscraftroom.stats import *
+from astropy.io import fits
+import matplotlib
+
+matplotlib.use("Agg")
+
+
+def make_fake_frame(seed=0, sky=200.0, shape=(300, 200)):
+    """
+    Make a frame with some sky, a bright target, and a few saturated pixels.
+    """
+    rng = np.random.default_rng(seed)
+    image = rng.normal(sky, 10, shape)
+    image[:, 95:105] += 5000
+    image[0, :5] = 65535
+    return image
+
+
+regions = dict(sky="[1:50,1:300]", target=(slice(None), slice(95, 105)))
+
+
+def test_frame_statistics():
+    image = make_fake_frame()
+    statistics = measure_frame(image, chunk_rows=37, regions=regions)
+
+    # the moments should match numpy's
+    assert statistics["N"] == image.size
+    assert np.isclose(statistics["mean"], np.mean(image))
+    assert np.isclose(statistics["std"], np.std(image, ddof=1))
+    assert statistics["max"] == 65535
+
+    # percentiles should be within a histogram bin
+    width = 65536 / FrameStatistics.histogram_bins
+    assert np.abs(statistics["p50"] - np.median(image)) < width
+    assert np.abs(statistics["p99"] - np.percentile(image, 99)) < width
+
+    # the saturated pixels should be counted
+    assert statistics["saturated_fraction"] == 5 / image.size
+
+    # the regions should be measured on their own
+    assert np.isclose(statistics["sky_mean"], np.mean(image[:, :50]))
+    assert np.abs(statistics["sky_median"] - 200) < width
+    assert statistics["snr"] > 100
+
+    # the chunk size shouldn't matter
+    again = measure_frame(image, chunk_rows=1000, regions=regions)
+    for k in statistics:
+        assert np.isclose(statistics[k], again[k])
+
+
+def test_night_trends(tmp_path):
+    night = NightTrends(regions=regions, chunk_rows=64)
+    night.plot()
+    for i in range(4):
+        filename = str(tmp_path / f"frame-{i}.fits")
+        hdu = fits.PrimaryHDU(
+            make_fake_frame(seed=i, sky=200 + 100 * i).astype(np.uint16)
+        )
+        hdu.header["DATE-OBS"] = f"2026-10-19T0{i}:00:00"
+        hdu.writeto(filename)
+        night.add(filename)
+
+    table = night.table
+    assert len(table) == 4
+    assert np.all(np.diff(table["time"]) > 0)
+    assert np.all(np.diff(table["sky_median"]) > 90)
+    assert list(table["name"])[0].endswith("frame-0.fits")
+
+    # the plot should have followed along
+    x, y = night.lines["sky_median"].get_data()
+    assert len(x) == 4
+    assert np.allclose(y, table["sky_median"])
+
+
+def test_night_trends_without_regions():
+    # plotting before any frames shouldn't assume there's a sky region
+    night = NightTrends()
+    night.plot()
+    night.add(make_fake_frame())
+    x, y = night.lines["sky_median"].get_data()
+    assert len(x) == 1
+    assert np.all(np.isnan(y))
+    x, y = night.lines["p50"].get_data()
+    assert np.all(np.isfinite(y))
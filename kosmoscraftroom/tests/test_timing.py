@@ -0,0 +1,51 @@
+from kosmoscraftroom.timing import *
+from kosmoscraftroom.scripts import ScriptWriter
+
+
+def test_parse_line():
+    command, words, keywords = parse_line(
+        'kosmosExpose flat time=1.50 n=3 name="2x2/cals/red-1.18-ctr-neon" seq=nextByDir comment=""'
+    )
+    assert command == "kosmosExpose"
+    assert words == ("flat",)
+    assert dict(keywords)["time"] == "1.50"
+    assert dict(keywords)["name"] == "2x2/cals/red-1.18-ctr-neon"
+    assert parse_line("#a comment") == (None, (), ())
+    assert parse_line("") == (None, (), ())
+
+
+def test_script_timer():
+    timer = ScriptTimer(command_time=0.0)
+    lines = [
+        "kosmos set rowBin=2 colBin=2",
+        "kosmos set slit=1 disperser=6",
+        "kosmos set calstage=in neon=on krypton=off",
+        'kosmosExpose flat time=2.00 n=3 name="x" seq=nextByDir comment=""',
+        "#nothing should change here",
+        "kosmos set slit=1 disperser=6",
+        'kosmosExpose bias n=2 name="y" seq=nextByDir comment=""',
+    ]
+    total, timeline = timer.simulate(lines)
+    expected = [
+        0.0,
+        timer.slit_move_time + timer.disperser_move_time,
+        timer.calstage_move_time + timer.lamp_warmup_time,
+        3 * (2.0 + timer.readout_times["2x2"]),
+        0.0,
+        2 * timer.readout_times["2x2"],
+    ]
+    assert len(timeline) == 6
+    assert list(timeline["line"]) == [0, 1, 2, 3, 5, 6]
+    assert list(timeline["duration"]) == expected
+    assert total == sum(expected)
+    assert timeline["end"][-1] == total
+    assert timer.duration(lines) == total
+
+
+def test_script_writer_duration():
+    s = ScriptWriter()
+    s.take_bias(n=5)
+    s.take_lamps("neon", n=3)
+    total, timeline = s.estimate_duration()
+    assert total > 0
+    assert total == s.timer().duration(s.lines)
@@ -0,0 +1,230 @@
+"""
+Tools for estimating how long a TUI script will take to run.
+
+A script (like the `.lines` of a `ScriptWriter`) is simulated one
+command at a time, keeping track of the state of the instrument
+(binning, slit, disperser, filters, calibration stage, lamps).
+Each `kosmos set ...` costs a move only for mechanisms that
+actually change, turning on a lamp costs a warm-up, and each
+`kosmosExpose ...` costs its exposure time plus a readout for
+every one of its `n` exposures, at the current binning.
+
+Parsed commands are cached, so simulating many variations
+of the same script (for example, to compare alternative
+plans in an optimizer or a scheduler) stays fast.
+"""
+import shlex
+import numpy as np
+from functools import lru_cache
+
+
+@lru_cache(maxsize=4096)
+def parse_line(line):
+    """
+    Split one line of a TUI script into its pieces.
+
+    Parameters
+    ----------
+    line : str
+        A line from a script, like
+        'kosmosExpose flat time=1.00 n=3 name="x" seq=nextByDir'.
+
+    Returns
+    -------
+    command : str
+        The command ("kosmos", "kosmosExpose", ...), or None for
+        blank lines and comments.
+    words : tuple
+        Any words that aren't keyword=value pairs (like "set" or "flat").
+    keywords : tuple
+        The (keyword, value) pairs, as strings.
+    """
+    line = line.strip()
+    if (line == "") or line.startswith("#"):
+        return None, (), ()
+    try:
+        tokens = shlex.split(line)
+    except ValueError:
+        tokens = line.split()
+    words, keywords = [], []
+    for t in tokens[1:]:
+        if "=" in t:
+            k, v = t.split("=", 1)
+            keywords.append((k, v))
+        else:
+            words.append(t)
+    return tokens[0], tuple(words), tuple(keywords)
+
+
+class ScriptTimer:
+    """
+    Estimate the duration of TUI scripts, by simulating them.
+    """
+
+    # rough readout times (in seconds) for each binning
+    readout_times = {"1x1": 40.0, "2x2": 12.0, "3x3": 7.0, "4x4": 5.0}
+
+    # rough overheads (in seconds) for moving things around
+    slit_move_time = 15.0
+    disperser_move_time = 30.0
+    filter_move_time = 20.0
+    calstage_move_time = 10.0
+    lamp_warmup_time = 30.0
+
+    # the time it takes to send and acknowledge any command
+    command_time = 1.0
+
+    # mechanisms that cost time to move, when they change
+    mechanisms = dict(
+        slit="slit_move_time",
+        disperser="disperser_move_time",
+        filter1="filter_move_time",
+        filter2="filter_move_time",
+        calstage="calstage_move_time",
+    )
+
+    def __init__(self, binning="1x1", **overheads):
+        """
+        Set up a timer.
+
+        Parameters
+        ----------
+        binning : str
+            The binning to assume, until the script sets one.
+        **overheads : dict
+            Any of the overheads (like `slit_move_time=10`) or a
+            dictionary of `readout_times`, to override the defaults.
+        """
+        self.binning = binning
+        for k, v in overheads.items():
+            if not hasattr(self, k):
+                raise ValueError(f"Sorry! {k} isn't an overhead ScriptTimer knows.")
+            setattr(self, k, v)
+
+    def __repr__(self):
+        return f"<ScriptTimer, starting at {self.binning} binning>"
+
+    def readout_time(self, binning):
+        """
+        How long does it take to read out the detector?
+
+        Parameters
+        ----------
+        binning : str
+            The binning, like "2x2".
+        """
+        try:
+            return self.readout_times[binning]
+        except KeyError:
+            # scale from unbinned, by the number of pixels
+            x, y = [int(b) for b in binning.split("x")]
+            return self.readout_times["1x1"] / (x * y)
+
+    def _steps(self, lines):
+        """
+        Simulate a script, yielding (index, description, seconds) for each command.
+        """
+        state = dict(binning=self.binning)
+        lamps = {}
+        for i, line in enumerate(lines):
+            command, words, keywords = parse_line(line)
+            if command is None:
+                continue
+            seconds = self.command_time
+            changes = []
+            keywords = dict(keywords)
+
+            if command == "kosmos" and "set" in words:
+                # binning
+                row, col = keywords.pop("rowBin", None), keywords.pop("colBin", None)
+                if (row is not None) or (col is not None):
+                    x, y = state["binning"].split("x")
+                    binning = f"{row or x}x{col or y}"
+                    if binning != state["binning"]:
+                        state["binning"] = binning
+                        changes.append(f"binning={binning}")
+
+                # mechanisms and lamps
+                for k, v in keywords.items():
+                    if k in self.mechanisms:
+                        if state.get(k) != v:
+                            state[k] = v
+                            seconds += getattr(self, self.mechanisms[k])
+                            changes.append(f"{k}={v}")
+                    elif v in ["on", "off"]:
+                        if lamps.get(k) != v:
+                            if v == "on":
+                                seconds += self.lamp_warmup_time
+                            lamps[k] = v
+                            changes.append(f"{k}={v}")
+                description = "set " + (", ".join(changes) or "nothing new")
+
+            elif command == "kosmosExpose":
+                kind = words[0] if len(words) > 0 else "object"
+                exposure_time = (
+                    0.0 if kind == "bias" else float(keywords.get("time", 0))
+                )
+                n = int(keywords.get("n", 1))
+                readout = self.readout_time(state["binning"])
+                seconds += n * (exposure_time + readout)
+                description = (
+                    f"{n}x {kind} ({exposure_time:g}s), {keywords.get('name', '')}"
+                )
+
+            else:
+                description = f"{command} (only counting the command overhead)"
+
+            yield i, description, seconds
+
+    def duration(self, lines):
+        """
+        Estimate the total duration of a script, as quickly as possible.
+
+        Parameters
+        ----------
+        lines : list
+            The lines of the script.
+
+        Returns
+        -------
+        seconds : float
+            The estimated duration.
+        """
+        return sum(seconds for _, _, seconds in self._steps(lines))
+
+    def simulate(self, lines):
+        """
+        Estimate the duration of a script, step by step.
+
+        Parameters
+        ----------
+        lines : list
+            The lines of the script.
+
+        Returns
+        -------
+        total : float
+            The estimated duration, in seconds.
+        timeline : Table
+            One row for each command, with its `line` number,
+            a `description`, and its `start`, `duration`, and
+            `end` (in seconds from the start of the script).
+        """
+        from astropy.table import Table
+
+        steps = list(self._steps(lines))
+        duration = np.array([s for _, _, s in steps], dtype=float)
+        end = np.cumsum(duration)
+        timeline = Table(
+            dict(
+                line=np.array([i for i, _, _ in steps], dtype=int),
+                description=[d for _, d, _ in steps],
+                start=end - duration,
+                duration=duration,
+                end=end,
+            )
+        )
+        for k in ["start", "duration", "end"]:
+            timeline[k].unit = "s"
+        total = float(end[-1]) if len(end) > 0 else 0.0
+        return total, timeline